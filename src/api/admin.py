@@ -0,0 +1,108 @@
+import secrets
+from functools import lru_cache
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+
+from src.llms.maintenance import MaintenanceScheduler, get_maintenance_scheduler
+from src.llms.memory import MemoryManagement
+from src.llms.transfer import compress_chunks, export_lines
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_instrumentation import ALLOW_FULL_SCAN
+from src.utils.profiling import ProfileStore
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when admin routes are enabled and the token matches"""
+    return bool(config.admin_token) and token is not None and secrets.compare_digest(token, config.admin_token)
+
+def require_admin(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Dependency guarding admin routes, they don't exist unless ADMIN_TOKEN is set"""
+    if not config.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@lru_cache(maxsize=None)
+def get_profile_store():
+    """Dependency to get the profile store"""
+    return ProfileStore()
+
+def shard_stats_of(db_config: DatabaseConfig) -> dict:
+    """Counts of one shard, from chat_session so archived sessions are included"""
+    MemoryManagement(db_config=db_config)  # A shard nobody was routed to yet has no tables
+    with db_config.get_connection() as conn:
+        users, sessions, messages = conn.execute(f"""
+            SELECT COUNT(DISTINCT user_id), COUNT(*), COALESCE(SUM(message_count), 0) FROM chat_session -- {ALLOW_FULL_SCAN}
+        """).fetchone()
+    return {"shard": db_config.shard_index, "path": str(db_config.db_path),
+            "users": users, "sessions": sessions, "messages": messages}
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+# Media type and file suffix per export compression
+_EXPORT_FORMATS = {
+    "none": ("application/x-ndjson", ".ndjson"),
+    "gzip": ("application/gzip", ".ndjson.gz"),
+    "zstd": ("application/zstd", ".ndjson.zst"),
+}
+
+@router.get("/profiles")
+async def list_profiles(store: ProfileStore = Depends(get_profile_store)):
+    """
+    List captured request profiles, newest first.
+    """
+    return {"profiles": store.list()}
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = "prof", sort: str = "cumulative", limit: int = 50,
+                           store: ProfileStore = Depends(get_profile_store)):
+    """
+    Download a profile as a .prof file (snakeviz, pstats) or, with format=text,
+    as a pstats report sorted by `sort`.
+    """
+    try:
+        if format == "text":
+            return PlainTextResponse(store.render(profile_id, sort=sort, limit=limit))
+        return FileResponse(store.path(profile_id), media_type="application/octet-stream",
+                            filename=f"{profile_id}.prof")
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+
+@router.get("/export")
+async def export_messages(user_id: Optional[str] = None, session_id: Optional[str] = None,
+                          compression: Literal["none", "gzip", "zstd"] = "none"):
+    """
+    Stream the messages of a session (with user_id), a user or the whole
+    database as NDJSON. Load the file with `python -m src.llms.transfer import`.
+    """
+    try:
+        lines = export_lines(user_id=user_id, session_id=session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, suffix = _EXPORT_FORMATS[compression]
+    return StreamingResponse(compress_chunks(lines, compression), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="messages{suffix}"'})
+
+@router.get("/maintenance")
+async def maintenance_reports(scheduler: MaintenanceScheduler = Depends(get_maintenance_scheduler)):
+    """
+    Reports of the latest database maintenance runs, newest first.
+    """
+    return {"running": scheduler.running, "reports": list(reversed(scheduler.reports))}
+
+@router.post("/maintenance/run")
+async def run_maintenance(scheduler: MaintenanceScheduler = Depends(get_maintenance_scheduler)):
+    """
+    Run database maintenance now, regardless of traffic and time of day.
+    """
+    return {"reports": await run_in_threadpool(scheduler.run_once, True)}
+
+@router.get("/shards")
+async def shard_stats():
+    """
+    Users, sessions and messages of every chat database shard, read in parallel.
+    """
+    return {"shards": await run_in_threadpool(DatabaseConfig().fan_out, shard_stats_of)}
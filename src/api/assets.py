@@ -0,0 +1,220 @@
+"""
+Build-free asset pipeline for the UI in static/.
+
+Every asset is copied under a name carrying a hash of its content
+(css/styles.css becomes css/styles.0123456789ab.css), references in the
+HTML pages are rewritten to those names, and gzip and brotli variants are
+written next to each file. PrecompressedStaticFiles serves the variant the
+client accepts, fingerprinted files with a one year immutable Cache-Control
+and pages with no-cache, so a repeat visit revalidates the page only and
+takes the assets from the browser cache.
+
+The app builds into STATIC_BUILD_DIR in its lifespan and serves static/ as
+is until then, or ahead of time:
+
+    python -m src.api.assets
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from src.api.compression import _COMPRESSIBLE, brotli, choose_encoding
+from src.llms.utils.config import config
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).parent.parent.parent / "static"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Variants by preference, with their file suffix
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+_FINGERPRINTED = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+_REFERENCE = re.compile(r"""(\b(?:src|href)=["'])([^"'?#]+)""")
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write(path: Path, data: bytes):
+    """Atomic write, so workers building at the same time never serve a partial file"""
+    if path.exists() and path.read_bytes() == data:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)  # mkstemp creates the file readable by its owner only
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write_variants(path: Path, data: bytes, brotli_quality: int):
+    """Precompressed variants of a text file, kept only when smaller than the file itself"""
+    media_type = mimetypes.guess_type(path.name)[0] or ""
+    variants = {}
+    if media_type.startswith(_COMPRESSIBLE):
+        variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=brotli_quality)
+    for encoding, suffix in _SUFFIXES.items():
+        variant = path.with_name(path.name + suffix)
+        if encoding in variants and len(variants[encoding]) < len(data):
+            _write(variant, variants[encoding])
+        elif variant.exists():
+            variant.unlink()  # Left from a build with other settings
+
+
+def _rewrite_references(page: str, html: str, manifest: Dict[str, str]) -> str:
+    """Point src and href attributes of a page at the fingerprinted URLs of the manifest"""
+    base = posixpath.dirname("/" + page)
+
+    def replace(match):
+        reference = match.group(2)
+        if "://" in reference or reference.startswith("//"):
+            return match.group(0)
+        url = reference if reference.startswith("/") else posixpath.normpath(posixpath.join(base, reference))
+        return match.group(1) + manifest.get(url, reference)
+
+    return _REFERENCE.sub(replace, html)
+
+
+def build_dir() -> Path:
+    """STATIC_BUILD_DIR, by default a directory per checkout under the system temp directory"""
+    if config.static_build_dir:
+        return Path(config.static_build_dir)
+    return Path(tempfile.gettempdir()) / f"chat-static-{fingerprint(str(STATIC_DIR).encode())}"
+
+
+def build_assets(source: Path = STATIC_DIR, target: Path = None, brotli_quality: int = 11) -> Dict[str, str]:
+    """
+    Build the fingerprinted and precompressed copy of source into target.
+    Returns the manifest, {original URL: fingerprinted URL}.
+    """
+    source, target = Path(source), Path(target or build_dir())
+    manifest: Dict[str, str] = {}
+    pages: List[Path] = []
+    for path in sorted(source.rglob("*")):
+        if not path.is_file():
+            continue
+        if path.suffix == ".html":
+            pages.append(path)
+            continue
+        data = path.read_bytes()
+        relative = path.relative_to(source).with_name(f"{path.stem}.{fingerprint(data)}{path.suffix}")
+        _write(target / relative, data)
+        _write_variants(target / relative, data, brotli_quality)
+        manifest["/" + path.relative_to(source).as_posix()] = "/" + relative.as_posix()
+
+    # Pages keep their names, they are revalidated on every visit
+    for path in pages:
+        page = path.relative_to(source).as_posix()
+        html = _rewrite_references(page, path.read_text(encoding="utf-8"), manifest).encode("utf-8")
+        _write(target / page, html)
+        _write_variants(target / page, html, brotli_quality)
+
+    # Assets of earlier builds, no page references them anymore
+    current = {url.lstrip("/") for url in manifest.values()}
+    for path in target.rglob("*"):
+        name = path.relative_to(target).as_posix()
+        for suffix in _SUFFIXES.values():
+            name = name[:-len(suffix)] if name.endswith(suffix) else name
+        if path.is_file() and _FINGERPRINTED.search(name) and name not in current:
+            path.unlink()
+    return manifest
+
+
+def prepare_static(source: Path = STATIC_DIR) -> Path:
+    """
+    Directory the UI is served from: the build directory after building into
+    it, or source itself when STATIC_BUILD is off or the build failed.
+    """
+    if not config.static_build:
+        return source
+    target = build_dir()
+    try:
+        manifest = build_assets(source, target)
+    except OSError:
+        logger.warning("Static asset build failed, serving static/ as is", exc_info=True)
+        return source
+    logger.debug("Static assets built", extra={"target": str(target), "assets": len(manifest)})
+    return target
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving the .br or .gz variant of a file when the client
+    accepts it, with long-lived caching for fingerprinted files.
+    """
+
+    def __init__(self, *, directory: os.PathLike, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        # {file path: encodings with a variant on disk}, the directory doesn't change while serving from it
+        self.variants = self._find_variants(directory)
+
+    @staticmethod
+    def _find_variants(directory: os.PathLike) -> Dict[str, List[str]]:
+        variants: Dict[str, List[str]] = {}
+        for root, _, files in os.walk(os.path.realpath(directory)):  # lookup_path resolves links too
+            for name in files:
+                for encoding, suffix in _SUFFIXES.items():
+                    if name.endswith(suffix) and name[:-len(suffix)] in files:
+                        variants.setdefault(os.path.join(root, name[:-len(suffix)]), []).append(encoding)
+        return variants
+
+    def serve_from(self, directory: os.PathLike):
+        """Switch to another directory, the build that finished after the app was mounted"""
+        variants = self._find_variants(directory)
+        self.all_directories = self.get_directories(directory, None)
+        self.directory = directory
+        self.variants = variants
+
+    def file_response(self, full_path: os.PathLike, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        encodings = self.variants.get(full_path, [])
+        headers = {"Cache-Control": IMMUTABLE if _FINGERPRINTED.search(full_path) else "no-cache"}
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), encodings)
+        path = full_path
+        if encoding is not None:
+            path = full_path + _SUFFIXES[encoding]
+            stat_result = os.stat(path)
+            headers["Content-Encoding"] = encoding
+
+        # The type of the original file, the ETag of the variant sent
+        response = FileResponse(path, status_code=status_code, headers=headers, stat_result=stat_result,
+                                media_type=mimetypes.guess_type(full_path)[0] or "text/plain")
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed UI assets")
+    parser.add_argument("--source", default=str(STATIC_DIR))
+    parser.add_argument("--target", help="Output directory, STATIC_BUILD_DIR by default")
+    args = parser.parse_args()
+    print(json.dumps(build_assets(Path(args.source), args.target and Path(args.target)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
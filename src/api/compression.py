@@ -0,0 +1,99 @@
+import gzip
+from typing import Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.llms.utils.config import config
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only without it
+    brotli = None
+
+_COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str, encodings: Iterable[str] = None) -> Optional[str]:
+    """
+    Preferred encoding for an Accept-Encoding header: br, gzip or None. By
+    default the ones we can produce, or else the given available encodings.
+    """
+    if encodings is None:
+        encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in encodings and accepted.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compress complete response bodies of at least minimum_size bytes with
+    brotli or gzip. Streamed responses (NDJSON chat, large files) pass through
+    unchanged so every chunk reaches the client as soon as it is produced.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = None, gzip_level: int = None, brotli_quality: int = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else config.compress_min_bytes
+        self.gzip_level = gzip_level if gzip_level is not None else config.gzip_level
+        self.brotli_quality = brotli_quality if brotli_quality is not None else config.brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                passthrough = True
+                body = message.get("body", b"")
+                headers = MutableHeaders(raw=start["headers"])
+                if not message.get("more_body", False) and self._should_compress(headers, body):
+                    body = self.compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                await send(start)
+                await send(message)
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, headers: MutableHeaders, body: bytes) -> bool:
+        return (
+            len(body) >= self.minimum_size
+            and "content-encoding" not in headers
+            and headers.get("content-type", "").startswith(_COMPRESSIBLE)
+        )
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
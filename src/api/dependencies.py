@@ -1,5 +1,68 @@
-from src.llms.model import ModelManagement
+import logging
+import time
+from functools import lru_cache
 
-def get_model():
-    """Dependency to get model instance"""
-    return ModelManagement()
+from src.llms.archive import SessionArchive
+from src.llms.memory import MemoryManagement
+from src.llms.model import ModelManagement, get_model_management
+from src.llms.prompts.registry import SUMMARY_PROMPT_FILE, SYSTEM_PROMPT_FILE, load_prompt_file
+from src.llms.search import rebuild_search_index
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.idempotency import IdempotencyStore
+from src.llms import usage
+
+logger = logging.getLogger(__name__)
+
+def get_model() -> ModelManagement:
+    """Dependency to get the process-wide model instance"""
+    return get_model_management()
+
+@lru_cache(maxsize=None)
+def get_idempotency_store():
+    """Dependency to get the process-wide idempotency store"""
+    return IdempotencyStore()
+
+def get_usage_recorder():
+    """Dependency to get the process-wide usage recorder, shared with the chains"""
+    return usage.get_usage_recorder()
+
+def _warm_databases():
+    # Schema checks and migrations of every shard, instead of on the first request routed to it
+    db_config = DatabaseConfig()
+    for shard in db_config.shards():
+        MemoryManagement(db_config=shard)
+    rebuild_search_index(db_config)  # Once, for messages written before the index existed
+    SessionArchive(db_config)
+    get_idempotency_store()
+    get_usage_recorder()
+
+def _warm_prompts():
+    load_prompt_file(str(SYSTEM_PROMPT_FILE))
+    load_prompt_file(str(SUMMARY_PROMPT_FILE))
+
+def preload():
+    """
+    The part of the warmup that is safe before src.server forks its workers, which
+    then share it copy-on-write: imports and parsed prompts. No threads, sockets or
+    database connections, those belong to each worker.
+    """
+    _warm_prompts()
+    if config.model_provider != "fake":
+        import langchain_google_genai  # noqa: F401
+
+def warmup() -> dict:
+    """
+    Prepare what the first requests would otherwise pay for: database schemas,
+    parsed prompts and the model client with its provider SDK. Returns the
+    seconds of each step; a failing step is logged and the others still run.
+    """
+    seconds = {}
+    for name, step in (("databases", _warm_databases), ("prompts", _warm_prompts), ("model", get_model_management)):
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warmup step failed", extra={"step": name})
+        seconds[name] = round(time.perf_counter() - started, 4)
+    return seconds
@@ -1,39 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Any, Dict, List, Optional, Literal, Type
+import logging
+import orjson
 
 from src.llms.chains.chain import ChainManagement
+from src.llms.chains.batch import BatchChatRunner
+from src.llms.batching import SummaryBatcher
+from src.llms.utils.config import config
+from src.llms.utils.group_commit import GroupCommitWriter
 from src.llms.model import ModelManagement
 from src.llms.memory import MemoryManagement
+from src.llms.archive import SessionArchive
+from src.llms.search import MessageSearch
+from src.llms.prewarm import prewarm
+from src.llms.utils.sharding import SHARD_ID_BITS
+from src.llms.utils.idempotency import IdempotencyStore, IdempotencyKeyInFlight, IdempotencyKeyMismatch
 from src.utils.ids import generate_session_id, generate_user_id
-from .dependencies import get_model
+from src.utils.log import bind
+from src.llms.usage import UsageRecorder
+from .admin import require_admin
+from .dependencies import get_model, get_idempotency_store, get_usage_recorder
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-@router.get("/sessions")
-async def list_sessions(user_id: str):
-    """
-    List all chat sessions for a user, with session_id and session_name.
-    """
-    try:
-        memory = MemoryManagement(user_id=user_id)
-        # Query all unique session_ids and their latest session_name for this user
-        from src.llms.utils.db_config import DatabaseConfig
-        db_config = DatabaseConfig()
-        with db_config.get_connection() as conn:
-            cursor = conn.execute('''
-                SELECT session_id, MAX(timestamp), session_name, mode
-                FROM chat_message
-                WHERE user_id = ?
-                GROUP BY session_id, mode
-                ORDER BY MAX(timestamp) DESC
-            ''', (user_id,))
-            sessions = [
-                {"session_id": row[0], "session_name": row[2], "mode": row[3]} for row in cursor.fetchall()
-            ]
-        return {"sessions": sessions}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error listing sessions: {str(e)}")
+router = APIRouter()
 
 # Pydantic models
 class ChatRequest(BaseModel):
@@ -41,6 +34,17 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation continuity")
     user_id: Optional[str] = Field(None, description="User ID")
     mode: Literal['consultant', 'docs_writer'] = Field('consultant', description="Chatbot mode")
+    idempotency_key: Optional[str] = Field(None, max_length=255, description="Retry key, same as the Idempotency-Key header")
+
+class BatchChatItem(BaseModel):
+    message: str = Field(..., min_length=1, max_length=5000, description="User message")
+    session_id: Optional[str] = Field(None, description="Session ID, a new one is generated if missing")
+    user_id: Optional[str] = Field(None, description="User ID")
+    mode: Literal['consultant', 'docs_writer'] = Field('consultant', description="Chatbot mode")
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(..., min_length=1, description="Chat turns to run")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="Sessions to run at once, capped by server config")
 
 class ChatResponse(BaseModel):
     response: str
@@ -55,53 +59,191 @@ class SessionResponse(BaseModel):
     session_id: str
     user_id: str
 
+class SessionSummary(BaseModel):
+    session_id: str
+    session_name: Optional[str] = None
+    mode: str
+
+class SessionsResponse(BaseModel):
+    sessions: List[SessionSummary]
+
+class HistoryMessage(BaseModel):
+    id: int
+    role: str
+    content: str
+    additional_kwargs: Dict[str, Any] = {}
+    timestamp: Optional[str] = None
+
 class HistoryResponse(BaseModel):
-    messages: list
+    messages: List[HistoryMessage]
     session_id: str
     user_id: str
-    last_mode: str = None
+    last_mode: Optional[str] = None
+    has_more: bool = False
+    next_before_id: Optional[int] = None  # Pass as before_id to load the next, older page
+    latest_id: Optional[int] = None  # Newest message the client has after this response, pass as since_id
+    message_count: int = 0  # Messages of the session in this mode, a delta that doesn't add up means some were deleted
+    reset: bool = False  # since_id predates a reshard that renumbered the session, load it again without
+
+class SearchResult(BaseModel):
+    id: int
+    session_id: str
+    session_name: Optional[str] = None
+    mode: str
+    role: str
+    timestamp: Optional[str] = None
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    has_more: bool = False
+    next_offset: Optional[int] = None
+
+# Clients may cache but must revalidate with If-None-Match every time
+_REVALIDATE = "private, no-cache"
+
+def _etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def _json_response(model: Type[BaseModel], headers: Optional[dict] = None, **fields) -> ORJSONResponse:
+    """
+    Serialize the fields of a response model with orjson. The model documents
+    the payload, the values come from our own database and aren't validated again.
+    """
+    content = {name: fields[name] if name in fields else field.get_default(call_default_factory=True)
+               for name, field in model.model_fields.items()}
+    return ORJSONResponse(content, headers=headers)
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """304 response when the client already has this ETag"""
+    if if_none_match is None:
+        return None
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in candidates or etag in candidates:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": _REVALIDATE})
+    return None
+
+@router.get("/sessions", response_model=SessionsResponse, response_class=ORJSONResponse)
+async def list_sessions(user_id: str,
+                        if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """
+    List all chat sessions for a user, with session_id and session_name.
+    Supports If-None-Match, the ETag changes whenever any session of the user changes.
+    """
+    try:
+        memory = MemoryManagement(user_id=user_id)
+        etag = _etag("s", memory.get_sessions_version())
+        not_modified = _not_modified(if_none_match, etag)
+        if not_modified is not None:
+            return not_modified
+        return _json_response(SessionsResponse, headers={"ETag": etag, "Cache-Control": _REVALIDATE},
+                              sessions=memory.list_sessions())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing sessions: {str(e)}")
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, model: ModelManagement = Depends(get_model)):
+@router.post("/chat", response_model=ChatResponse, response_class=ORJSONResponse)
+async def chat(
+    request: ChatRequest,
+    model: ModelManagement = Depends(get_model),
+    store: IdempotencyStore = Depends(get_idempotency_store),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
     """
     Send a message to the chatbot and get a response.
+
+    Requests carrying an Idempotency-Key header (or idempotency_key field) run
+    the chain once; retries attach to the running turn or replay its response.
+    Keys are scoped to the user, so keyed requests need a user_id.
     """
+    key = idempotency_key or request.idempotency_key
+    if not key:
+        return ORJSONResponse(await _run_chat(request, model))
+    if not request.user_id:
+        # Anonymous requests would share one key namespace and get each other's responses
+        raise HTTPException(status_code=400, detail="An Idempotency-Key requires a user_id")
+
+    payload = request.model_dump(exclude={"idempotency_key"})
+    try:
+        result, replayed = await store.run_once(
+            request.user_id,
+            key,
+            store.fingerprint(payload),
+            lambda: _run_chat(request, model),
+        )
+    except IdempotencyKeyMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyKeyInFlight as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    return ORJSONResponse(result, headers={"Idempotent-Replayed": "true"} if replayed else None)
+
+async def _run_chat(request: ChatRequest, model: ModelManagement) -> dict:
+    """Run one chat turn and return the response payload"""
     try:
         # Generate IDs if not provided
         session_id = request.session_id or generate_session_id()
         user_id = request.user_id or generate_user_id()
-        
-        print(f"DEBUG API: session_id={session_id}, user_id={user_id}, mode={request.mode}")
-        print(f"DEBUG API: message={request.message}")
-        print(f"DEBUG API: model type={type(model)}")
-        
-        # Initialize chain
-        chain = ChainManagement(
-            mode=request.mode,
-            session_id=session_id,
-            user_id=user_id,
-            model=model
-        )
-        
-        print(f"DEBUG API: chain created successfully")
-        
-        # Get response - chain.invoke expects a string
-        response = chain.invoke(request.message)
-        
-        print(f"DEBUG API: response received: {response}")
-        
-        return ChatResponse(
-            response=response,
-            session_id=session_id,
-            user_id=user_id,
-            mode=request.mode
-        )
+
+        with bind(session_id=session_id, user_id=user_id):
+            logger.debug("Chat turn started", extra={"mode": request.mode})
+
+            # Initialize chain
+            chain = ChainManagement(
+                mode=request.mode,
+                session_id=session_id,
+                user_id=user_id,
+                model=model
+            )
+
+            # Get response - chain.invoke expects a string, run it off the event loop
+            # so duplicate requests can attach while the model is working
+            response = await run_in_threadpool(chain.invoke, request.message)
+
+        return {"response": response, "session_id": session_id, "user_id": user_id, "mode": request.mode}
     except Exception as e:
-        print(f"DETAILED ERROR: {type(e).__name__}: {str(e)}")
-        import traceback
-        print(f"FULL TRACEBACK:\n{traceback.format_exc()}")
+        logger.exception("Chat turn failed", extra={"mode": request.mode})
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, model: ModelManagement = Depends(get_model)):
+    """
+    Run many chat turns concurrently and stream results as NDJSON.
+
+    Each line is {"index", "status", ...} for one item, in completion order.
+    Turns of the same session run in request order.
+    """
+    if len(request.items) > config.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {config.batch_max_items} items")
+
+    items = []
+    for item in request.items:
+        items.append({
+            "message": item.message,
+            "session_id": item.session_id or generate_session_id(),
+            "user_id": item.user_id or generate_user_id(),
+            "mode": item.mode,
+        })
+
+    max_concurrency = min(request.max_concurrency or config.batch_max_concurrency, config.batch_max_concurrency)
+    runner = BatchChatRunner(
+        model=model,
+        max_concurrency=max_concurrency,
+        writer=GroupCommitWriter(max_rows=config.batch_commit_rows),
+        summary_batcher=SummaryBatcher(config.summary_batch_size, config.summary_batch_wait),
+    )
+
+    async def stream():
+        async for index, result in runner.run(items):
+            item = items[index]
+            line = {"index": index, "session_id": item["session_id"], "user_id": item["user_id"], "mode": item["mode"]}
+            if isinstance(result, Exception):
+                line.update(status="error", error=f"{type(result).__name__}: {result}")
+            else:
+                line.update(status="ok", response=result)
+            yield orjson.dumps(line) + b"\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.post("/session/new", response_model=SessionResponse)
 async def create_session(request: SessionRequest):
     """
@@ -115,46 +257,94 @@ async def create_session(request: SessionRequest):
         user_id=user_id
     )
 
-@router.get("/session/{session_id}/history", response_model=HistoryResponse)
-async def get_history(session_id: str, user_id: str, mode: str = "consultant"):
+# Plain def, FastAPI runs it in the threadpool: rehydrating an archived session
+# decompresses and inserts it, which must not block the event loop
+@router.get("/session/{session_id}/history", response_model=HistoryResponse, response_class=ORJSONResponse)
+def get_history(session_id: str, user_id: str, background_tasks: BackgroundTasks, mode: str = "consultant",
+                before_id: Optional[int] = None, since_id: Optional[int] = None,
+                limit: int = Query(None, ge=1),
+                if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     """
-    Get chat history for a session with specific mode.
+    Get one page of chat history for a session with specific mode, newest first.
+    Follow next_before_id as before_id to page backwards while has_more is true.
+
+    With since_id only messages added after that message are returned, oldest
+    first, continue from latest_id while has_more is true. Supports
+    If-None-Match, the ETag changes whenever any mode of the session changes.
+    A since_id from before a reshard moved the user gets no messages and reset.
+
+    Opening a session (its newest page, not a since_id poll or a 304) pre-warms
+    the context of its next chat turn after the response.
     """
+    limit = min(limit or config.history_page_size, config.history_max_page_size)
+    if before_id is not None and since_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or since_id")
     try:
         memory = MemoryManagement(session_id=session_id, user_id=user_id, mode=mode)
-        memory.get_messages()
-        messages = [
-            {
-                "role": msg.role,
-                "content": msg.content,
-                "additional_kwargs": msg.additional_kwargs,
-                "mode": getattr(msg, 'mode', None)  # in case mode is attached to message
-            }
-            for msg in memory.message
-        ]
-        # Fetch the mode of the last message in the session (regardless of mode param)
-        import sqlite3
-        last_mode = None
+        # Reopening an archived session moves it back to chat_message
+        SessionArchive(memory.db_config).rehydrate(user_id, session_id)
+        state = memory.get_session_state()
+        etag = _etag("h", *(f"{name}.{version}" for name, (version, _, _) in sorted(state.items())))
+        not_modified = _not_modified(if_none_match, etag)
+        if not_modified is not None:
+            return not_modified
+        if before_id is None and since_id is None:
+            background_tasks.add_task(prewarm, user_id, session_id, mode)
+
+        if since_id is not None and since_id >> SHARD_ID_BITS != memory.db_config.shard_index:
+            # Ids are numbered per shard, so the client's id belongs to the range of the user's old shard
+            return _json_response(HistoryResponse, headers={"ETag": etag, "Cache-Control": _REVALIDATE},
+                                  messages=[], session_id=session_id, user_id=user_id, reset=True)
+
         try:
-            with memory.db_config.get_connection() as conn:
-                cursor = conn.execute(
-                    "SELECT mode FROM chat_message WHERE session_id = ? AND user_id = ? ORDER BY timestamp DESC LIMIT 1",
-                    (session_id, user_id)
-                )
-                row = cursor.fetchone()
-                if row:
-                    last_mode = row[0]
-        except sqlite3.Error:
-            last_mode = None
-        return HistoryResponse(
+            if since_id is not None:
+                messages, has_more = memory.get_messages_since(since_id, limit=limit)
+            else:
+                messages, has_more = memory.get_message_page(before_id=before_id, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if since_id is not None:
+            latest_id = messages[-1]["id"] if messages else since_id
+        elif before_id is None:
+            # Newest by id, which since_id continues from, not necessarily the newest timestamp
+            latest_id = max((message["id"] for message in messages), default=None)
+        else:
+            latest_id = None
+        return _json_response(
+            HistoryResponse,
+            headers={"ETag": etag, "Cache-Control": _REVALIDATE},
             messages=messages,
             session_id=session_id,
             user_id=user_id,
-            last_mode=last_mode
+            # Mode of the last message in the session (regardless of mode param), not for older pages
+            last_mode=memory.get_last_mode(state) if before_id is None else None,
+            has_more=has_more,
+            next_before_id=messages[-1]["id"] if has_more and since_id is None else None,
+            latest_id=latest_id,
+            message_count=state.get(mode, (0, 0, None))[1],
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving history: {str(e)}")
 
+@router.get("/search", response_model=SearchResponse, response_class=ORJSONResponse)
+async def search_messages(user_id: str, q: str = Query(..., min_length=1, max_length=200),
+                          mode: Optional[Literal['consultant', 'docs_writer']] = None,
+                          limit: int = Query(None, ge=1), offset: int = Query(0, ge=0)):
+    """
+    Full-text search over the user's messages, best match first, with
+    highlighted snippets. Follow next_offset while has_more is true.
+    """
+    limit = min(limit or config.search_page_size, config.search_max_page_size)
+    try:
+        results, has_more = await run_in_threadpool(MessageSearch().search, user_id, q, mode, limit, offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching messages: {str(e)}")
+    return _json_response(SearchResponse, results=results, has_more=has_more,
+                          next_offset=offset + limit if has_more else None)
+
 @router.get("/session/{session_id}/name")
 async def get_session_name(session_id: str, user_id: str, mode: str = "consultant"):
     """
@@ -167,14 +357,49 @@ async def get_session_name(session_id: str, user_id: str, mode: str = "consultan
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving session name: {str(e)}")
 
+@router.post("/session/{session_id}/prewarm", status_code=202)
+async def prewarm_session(session_id: str, user_id: str, background_tasks: BackgroundTasks, mode: str = "consultant"):
+    """
+    Load the context of the session's next chat turn in the background, so
+    a turn sent soon after skips loading it. Sent when a session is hovered.
+    """
+    background_tasks.add_task(prewarm, user_id, session_id, mode)
+    return {"status": "scheduled"}
+
 @router.delete("/session/{session_id}/clear")
-async def clear_history(session_id: str, user_id: str, mode: str = "consultant"):
+def clear_history(session_id: str, user_id: str, mode: str = "consultant"):
     """
     Clear chat history for a session with specific mode.
     """
     try:
         memory = MemoryManagement(session_id=session_id, user_id=user_id, mode=mode)
+        SessionArchive(memory.db_config).rehydrate(user_id, session_id)
         memory.clear()
         return {"message": "History cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error clearing history: {str(e)}")
+
+@router.get("/usage", dependencies=[Depends(require_admin)])
+async def get_usage(
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    mode: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    group_by: str = "mode,day",
+    recorder: UsageRecorder = Depends(get_usage_recorder),
+):
+    """
+    Token usage and estimated cost, summed over group_by
+    (any of user_id, session_id, mode, day, purpose). Days are YYYY-MM-DD.
+    Requires the admin token, requests carry no caller identity to scope it to.
+    """
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    try:
+        rows = await run_in_threadpool(recorder.query, user_id=user_id, session_id=session_id, mode=mode,
+                                       since=since, until=until, group_by=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving usage: {str(e)}")
+    return {"usage": rows}
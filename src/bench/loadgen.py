@@ -0,0 +1,201 @@
+"""
+Async load generator for the chat API.
+
+Drives /api/chat and the session endpoints the way static/js/app.js does, with
+a mix of short consultant chats and long docs_writer sessions, and reports
+throughput, latency percentiles and error rates per endpoint.
+
+    # Against a running server
+    python -m src.bench.loadgen --base-url http://127.0.0.1:8000 --users 20 --duration 60
+
+    # In-process with the fake model, no server or API key needed
+    python -m src.bench.loadgen --in-process --users 50 --sessions 2 --output report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from src.bench.stats import summarize
+
+# name -> (mode, (min turns, max turns), weight)
+SESSION_MIX = {
+    "consultant_short": ("consultant", (2, 4), 0.7),
+    "docs_writer_long": ("docs_writer", (6, 12), 0.3),
+}
+
+QUESTIONS = {
+    "consultant": [
+        "Hi, I want to study a master's in computer science abroad.",
+        "My CGPA is 3.4 and I have two years of work experience. Which countries fit me?",
+        "What are the admission requirements for German public universities?",
+        "Do I need GRE for Canadian universities?",
+        "Which scholarships can I apply for in Australia?",
+        "What is the usual application deadline for fall intake?",
+    ],
+    "docs_writer": [
+        "Help me write a statement of purpose for a data science master's.",
+        "My background is electrical engineering and I worked on IoT projects for a year.",
+        "I led a student robotics team and we won a national competition.",
+        "My weakness is a low grade in my second year, how should I address it?",
+        "Please write the full SOP now in about 800 words.",
+        "Make the introduction more personal and shorten the conclusion.",
+        "Now draft a letter of recommendation from my final year supervisor.",
+    ],
+}
+
+
+class LoadReport:
+    """Collects per-endpoint latencies and errors"""
+
+    def __init__(self):
+        self.latencies: Dict[str, list] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.turns = 0
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def to_dict(self, elapsed: float) -> dict:
+        endpoints = {}
+        total_requests = total_errors = 0
+        for name, values in sorted(self.latencies.items()):
+            errors = self.errors.get(name, 0)
+            total_requests += len(values)
+            total_errors += errors
+            endpoints[name] = dict(summarize(values), errors=errors, error_rate=errors / len(values) if values else 0.0)
+        return {
+            "elapsed_seconds": elapsed,
+            "requests": total_requests,
+            "chat_turns": self.turns,
+            "throughput_rps": total_requests / elapsed if elapsed else 0.0,
+            "turns_per_second": self.turns / elapsed if elapsed else 0.0,
+            "error_rate": total_errors / total_requests if total_requests else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, users: int = 10, sessions: int = 1, duration: Optional[float] = None,
+                 think_time: float = 0.0, seed: int = 0):
+        self.client = client
+        self.users = users
+        self.sessions = sessions
+        self.duration = duration
+        self.think_time = think_time
+        self.seed = seed
+        self.report = LoadReport()
+
+    async def _request(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.report.record(name, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    async def _think(self, rng: random.Random):
+        if self.think_time > 0:
+            await asyncio.sleep(rng.expovariate(1.0 / self.think_time))
+
+    async def _session(self, rng: random.Random, user_id: str):
+        profile = rng.choices(list(SESSION_MIX), weights=[weight for _, _, weight in SESSION_MIX.values()])[0]
+        mode, (min_turns, max_turns), _ = SESSION_MIX[profile]
+
+        created = await self._request("session_new", "POST", "/api/session/new", json={"user_id": user_id})
+        if created is None:
+            return
+        session_id = created.json()["session_id"]
+
+        for turn in range(rng.randint(min_turns, max_turns)):
+            message = QUESTIONS[mode][turn % len(QUESTIONS[mode])]
+            response = await self._request(
+                "chat", "POST", "/api/chat",
+                json={"message": message, "session_id": session_id, "user_id": user_id, "mode": mode},
+                headers={"Idempotency-Key": str(uuid.uuid4())},
+            )
+            if response is not None:
+                self.report.turns += 1
+            # app.js refreshes the sidebar after every answer
+            await self._request("sessions", "GET", "/api/sessions", params={"user_id": user_id})
+            await self._think(rng)
+
+        # Switching back to the chat later reloads its history
+        await self._request("history", "GET", f"/api/session/{session_id}/history",
+                            params={"user_id": user_id, "mode": mode})
+
+    async def _user(self, index: int, deadline: Optional[float]):
+        rng = random.Random(f"{self.seed}:{index}")
+        user_id = f"load-user-{self.seed}-{index}"
+        await self._request("sessions", "GET", "/api/sessions", params={"user_id": user_id})
+        completed = 0
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if deadline is None and completed >= self.sessions:
+                break
+            await self._session(rng, user_id)
+            completed += 1
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+        await asyncio.gather(*(self._user(index, deadline) for index in range(self.users)))
+        return self.report.to_dict(time.perf_counter() - start)
+
+
+async def _main(args):
+    if args.in_process:
+        # Fake model unless --real, even when a real provider is configured, and a scratch database
+        if not args.real:
+            os.environ["MODEL_PROVIDER"] = "fake"
+        os.environ.setdefault("CHAT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="loadgen-"), "chat_history.db"))
+        from src.main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.users * 2))
+
+    async with client:
+        generator = LoadGenerator(client, users=args.users, sessions=args.sessions, duration=args.duration,
+                                  think_time=args.think_time, seed=args.seed)
+        return await generator.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chat API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-process", action="store_true", help="Run the app in this process with the fake model")
+    parser.add_argument("--real", action="store_true", help="With --in-process, use the configured MODEL_PROVIDER (paid calls)")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=1, help="Sessions per user when no duration is given")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between turns")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Microbenchmarks for the memory layer at production data sizes.
+
+Generates synthetic chat_history databases (cached in --workdir), times each
+MemoryManagement operation cold (page cache evicted, fresh connection) and
+warm, records the query plan of every statement it runs and writes a JSON
+report. With --baseline the report is compared against a stored run and the
+process exits with status 1 when an operation got slower than --threshold.
+
+    python -m src.bench.memory_bench --sizes 10k,100k,1m --output bench.json
+    python -m src.bench.memory_bench --sizes 10k,100k --baseline bench.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from langchain_core.messages.chat import ChatMessage
+
+from src.bench.stats import summarize
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+
+# mode -> (share of sessions, (min, max) messages, (min, max) chars of an answer)
+SESSION_SHAPES = {
+    "consultant": (0.75, (4, 20), (200, 1200)),
+    "docs_writer": (0.25, (10, 120), (1500, 6000)),
+}
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WORDS = "admission university program scholarship deadline statement motivation research profile visa".split()
+
+
+def parse_size(text: str) -> int:
+    """Parse sizes like 10k, 1m or 2500"""
+    text = text.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+
+
+def _text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)
+
+
+def generate_database(path: Path, messages: int, seed: int = 0, messages_per_user: int = 200) -> Path:
+    """Create a database with about `messages` rows spread across users and sessions"""
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    MemoryManagement(db_config=DatabaseConfig(str(tmp_path)))  # Same schema and indexes as production
+    rng = random.Random(seed)
+    conn = sqlite3.connect(str(tmp_path))
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = OFF")
+
+    clock = datetime(2025, 1, 1)
+    rows = []
+    written = session_index = 0
+    user_count = max(messages // messages_per_user, 1)
+    while written < messages:
+        user_id = f"user-{rng.randrange(user_count)}"
+        mode = "consultant" if rng.random() < SESSION_SHAPES["consultant"][0] else "docs_writer"
+        _, (low, high), (min_chars, max_chars) = SESSION_SHAPES[mode]
+        session_id = f"session-{session_index}"
+        session_index += 1
+        session_name = f"Session {session_index}"
+        for turn in range(min(rng.randint(low, high), messages - written)):
+            clock += timedelta(seconds=rng.randint(1, 90))
+            if turn % 2 == 0:
+                role, content = "human", _text(rng, rng.randint(20, 300))
+            else:
+                role, content = "ai", _text(rng, rng.randint(min_chars, max_chars))
+            rows.append((session_id, user_id, mode, session_name, role, "{}", content, clock.isoformat()))
+            written += 1
+        if len(rows) >= 50_000:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+            rows = []
+    if rows:
+        conn.executemany("""
+            INSERT INTO chat_message (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    conn.commit()
+    conn.close()
+    tmp_path.rename(path)
+    return path
+
+
+class TracingDatabaseConfig(DatabaseConfig):
+    """DatabaseConfig that records every statement executed on its connections"""
+
+    def __init__(self, db_path: str = None):
+        super().__init__(db_path)
+        self.statements: List[str] = []
+
+    @contextmanager
+    def get_connection(self, check_same_thread: bool = True):
+        with super().get_connection(check_same_thread=check_same_thread) as conn:
+            conn.set_trace_callback(self.statements.append)
+            yield conn
+
+
+def evict_page_cache(path: Path):
+    """Drop the database file from the OS page cache where the platform allows it"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for suffix in ("", "-wal"):
+        target = Path(str(path) + suffix)
+        if not target.exists():
+            continue
+        fd = os.open(str(target), os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def query_plans(path: Path, statements: List[str]) -> Dict[str, List[str]]:
+    """EXPLAIN QUERY PLAN for every distinct query, keyed by the statement with literals as ?"""
+    plans = {}
+    conn = sqlite3.connect(str(path))
+    try:
+        for statement in statements:
+            head = statement.lstrip().split(None, 1)[0].upper()
+            if head not in ("SELECT", "UPDATE", "DELETE", "INSERT"):
+                continue
+            key = " ".join(_LITERAL.sub("?", statement).split())
+            if key in plans:
+                continue
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+            plans[key] = [row[-1] for row in rows]
+    finally:
+        conn.close()
+    return plans
+
+
+def sample_sessions(path: Path, count: int, seed: int) -> List[tuple]:
+    conn = sqlite3.connect(str(path))
+    try:
+        max_id = conn.execute("SELECT MAX(ID) FROM chat_message").fetchone()[0] or 0
+        rng = random.Random(seed)
+        sessions = []
+        for _ in range(count):
+            row = conn.execute(
+                "SELECT session_id, user_id, mode FROM chat_message WHERE ID >= ? LIMIT 1",
+                (rng.randint(1, max_id),),
+            ).fetchone()
+            if row:
+                sessions.append(row)
+        return sessions
+    finally:
+        conn.close()
+
+
+def _operations(db_config: DatabaseConfig):
+    def memory(session):
+        session_id, user_id, mode = session
+        return MemoryManagement(session_id=session_id, user_id=user_id, mode=mode, db_config=db_config)
+
+    def save(session):
+        mm = memory(session)
+        mm.message.append(ChatMessage(role="human", content="benchmark message", additional_kwargs={}))
+        mm.save_messages()
+
+    return {
+        "get_window_message": lambda session: memory(session).get_window_message(window=10, order="DESC"),
+        "get_messages": lambda session: memory(session).get_messages(),
+        "_get_message_count": lambda session: memory(session)._get_message_count(),
+        "save_messages": save,
+        "list_sessions": lambda session: memory(session).list_sessions(),
+    }
+
+
+def bench_database(path: Path, samples: int, repeat: int, seed: int) -> dict:
+    db_config = TracingDatabaseConfig(str(path))
+    sessions = sample_sessions(path, samples, seed)
+    results = {}
+    for name, operation in _operations(db_config).items():
+        cold, warm = [], []
+        db_config.statements.clear()
+        for session in sessions:
+            evict_page_cache(path)
+            start = time.perf_counter()
+            operation(session)
+            cold.append(time.perf_counter() - start)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                operation(session)
+                warm.append(time.perf_counter() - start)
+        results[name] = {
+            "cold": summarize(cold),
+            "warm": summarize(warm),
+            "plans": query_plans(path, db_config.statements),
+        }
+    return results
+
+
+def compare(report: dict, baseline: dict, threshold: float, min_delta: float = 0.0) -> List[str]:
+    """Operations whose p50 grew more than threshold (and min_delta seconds) over the baseline"""
+    regressions = []
+    for size, operations in report["results"].items():
+        for name, result in operations.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            for phase in ("cold", "warm"):
+                before, after = base[phase]["p50"], result[phase]["p50"]
+                if before > 0 and after > before * (1 + threshold) and after - before > min_delta:
+                    regressions.append(f"{size} {name} {phase} p50 {before * 1000:.3f}ms -> {after * 1000:.3f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory layer on synthetic databases")
+    parser.add_argument("--sizes", default="10k,100k", help="Comma separated message counts, e.g. 10k,1m,10m")
+    parser.add_argument("--workdir", default=".bench", help="Where generated databases are kept")
+    parser.add_argument("--samples", type=int, default=20, help="Sessions timed per operation")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm repetitions per session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against this JSON report")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing, 0.25 = 25%%")
+    parser.add_argument("--min-delta", type=float, default=0.0001, help="Ignore slowdowns below this many seconds")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "sqlite_version": sqlite3.sqlite_version,
+            "python": sys.version.split()[0],
+            "samples": args.samples,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size_text in args.sizes.split(","):
+        size = parse_size(size_text)
+        path = generate_database(Path(args.workdir) / f"memory_{size}_{args.seed}.db", size, seed=args.seed)
+        # Work on a copy so save_messages does not grow the cached database between runs
+        work_path = path.with_name(path.stem + "_run.db")
+        shutil.copyfile(path, work_path)
+        try:
+            report["results"][str(size)] = bench_database(work_path, args.samples, args.repeat, args.seed)
+        finally:
+            work_path.unlink()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
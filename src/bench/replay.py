@@ -0,0 +1,173 @@
+"""
+Replay recorded conversations from a chat_history.db against a fresh instance.
+
+Every user turn of the source database is sent again, in order per session,
+through ChainManagement backed by the fake model and a scratch database. The
+original inter-arrival times are kept, optionally compressed with --speedup,
+and the report breaks each turn down into stages: context (DB reads), summary,
+prompt, model, persist, title and other (framework overhead).
+
+    python -m src.bench.replay chat_history.db --speedup 60 --output replay.json
+    python -m src.bench.replay chat_history.db --speedup 0 --mode docs_writer   # as fast as possible
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.bench.stats import summarize
+
+USER_ROLES = ("human", "student", "user")
+# "other" is turn time outside the named stages, mostly langchain overhead
+STAGES = ("context", "summary", "prompt", "model", "persist", "title", "other")
+
+
+def load_conversations(path: str, mode: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+    """Read user turns grouped by session, with their original timestamps"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        query = """
+            SELECT user_id, session_id, mode, content, timestamp FROM chat_message
+            WHERE role IN ({roles})
+        """.format(roles=", ".join("?" for _ in USER_ROLES))
+        params = list(USER_ROLES)
+        if mode:
+            query += " AND mode = ?"
+            params.append(mode)
+        query += " ORDER BY timestamp ASC"
+
+        sessions: Dict[tuple, dict] = {}
+        for user_id, session_id, session_mode, content, timestamp in conn.execute(query, params):
+            key = (user_id, session_id, session_mode)
+            if key not in sessions:
+                if limit is not None and len(sessions) >= limit:
+                    continue
+                sessions[key] = {"user_id": user_id, "session_id": session_id, "mode": session_mode, "turns": []}
+            sessions[key]["turns"].append({"content": content, "at": datetime.fromisoformat(timestamp).timestamp()})
+        return list(sessions.values())
+    finally:
+        conn.close()
+
+
+class ReplayRunner:
+    def __init__(self, conversations: List[dict], model, speedup: float = 1.0, max_gap: Optional[float] = None):
+        self.conversations = conversations
+        self.model = model
+        self.speedup = speedup
+        self.max_gap = max_gap
+        self.turns: List[dict] = []
+
+    def _schedule(self) -> Dict[int, List[float]]:
+        """Offset in seconds from replay start for every turn, after speedup and gap capping"""
+        moments = sorted({turn["at"] for conversation in self.conversations for turn in conversation["turns"]})
+        offsets, elapsed, previous = {}, 0.0, None
+        for moment in moments:
+            if previous is not None:
+                gap = moment - previous
+                if self.max_gap is not None:
+                    gap = min(gap, self.max_gap)
+                elapsed += gap / self.speedup if self.speedup > 0 else 0.0
+            offsets[moment] = elapsed
+            previous = moment
+        return {
+            index: [offsets[turn["at"]] for turn in conversation["turns"]]
+            for index, conversation in enumerate(self.conversations)
+        }
+
+    async def _replay(self, conversation: dict, offsets: List[float], start: float):
+        from src.llms.chains.chain import ChainManagement
+
+        for turn, offset in zip(conversation["turns"], offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            chain = ChainManagement(mode=conversation["mode"], session_id=conversation["session_id"],
+                                    user_id=conversation["user_id"], model=self.model)
+            began = time.perf_counter()
+            error = None
+            try:
+                await chain.ainvoke(turn["content"])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            total = time.perf_counter() - began
+            stages = dict(chain.timer.stages)
+            stages["other"] = max(total - sum(stages.values()), 0.0)
+            self.turns.append({
+                "mode": conversation["mode"],
+                "lag": began - (start + offset),
+                "total": total,
+                "stages": stages,
+                "error": error,
+            })
+
+    async def run(self) -> dict:
+        schedule = self._schedule()
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self._replay(conversation, schedule[index], start)
+            for index, conversation in enumerate(self.conversations)
+        ))
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> dict:
+        def breakdown(turns):
+            stages = defaultdict(list)
+            for turn in turns:
+                for name in STAGES:
+                    stages[name].append(turn["stages"].get(name, 0.0))
+            return {
+                "turns": len(turns),
+                "errors": sum(1 for turn in turns if turn["error"]),
+                "total": summarize([turn["total"] for turn in turns]),
+                "schedule_lag": summarize([max(turn["lag"], 0.0) for turn in turns]),
+                "stages": {name: summarize(values) for name, values in stages.items()},
+            }
+
+        by_mode = defaultdict(list)
+        for turn in self.turns:
+            by_mode[turn["mode"]].append(turn)
+        return {
+            "elapsed_seconds": elapsed,
+            "sessions": len(self.conversations),
+            "turns_per_second": len(self.turns) / elapsed if elapsed else 0.0,
+            "overall": breakdown(self.turns),
+            "by_mode": {mode: breakdown(turns) for mode, turns in sorted(by_mode.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations against a fake-model instance")
+    parser.add_argument("source", help="chat_history.db to read conversations from (opened read-only)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Compress original timing, 0 replays without waiting")
+    parser.add_argument("--max-gap", type=float, default=None, help="Cap idle gaps in the recording to this many seconds")
+    parser.add_argument("--mode", choices=["consultant", "docs_writer"], help="Only replay sessions of this mode")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many sessions")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--real", action="store_true", help="Use the configured MODEL_PROVIDER instead of the fake model (paid calls)")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.source, mode=args.mode, limit=args.limit)
+
+    # Fresh instance: scratch database and the fake model unless --real, even when a real provider is configured
+    if not args.real:
+        os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["CHAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="replay-"), "chat_history.db")
+    from src.llms.model import ModelManagement
+
+    runner = ReplayRunner(conversations, ModelManagement(), speedup=args.speedup, max_gap=args.max_gap)
+    report = asyncio.run(runner.run())
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Cold storage for idle sessions.
+
+Sessions without activity for ARCHIVE_IDLE_DAYS move out of chat_message
+into chat_archive, one compressed blob per (user, session) holding all its
+modes. chat_session keeps their counts and names, so they are still listed,
+and the first history read or chat turn rehydrates them. Archived sessions
+idle past RETENTION_DAYS are deleted.
+
+    python -m src.llms.archive --idle-days 30 --retention-days 365
+"""
+import argparse
+import logging
+import sqlite3
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import orjson
+import zstandard
+
+from src.llms.memory import MemoryManagement
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_utils import once_per_database, retry_on_lock
+from src.llms.utils.db_exceptions import DatabaseConnectionError, DatabaseQueryError
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = "ID, session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 9)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+class SessionArchive:
+    """Move idle sessions to chat_archive and back, and apply retention"""
+
+    def __init__(self, db_config: DatabaseConfig = None, codec: str = None):
+        self.db_config = db_config or DatabaseConfig()
+        self.codec = codec or config.archive_codec
+        self._init_database()
+
+    @once_per_database
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def _init_database(self):
+        """Create archive table on every shard, once per process"""
+        try:
+            for shard in self.db_config.shards():
+                with shard.get_connection() as conn:
+                    self._create_table(conn)
+        except sqlite3.Error as e:
+            raise DatabaseConnectionError(f"Can't initialize archive table: {e}")
+
+    @staticmethod
+    def _create_table(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_archive(
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                last_activity DATETIME,
+                archived_at DATETIME NOT NULL,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (user_id, session_id)
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_archive_activity ON chat_archive (last_activity)
+        """)
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def archive_idle(self, idle_days: float = None, limit: int = None) -> int:
+        """Archive up to limit sessions of this shard idle for idle_days, returns sessions archived"""
+        idle_days = idle_days if idle_days is not None else config.archive_idle_days
+        limit = limit or config.archive_batch_sessions
+        cutoff = (datetime.now() - timedelta(days=idle_days)).isoformat()
+        now = datetime.now().isoformat()
+        archived = 0
+        try:
+            with self.db_config.get_connection() as conn:
+                # Read and delete in one write transaction, a message written in between would be lost
+                conn.execute("BEGIN IMMEDIATE")
+                # Skip sessions where another mode is still active, the temp B-tree holds at most limit rows
+                candidates = conn.execute("""
+                    SELECT DISTINCT user_id, session_id FROM chat_session AS idle
+                    WHERE archived_at IS NULL AND updated_at < ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM chat_session AS active
+                        WHERE active.user_id = idle.user_id AND active.session_id = idle.session_id
+                        AND active.updated_at >= ?
+                    )
+                    LIMIT ? -- plan-check: allow temp b-tree
+                """, (cutoff, cutoff, limit)).fetchall()
+                for user_id, session_id in candidates:
+                    latest = conn.execute("""
+                        SELECT MAX(updated_at) FROM chat_session WHERE user_id = ? AND session_id = ?
+                    """, (user_id, session_id)).fetchone()[0]
+                    rows = conn.execute(f"""
+                        SELECT {_COLUMNS} FROM chat_message WHERE user_id = ? AND session_id = ?
+                    """, (user_id, session_id)).fetchall()
+                    self._archive(conn, user_id, session_id, rows, latest, now)
+                    archived += 1
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to archive sessions: {e}")
+        if archived:
+            logger.info("Archived idle sessions", extra={"sessions": archived, "idle_days": idle_days})
+        return archived
+
+    def _archive(self, conn, user_id: str, session_id: str, rows: List[tuple], latest: str, now: str):
+        data = compress(orjson.dumps(rows), self.codec)
+        conn.execute("""
+            INSERT INTO chat_archive (user_id, session_id, message_count, last_activity, archived_at, codec, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, session_id) DO UPDATE SET
+                message_count = excluded.message_count, last_activity = excluded.last_activity,
+                archived_at = excluded.archived_at, codec = excluded.codec, data = excluded.data
+        """, (user_id, session_id, len(rows), latest, now, self.codec, data))
+        activity = conn.execute("""
+            SELECT mode, updated_at, last_message_id FROM chat_session WHERE user_id = ? AND session_id = ?
+        """, (user_id, session_id)).fetchall()
+        conn.execute("DELETE FROM chat_message WHERE user_id = ? AND session_id = ?", (user_id, session_id))
+        # The delete trigger counted the messages down and cleared their activity, archived messages still count
+        counts = self._mode_counts(rows)
+        conn.executemany("""
+            UPDATE chat_session SET message_count = message_count + ?, updated_at = ?, last_message_id = ?
+            WHERE user_id = ? AND session_id = ? AND mode = ?
+        """, [(counts[mode], updated_at, last_message_id, user_id, session_id, mode)
+              for mode, updated_at, last_message_id in activity])
+        conn.execute("""
+            UPDATE chat_session SET archived_at = ? WHERE user_id = ? AND session_id = ?
+        """, (now, user_id, session_id))
+
+    @staticmethod
+    def _mode_counts(rows: List[tuple]) -> Counter:
+        return Counter(row[3] for row in rows)
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def rehydrate(self, user_id: str, session_id: str) -> bool:
+        """Move an archived session back into chat_message, False when it isn't archived"""
+        query = "SELECT codec, data FROM chat_archive WHERE user_id = ? AND session_id = ?"
+        try:
+            with self.db_config.for_user(user_id).get_connection() as conn:
+                # Almost always not archived, checked without taking the write lock
+                if conn.execute(query, (user_id, session_id)).fetchone() is None:
+                    return False
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(query, (user_id, session_id)).fetchone()
+                if row is None:
+                    return False  # Rehydrated by another request meanwhile
+                rows = [tuple(message) for message in orjson.loads(decompress(row[1], row[0]))]
+                # Take the archived messages out of the counts, the insert trigger adds them back
+                conn.executemany("""
+                    UPDATE chat_session SET message_count = message_count - ?
+                    WHERE user_id = ? AND session_id = ? AND mode = ?
+                """, [(count, user_id, session_id, mode) for mode, count in self._mode_counts(rows).items()])
+                conn.executemany(f"""
+                    INSERT OR IGNORE INTO chat_message ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                conn.execute("""
+                    UPDATE chat_session SET archived_at = NULL WHERE user_id = ? AND session_id = ?
+                """, (user_id, session_id))
+                conn.execute("DELETE FROM chat_archive WHERE user_id = ? AND session_id = ?", (user_id, session_id))
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to rehydrate session: {e}")
+        logger.info("Rehydrated archived session", extra={"session_id": session_id, "messages": len(rows)})
+        return True
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def purge(self, retention_days: float = None, limit: int = None) -> int:
+        """Delete up to limit archived sessions of this shard idle for retention_days, returns sessions deleted"""
+        retention_days = retention_days if retention_days is not None else config.retention_days
+        if retention_days <= 0:
+            return 0
+        limit = limit or config.archive_batch_sessions
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")  # A session rehydrated meanwhile must not lose its chat_session rows
+                sessions: List[Tuple[str, str]] = conn.execute("""
+                    SELECT user_id, session_id FROM chat_archive WHERE last_activity < ? LIMIT ?
+                """, (cutoff, limit)).fetchall()
+                conn.executemany("DELETE FROM chat_archive WHERE user_id = ? AND session_id = ?", sessions)
+                conn.executemany("DELETE FROM chat_session WHERE user_id = ? AND session_id = ?", sessions)
+                conn.executemany("""
+                    DELETE FROM chat_summary WHERE session_id = ? AND user_id = ?
+                """, [(session_id, user_id) for user_id, session_id in sessions])
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to delete archived sessions: {e}")
+        if sessions:
+            logger.info("Deleted expired sessions", extra={"sessions": len(sessions), "retention_days": retention_days})
+        return len(sessions)
+
+    def run(self, idle_days: float = None, retention_days: float = None) -> dict:
+        """Archive and purge in batches until nothing is left to do, on all shards at once"""
+        totals = {"archived": 0, "deleted": 0}
+        if len(self.db_config.shards()) > 1:
+            for shard_totals in self.db_config.fan_out(
+                    lambda shard: SessionArchive(shard, self.codec).run(idle_days, retention_days)):
+                for key, value in shard_totals.items():
+                    totals[key] += value
+            return totals
+        while True:
+            archived = self.archive_idle(idle_days)
+            totals["archived"] += archived
+            if archived == 0:
+                break
+        while True:
+            deleted = self.purge(retention_days)
+            totals["deleted"] += deleted
+            if deleted == 0:
+                break
+        return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle sessions and delete expired ones")
+    parser.add_argument("--db", help="Database path, CHAT_DB_PATH or chat_history.db by default")
+    parser.add_argument("--idle-days", type=float, help="Defaults to ARCHIVE_IDLE_DAYS")
+    parser.add_argument("--retention-days", type=float, help="Defaults to RETENTION_DAYS, 0 keeps archived sessions")
+    args = parser.parse_args()
+    db_config = DatabaseConfig(args.db)
+    for shard in db_config.shards():
+        MemoryManagement(db_config=shard)  # chat_message and chat_session
+    print(SessionArchive(db_config).run(args.idle_days, args.retention_days))
+
+
+if __name__ == "__main__":
+    main()
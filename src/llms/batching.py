@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+
+class SummaryBatcher:
+    """
+    Collect summary calls from concurrent sessions into bounded micro-batches.
+
+    Callers block in submit() until their batch runs. A batch is sent when it
+    reaches max_batch_size or max_wait seconds after its first call, whichever
+    comes first. All chains in a batch are built from the same summary prompt
+    and model, so the first one runs the whole batch.
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait: float = 0.05):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Runnable, Any, Optional[dict], Future]] = []
+        self._timer: threading.Timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, chain: Runnable, inputs: Any, config: dict = None):
+        """Queue one summary call and wait for its result, config (e.g. callbacks) applies to this call only"""
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((chain, inputs, config, future))
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_wait, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run(batch)
+        return future.result()
+
+    def _take(self):
+        """Detach the pending batch, caller must hold the lock"""
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch):
+        chain = batch[0][0]
+        try:
+            results = chain.batch(
+                [inputs for _, inputs, _, _ in batch],
+                config=[dict(config or {}, max_concurrency=self.max_batch_size) for _, _, config, _ in batch],
+                return_exceptions=True,
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, _, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
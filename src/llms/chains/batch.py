@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Tuple
+
+from langchain_core.runnables import RunnableLambda
+from langchain_core.language_models import BaseChatModel
+
+from src.llms.chains.chain import ChainManagement
+from src.llms.batching import SummaryBatcher
+from src.llms.utils.group_commit import GroupCommitWriter
+
+logger = logging.getLogger(__name__)
+
+class BatchChatRunner:
+    """
+    Run many chat turns concurrently and yield each result as it finishes.
+
+    Items are grouped by (user_id, session_id, mode). Turns of one session run
+    in order because each depends on the history written by the previous one,
+    while different sessions run concurrently through the runnable's abatch
+    under max_concurrency. New messages are group committed by a shared writer
+    and summary calls share a micro-batcher across sessions.
+
+    A result is yielded only after the writer flushed its messages, turns
+    that finished meanwhile share that flush. If it fails, their messages are
+    dropped and they are yielded as the flush error instead.
+    """
+
+    def __init__(self, model: BaseChatModel, max_concurrency: int = 8, writer: GroupCommitWriter = None,
+                 summary_batcher: SummaryBatcher = None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.writer = writer or GroupCommitWriter()
+        self.summary_batcher = summary_batcher or SummaryBatcher()
+
+    async def run(self, items: List[dict]) -> AsyncIterator[Tuple[int, object]]:
+        """Yield (index, response or exception) for every item"""
+        groups: Dict[Tuple[str, str, str], List[Tuple[int, dict]]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault((item["user_id"], item["session_id"], item["mode"]), []).append((index, item))
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run_group(group):
+            for position, (index, item) in enumerate(group):
+                try:
+                    result = await self._run_item(item, follows_previous=position > 0)
+                except Exception as e:
+                    result = e
+                await queue.put((index, result))
+
+        runnable = RunnableLambda(run_group)
+        task = asyncio.create_task(
+            runnable.abatch(list(groups.values()), config={"max_concurrency": self.max_concurrency})
+        )
+        unsaved = set()  # Sessions that lost messages, their later turns are unsaved too
+        try:
+            reported = 0
+            while reported < len(items):
+                ready = [await queue.get()]
+                while not queue.empty():
+                    ready.append(queue.get_nowait())
+                try:
+                    await asyncio.to_thread(self.writer.flush)
+                except Exception as e:
+                    logger.exception("Group commit of batch results failed")
+                    unsaved.update(self._session(items[index]) for index, _ in ready
+                                   if self.writer.pending_count(*self._session(items[index])))
+                    error = e
+                else:
+                    error = None
+                for index, result in ready:
+                    session = self._session(items[index])
+                    if session in unsaved and not isinstance(result, Exception):
+                        self.writer.discard(*session)
+                        result = error or RuntimeError("Messages of an earlier turn in this session were not saved")
+                    yield index, result
+                reported += len(ready)
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                # Keep the messages of turns that finished before the client went away
+                try:
+                    await asyncio.to_thread(self.writer.flush)
+                except Exception:
+                    logger.exception("Group commit of batch results failed")
+
+    @staticmethod
+    def _session(item: dict) -> Tuple[str, str, str]:
+        return item["session_id"], item["user_id"], item["mode"]
+
+    async def _run_item(self, item: dict, follows_previous: bool = False):
+        if follows_previous and self.writer.pending_count(item["session_id"], item["user_id"], item["mode"]):
+            # The previous turn of this session must be visible before loading history
+            await asyncio.to_thread(self.writer.flush)
+
+        chain = ChainManagement(
+            mode=item["mode"],
+            session_id=item["session_id"],
+            user_id=item["user_id"],
+            model=self.model,
+            writer=self.writer,
+            summary_batcher=self.summary_batcher,
+        )
+        return await chain.ainvoke(item["message"])
@@ -1,16 +1,31 @@
-from langchain_core.runnables import RunnableWithMessageHistory
+from langchain_core.runnables import RunnableWithMessageHistory, RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate
 from src.llms.memory import MemoryManagement, SummaryMemory
-from langchain.chat_models import BaseChatModel
-from langchain_core.messages.chat import ChatMessage
+from src.llms.archive import SessionArchive
+from src.llms.batching import SummaryBatcher
+from src.llms.prewarm import SUMMARY_WINDOW, get_context_cache, session_state
+from src.llms.prompts.registry import SYSTEM_PROMPT_FILE, load_prompt_file
+from src.llms.usage import usage_config
+from src.llms.utils.group_commit import GroupCommitWriter
+from src.utils.timing import StageTimer
+from src.utils import metrics
+from src.utils.profiling import maybe_profile
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
 from langchain_core.output_parsers import StrOutputParser
 import yaml
+import asyncio
+import logging
+import time
 from pathlib import Path
 from typing import Literal
 
+logger = logging.getLogger(__name__)
+
 class ChainManagement():
     def __init__(self, mode:Literal['consultant', 'docs_writer'] =None, session_id:str = None, user_id:str = None,  
-                 template_filepath:str = None, model:BaseChatModel = None):
+                 template_filepath:str = None, model:BaseChatModel = None,
+                 writer: GroupCommitWriter = None, summary_batcher: SummaryBatcher = None):
 
         # Input validation
         if not session_id or not isinstance(session_id, str):
@@ -23,7 +38,7 @@ class ChainManagement():
             raise ValueError("model cannot be None")
 
         if template_filepath is None:
-            self.filepath = Path(__file__).parent.parent / "utils" / "system_prompt.yaml"
+            self.filepath = SYSTEM_PROMPT_FILE
         else:
             self.filepath = Path(template_filepath)
 
@@ -32,15 +47,17 @@ class ChainManagement():
         self.mode = mode
         self.session_id = session_id
         self.user_id = user_id
+        self.writer = writer
+        self.summary_batcher = summary_batcher
+        self.timer = StageTimer()  # Seconds spent per stage of the last invoke
+        self._history = None  # Prompt history of a pre-warmed context for get_session_history
         self.system_prompt = self._load_template_prompt()
 
     def _load_template_prompt(self):
         """load template for specific mode, e.g. consultant, docs writer"""
 
         try:
-            with open(self.filepath, 'r', encoding="utf-8") as f:
-                all_prompts = yaml.safe_load(f)
-                return  all_prompts.get("system_prompt", {})
+            return load_prompt_file(str(self.filepath)).get("system_prompt", {})
         except FileNotFoundError:
             raise ValueError("Unable to load file with path: ",self.filepath)
         except yaml.YAMLError as e:
@@ -65,50 +82,78 @@ class ChainManagement():
             raise ValueError(f"Mode '{self.mode}' not found in system prompts")
         
     def get_session_history(self, session_id: str):
-        print(f"DEBUG: get_session_history called with session_id={session_id}", flush=True)
-        memory = MemoryManagement(session_id=session_id, user_id=self.user_id, mode=self.mode)
-        memory.get_messages()
-        print(f"DEBUG: Loaded {len(memory.message)} messages from history", flush=True)
-        print(f"DEBUG: Returning memory object of type: {type(memory)}", flush=True)
+        with self.timer.stage("context"):
+            memory = MemoryManagement(session_id=session_id, user_id=self.user_id, mode=self.mode, writer=self.writer)
+            if self._history is not None:
+                memory.message = list(self._history)
+            else:
+                memory.get_messages()
+        memory.timer = self.timer
+        logger.debug("Loaded session history", extra={"messages": len(memory.message)})
         return memory
 
-    def invoke(self, user_input):
+    def _render_prompt(self, variables):
+        """Render the prompt, timed as the prompt stage"""
+        with self.timer.stage("prompt"):
+            return self._prompt.invoke(variables)
+
+    def _call_model(self, prompt_value, config=None):
+        """Stream the chat model response, timed as the model stage with time to first token"""
+        with self.timer.stage("model"):
+            start = time.perf_counter()
+            message = None
+            for chunk in self.model._chat_model.stream(prompt_value, config=config):
+                if message is None:
+                    self.timer.mark("model_first_token", time.perf_counter() - start)
+                    message = chunk
+                else:
+                    message += chunk
+            # A stream without chunks is an empty answer
+            return message if message is not None else AIMessage(content="")
 
-        memory_mng = SummaryMemory(session_id=self.session_id, user_id=self.user_id, mode=self.mode, window=10)
-        last_message_count = memory_mng._get_message_count()
-        exsisting_summary = memory_mng._get_existing_summary()
-        # Fix: Don't filter by role, get all messages
-        window_message = memory_mng.get_window_message(window=10, order="DESC", mode=self.mode)
-
-        formatted_window = []                                 
-        for message in window_message:
-            role = getattr(message, 'role', None)
-            content = getattr(message, 'content', None)
-            additional_kwargs = getattr(message, 'additional_kwargs', {})
-            message = ChatMessage(
-                role = role,
-                content = content,
-                additional_kwargs=additional_kwargs
-            )
-            formatted_window.append(message)
+    def invoke(self, user_input):
+        # Opt-in cProfile capture of the whole turn, see src/utils/profiling.py
+        with maybe_profile(session_id=self.session_id, user_id=self.user_id, mode=self.mode):
+            return self._invoke(user_input)
+
+    def _invoke(self, user_input):
+        self.timer = StageTimer()
+        started = time.perf_counter()
+
+        with self.timer.stage("context"):
+            memory_mng = SummaryMemory(session_id=self.session_id, user_id=self.user_id, mode=self.mode,
+                                       window=SUMMARY_WINDOW, writer=self.writer, batcher=self.summary_batcher)
+            # Context pre-warmed by opening the session, see src/llms/prewarm.py. Group committed
+            # turns have unflushed messages the session version doesn't reflect, they load cold.
+            context = None
+            if self.writer is None:
+                context = get_context_cache().take((self.user_id, self.session_id, self.mode),
+                                                   lambda: session_state(memory_mng)[0])
+            # None also when the session was too long to keep, get_session_history reads it then
+            self._history = context.history if context is not None else None
+            if context is not None:
+                last_message_count = context.message_count
+                exsisting_summary = context.summary
+                window_message = context.window
+            else:
+                SessionArchive(memory_mng.db_config).rehydrate(self.user_id, self.session_id)
+                last_message_count = memory_mng._get_message_count()
+                exsisting_summary = memory_mng._get_existing_summary()
+                # Fix: Don't filter by role, get all messages. Records, converted by the summary call if it runs
+                window_message = memory_mng.get_window_message(window=SUMMARY_WINDOW, order="DESC", mode=self.mode)
 
         combine_summary = None
-        if window_message and memory_mng.window is not None:
-            if last_message_count - exsisting_summary['last_message_count'] > memory_mng.window:
-                recent_summary = memory_mng.generat_summary(window_messages=formatted_window)
-                combine_summary = memory_mng.merge_summary(exsisting_summary['summary'], recent_summary)
-                memory_mng._save_summary_to_storage(combine_summary, last_message_count+memory_mng.window)
-        
-        history = []
-        if combine_summary:
-            history.append(ChatMessage(content=combine_summary, role=self.mode))
-        elif exsisting_summary:
-            history.append(ChatMessage(content=exsisting_summary['summary'], role=self.mode))
-
-        history.extend(formatted_window)
-
-        prompt = self._create_prompt_template()
-        chain = prompt | self.model._chat_model | self.parser
+        with self.timer.stage("summary"):
+            if window_message and memory_mng.window is not None:
+                if last_message_count - exsisting_summary['last_message_count'] > memory_mng.window:
+                    recent_summary = memory_mng.generat_summary(window_messages=window_message)
+                    metrics.SUMMARIES_GENERATED.labels(self.mode).inc()
+                    combine_summary = memory_mng.merge_summary(exsisting_summary['summary'], recent_summary)
+                    memory_mng._save_summary_to_storage(combine_summary, last_message_count+memory_mng.window)
+
+        with self.timer.stage("prompt"):
+            self._prompt = self._create_prompt_template()
+        chain = RunnableLambda(self._render_prompt) | RunnableLambda(self._call_model) | self.parser
 
         chain_with_history = RunnableWithMessageHistory(
             chain,
@@ -124,29 +169,32 @@ class ChainManagement():
         # Get the response from the chain
         response = chain_with_history.invoke(
             variables,
-            config={"configurable": {"session_id": self.session_id}})
-        
-        print(f"DEBUG: Got response: {response}")
-        
+            config={"configurable": {"session_id": self.session_id},
+                    **usage_config(self.user_id, self.session_id, self.mode, "chat")})
+
         # Check if this is the first exchange for session naming
+        with self.timer.stage("title"):
+            self._update_session_name(user_input)
+
+        metrics.observe_turn(self.mode, time.perf_counter() - started, self.timer.stages, self.timer.marks)
+        return response
+
+    def _update_session_name(self, user_input):
+        """Name the session after its first exchange"""
         try:
-            memory = MemoryManagement(session_id=self.session_id, user_id=self.user_id, mode=self.mode)
+            memory = MemoryManagement(session_id=self.session_id, user_id=self.user_id, mode=self.mode, writer=self.writer)
             message_count = memory._get_message_count()
-            print(f"DEBUG: Message count after exchange: {message_count}")
 
             # Only generate session name if not already set (i.e., still 'New Chat' or empty)
             current_session_name = memory.get_session_name(self.session_id, self.user_id, self.mode)
-            print(f"DEBUG: Current session name: {current_session_name}")
             if message_count == 2 and (not current_session_name or current_session_name == "New Chat"):
-                print(f"DEBUG: First exchange completed, generating session name...")
                 summary_memory = SummaryMemory(session_id=self.session_id, user_id=self.user_id, mode=self.mode)
                 session_name = summary_memory.generate_session_name(user_input)
-                print(f"DEBUG: Generated session name: {session_name}")
                 memory.update_session_name(session_name)
-                print(f"DEBUG: Updated session name to: {session_name}")
-        except Exception as name_error:
-            print(f"DEBUG ERROR: Failed to process session name: {name_error}")
-            import traceback
-            traceback.print_exc()
-        
-        return response
\ No newline at end of file
+                logger.debug("Session named after first exchange", extra={"session_name": session_name})
+        except Exception:
+            logger.exception("Failed to process session name")
+
+    async def ainvoke(self, user_input):
+        """Run invoke in a worker thread so many turns can progress concurrently"""
+        return await asyncio.to_thread(self.invoke, user_input)
@@ -0,0 +1,137 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Literal, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeModelError(Exception):
+    """Injected failure of the fake chat model"""
+    pass
+
+
+_VOCABULARY = (
+    "university admission application deadline scholarship program master bachelor profile "
+    "transcript recommendation letter motivation statement research proposal ielts toefl gre "
+    "visa country germany canada australia tuition funding requirement interview portfolio "
+    "the a your and to of for with we can you should consider next step"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic local chat model for offline load tests and benchmarks.
+
+    Drop-in for ModelManagement._chat_model: same invoke/stream interface, no
+    network. Latency, streaming speed and failures are configurable. Response
+    text is seeded from the prompt, so a replayed workload gets the same
+    answers. Delay and failure are drawn per call from a sequence seeded with
+    seed, so error_rate is a per-call probability and a retry can succeed.
+    """
+
+    latency: float = 0.5
+    """Mean seconds before the first token"""
+    latency_distribution: Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    latency_sigma: float = 0.5
+    """Spread of the lognormal distribution, uniform draws use latency * (1 +/- sigma)"""
+    tokens_per_second: float = 50.0
+    """Streaming speed after the first token, 0 disables the delay"""
+    response_tokens: int = 60
+    error_rate: float = 0.0
+    """Fraction of calls that raise FakeModelError"""
+    seed: int = 0
+
+    _calls: Optional[random.Random] = PrivateAttr(default=None)
+    _calls_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        prompt = "\n".join(str(message.content) for message in messages)
+        return random.Random(f"{self.seed}:{prompt}")
+
+    def _call_rng(self) -> random.Random:
+        """Generator of one call, the next from a sequence seeded with seed"""
+        with self._calls_lock:
+            if self._calls is None:
+                self._calls = random.Random(self.seed)
+            return random.Random(self._calls.getrandbits(64))
+
+    def _first_token_delay(self, rng: random.Random) -> float:
+        if self.latency_distribution == "fixed" or self.latency <= 0:
+            return max(self.latency, 0.0)
+        if self.latency_distribution == "uniform":
+            return rng.uniform(self.latency * (1 - self.latency_sigma), self.latency * (1 + self.latency_sigma))
+        # Lognormal with the configured mean
+        mu = math.log(self.latency) - self.latency_sigma ** 2 / 2
+        return rng.lognormvariate(mu, self.latency_sigma)
+
+    def _plan(self, messages: List[BaseMessage]):
+        """Draw delay, failure and response tokens for one call"""
+        call_rng = self._call_rng()
+        delay = self._first_token_delay(call_rng)
+        failed = call_rng.random() < self.error_rate
+        rng = self._rng(messages)
+        tokens = [rng.choice(_VOCABULARY) for _ in range(self.response_tokens)]
+        return delay, failed, tokens
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _usage(self, messages: List[BaseMessage], tokens: List[str]) -> dict:
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": len(tokens), "total_tokens": input_tokens + len(tokens)}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, failed, tokens = self._plan(messages)
+        time.sleep(delay + self._token_delay() * max(len(tokens) - 1, 0))
+        if failed:
+            raise FakeModelError("Injected fake model failure")
+        message = AIMessage(content=" ".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, failed, tokens = self._plan(messages)
+        await asyncio.sleep(delay + self._token_delay() * max(len(tokens) - 1, 0))
+        if failed:
+            raise FakeModelError("Injected fake model failure")
+        message = AIMessage(content=" ".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages: List[BaseMessage], tokens: List[str]) -> Iterator[ChatGenerationChunk]:
+        for index, token in enumerate(tokens):
+            text = token if index == 0 else " " + token
+            usage = self._usage(messages, tokens) if index == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        delay, failed, tokens = self._plan(messages)
+        time.sleep(delay)
+        if failed:
+            raise FakeModelError("Injected fake model failure")
+        for index, chunk in enumerate(self._chunks(messages, tokens)):
+            if index:
+                time.sleep(self._token_delay())
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        delay, failed, tokens = self._plan(messages)
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeModelError("Injected fake model failure")
+        for index, chunk in enumerate(self._chunks(messages, tokens)):
+            if index:
+                await asyncio.sleep(self._token_delay())
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
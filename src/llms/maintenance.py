@@ -0,0 +1,263 @@
+"""
+Background SQLite maintenance: PRAGMA optimize, WAL checkpoints and
+incremental vacuum, run by MaintenanceScheduler in low-traffic windows.
+
+Every task is time-boxed with a progress handler and works in short
+transactions, so a live writer waits at most one small step. Each run
+reports file sizes, freelist pages and the duration of every task. With
+CHAT_DB_SHARDS the scheduler maintains each shard file in turn.
+
+A database created before auto_vacuum was enabled needs one full VACUUM,
+which blocks writers, before incremental vacuum can free pages:
+
+    python -m src.llms.maintenance --enable-auto-vacuum
+    python -m src.llms.maintenance            # one maintenance run now
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum values
+_AUTO_VACUUM = {0: "none", 1: "full", 2: "incremental"}
+
+
+class TaskTimeout(Exception):
+    """A maintenance task ran out of its time box"""
+
+
+def parse_hours(text: str) -> Optional[set]:
+    """Hours of "1-5,23" as a set, None when text is empty (any hour)"""
+    if not text.strip():
+        return None
+    hours = set()
+    for part in text.split(","):
+        start, _, end = part.strip().partition("-")
+        start = int(start)
+        end = int(end) if end else start
+        hour = start
+        while True:
+            hours.add(hour % 24)
+            if hour % 24 == end % 24:
+                break
+            hour += 1
+    return hours
+
+
+def requests_in_flight() -> float:
+    """API requests all workers are serving right now, maintenance runs in one of them"""
+    return metrics.requests_in_flight()
+
+
+class DatabaseMaintenance:
+    """Time-boxed maintenance tasks on one database file"""
+
+    def __init__(self, db_config: DatabaseConfig = None, task_seconds: float = None, vacuum_pages: int = None,
+                 wal_truncate_mb: float = None):
+        self.db_config = db_config or DatabaseConfig()
+        self.task_seconds = task_seconds if task_seconds is not None else config.maintenance_task_seconds
+        self.vacuum_pages = vacuum_pages or config.maintenance_vacuum_pages
+        self.wal_truncate_bytes = (wal_truncate_mb if wal_truncate_mb is not None
+                                   else config.maintenance_wal_truncate_mb) * 1024 * 1024
+
+    def _time_box(self, conn):
+        deadline = time.perf_counter() + self.task_seconds
+        # A non-zero return interrupts the running statement
+        conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+        return deadline
+
+    def file_stats(self) -> dict:
+        path = str(self.db_config.db_path)
+        with self.db_config.get_connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        return {
+            "file_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+            "wal_bytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0,
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_pages": freelist,
+            "auto_vacuum": _AUTO_VACUUM.get(auto_vacuum, str(auto_vacuum)),
+            "journal_mode": journal_mode,
+        }
+
+    def optimize(self) -> dict:
+        """PRAGMA optimize, which runs ANALYZE on tables whose statistics are stale"""
+        with self.db_config.get_connection() as conn:
+            self._time_box(conn)
+            conn.execute("PRAGMA analysis_limit = 1000")  # Sample indexes instead of reading them whole
+            conn.execute("PRAGMA optimize")
+        return {}
+
+    def checkpoint(self) -> dict:
+        """Passive WAL checkpoint, truncating the WAL once it grew past the threshold"""
+        wal_path = str(self.db_config.db_path) + "-wal"
+        wal_bytes = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        mode = "TRUNCATE" if wal_bytes > self.wal_truncate_bytes else "PASSIVE"
+        with self.db_config.get_connection() as conn:
+            self._time_box(conn)
+            # TRUNCATE waits for readers through the busy handler, keep that short as well
+            conn.execute(f"PRAGMA busy_timeout = {int(self.task_seconds * 1000)}")
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return {"mode": mode, "busy": bool(busy), "log_frames": log_frames, "checkpointed_frames": checkpointed}
+
+    def incremental_vacuum(self) -> dict:
+        """Return free pages to the file system in small steps until the time box ends"""
+        freed = 0
+        with self.db_config.get_connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return {"skipped": "auto_vacuum is not incremental"}
+            deadline = self._time_box(conn)
+            while time.perf_counter() < deadline:
+                before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if before == 0:
+                    break
+                # Each step is its own short write transaction
+                conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+                conn.commit()
+                freed += before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                raise TaskTimeout(f"freed {freed} pages")
+        return {"freed_pages": freed}
+
+    def run(self, tasks: List[str] = ("optimize", "incremental_vacuum", "checkpoint")) -> dict:
+        """
+        Run tasks one after another and report their outcome and the file statistics.
+        The checkpoint comes last so pages freed by the vacuum reach the file in the same run.
+        """
+        started = time.perf_counter()
+        report = {"db_path": str(self.db_config.db_path), "started_at": datetime.now().isoformat(),
+                  "before": self.file_stats(), "tasks": {}}
+        for task in tasks:
+            task_started = time.perf_counter()
+            try:
+                result = getattr(self, task)()
+                outcome = "skipped" if "skipped" in result else "ok"
+            except TaskTimeout as e:
+                result, outcome = {"detail": str(e)}, "timeout"
+            except sqlite3.OperationalError as e:
+                # "interrupted" from the progress handler, "database is locked" from a busy writer
+                result = {"detail": str(e)}
+                outcome = "timeout" if "interrupted" in str(e) else "busy"
+            seconds = time.perf_counter() - task_started
+            metrics.MAINTENANCE_SECONDS.labels(task, outcome).observe(seconds)
+            report["tasks"][task] = {"outcome": outcome, "seconds": round(seconds, 4), **result}
+
+        after = report["after"] = self.file_stats()
+        report["seconds"] = round(time.perf_counter() - started, 4)
+        shard = str(self.db_config.shard_index)
+        metrics.DB_FILE_BYTES.labels("db", shard).set(after["file_bytes"])
+        metrics.DB_FILE_BYTES.labels("wal", shard).set(after["wal_bytes"])
+        metrics.DB_FREELIST_PAGES.labels(shard).set(after["freelist_pages"])
+        logger.info("Database maintenance finished", extra={"report": report})
+        return report
+
+    def enable_auto_vacuum(self):
+        """Switch an existing database to incremental auto_vacuum, a full VACUUM that blocks writers"""
+        with self.db_config.get_connection() as conn:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.commit()
+            conn.execute("VACUUM")
+
+
+class MaintenanceScheduler:
+    """
+    Run DatabaseMaintenance every interval seconds on a daemon thread, but
+    only inside the allowed hours and while few API requests are in flight.
+    Without a maintenance given, every shard of the default database is maintained.
+    """
+
+    def __init__(self, maintenance: DatabaseMaintenance = None, interval: float = None, hours: str = None,
+                 max_in_flight: int = None, in_flight: Callable[[], float] = requests_in_flight):
+        self.maintenances = [maintenance] if maintenance else [DatabaseMaintenance(shard)
+                                                               for shard in DatabaseConfig().shards()]
+        self.interval = interval if interval is not None else config.maintenance_interval
+        self.hours = parse_hours(hours if hours is not None else config.maintenance_hours)
+        self.max_in_flight = max_in_flight if max_in_flight is not None else config.maintenance_max_in_flight
+        self.in_flight = in_flight
+        self.reports = deque(maxlen=20 * len(self.maintenances))
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def is_quiet(self, now: datetime = None) -> bool:
+        hour = (now or datetime.now()).hour
+        return (self.hours is None or hour in self.hours) and self.in_flight() <= self.max_in_flight
+
+    def run_once(self, force: bool = False) -> Optional[List[dict]]:
+        """One maintenance run with a report per shard, None when skipped because of traffic or time of day"""
+        if not force and not self.is_quiet():
+            logger.debug("Maintenance skipped, not a quiet time")
+            return None
+        reports = []
+        with self._lock:
+            # One shard at a time, so at most one file is being maintained while the app writes
+            for maintenance in self.maintenances:
+                report = maintenance.run()
+                self.reports.append(report)
+                reports.append(report)
+        return reports
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Database maintenance failed")
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=sum(maintenance.task_seconds for maintenance in self.maintenances) * 4)
+            self._thread = None
+
+
+@lru_cache(maxsize=None)
+def get_maintenance_scheduler() -> MaintenanceScheduler:
+    """Process-wide scheduler for the default database"""
+    return MaintenanceScheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SQLite maintenance on the chat database")
+    parser.add_argument("--db", help="Database path, CHAT_DB_PATH or chat_history.db by default")
+    parser.add_argument("--task-seconds", type=float, help="Time box per task, MAINTENANCE_TASK_SECONDS by default")
+    parser.add_argument("--enable-auto-vacuum", action="store_true",
+                        help="Switch to incremental auto_vacuum with one full VACUUM, run while the app is stopped")
+    args = parser.parse_args()
+
+    for shard in DatabaseConfig(args.db).shards():
+        maintenance = DatabaseMaintenance(shard, task_seconds=args.task_seconds)
+        if args.enable_auto_vacuum:
+            maintenance.enable_auto_vacuum()
+        print(json.dumps(maintenance.run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
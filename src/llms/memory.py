@@ -1,33 +1,75 @@
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage
-from langchain_core.messages.chat import ChatMessage
-from typing import List, Literal
-import json, yaml, sqlite3
-from pathlib import Path
+from typing import Iterator, List, Literal, Union
+import json, yaml, sqlite3, logging
+from contextlib import closing
 from datetime import datetime
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from .model import ModelManagement
+from .model import get_model_management
+from .prompts.registry import SUMMARY_PROMPT_FILE, load_prompt_file
+from .batching import SummaryBatcher
+from .records import MessageRecord, decode_kwargs, to_messages
+from .usage import usage_config
+from src.llms.utils.config import config
 from src.llms.utils.db_config import DatabaseConfig
-from src.llms.utils.db_utils import retry_on_lock
+from src.llms.utils.db_instrumentation import ALLOW_FULL_SCAN
+from src.llms.utils.db_utils import once_per_database, retry_on_lock
+from src.llms.utils.sharding import SHARD_ID_BITS
+from src.llms.utils.group_commit import GroupCommitWriter
+from src.utils.timing import StageTimer, stage
 from src.llms.utils.db_exceptions import DatabaseError, DatabaseConnectionError, DatabaseQueryError
 
+logger = logging.getLogger(__name__)
+
+# Secondary indexes of chat_message, bulk imports drop and recreate them
+MESSAGE_INDEXES = {
+    # Serves per-user session listing as well as session reads in time order
+    # without a sort, replacing the older (session_id, user_id, mode) index
+    "idx_user_session_mode_time": "CREATE INDEX IF NOT EXISTS idx_user_session_mode_time "
+                                  "ON chat_message (user_id, session_id, mode, timestamp)",
+    # Delta polls (get_messages_since) in id order without a sort, ids grow while timestamps may not
+    "idx_user_session_mode_id": "CREATE INDEX IF NOT EXISTS idx_user_session_mode_id "
+                                "ON chat_message (user_id, session_id, mode, ID)",
+}
+
+@lru_cache(maxsize=None)
+def fts5_available() -> bool:
+    """Whether this SQLite build has FTS5, probed once per process"""
+    try:
+        with closing(sqlite3.connect(":memory:")) as conn:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(content)")
+        return True
+    except sqlite3.OperationalError as e:
+        logger.warning("Full-text search unavailable", extra={"error": str(e)})
+        return False
+
 class MemoryManagement(BaseChatMessageHistory):
 
-    def __init__(self, session_id: str = None, user_id: str = None, mode: str = "consultant", db_config: DatabaseConfig = None):
+    def __init__(self, session_id: str = None, user_id: str = None, mode: str = "consultant", db_config: DatabaseConfig = None,
+                 writer: GroupCommitWriter = None):
         self.session_id: str = session_id or "default"
         self.user_id: str = user_id or "anonymous"
         self.mode: str = mode or "consultant"
         self.keywords_args: str = None
-        self.message: List[BaseMessage] = []
-        self.db_config = db_config or DatabaseConfig()
+        self.message: List[Union[MessageRecord, BaseMessage]] = []  # Records, langchain messages appended by callers
+        self.db_config = (db_config or DatabaseConfig()).for_user(self.user_id)
+        self.writer = writer  # When set, new messages are buffered and group committed
+        self.timer: StageTimer = None  # Optional per-turn stage timing, set by ChainManagement
         self._init_database()
 
+    @once_per_database
     @retry_on_lock(max_retries=3, delay=0.1)
     def _init_database(self):
-        """Initialize database and create tables"""
+        """Initialize database and create tables, once per process and database file"""
         try:
             with self.db_config.get_connection() as conn:
+                # auto_vacuum only applies to a new file, see src/llms/maintenance.py for existing ones
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute(f"PRAGMA journal_mode = {config.sqlite_journal_mode}").fetchone()
+                # Other workers write while triggers are replaced, they must never see them missing
+                conn.execute("BEGIN IMMEDIATE")
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS chat_message(
                         ID INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,9 +83,15 @@ class MemoryManagement(BaseChatMessageHistory):
                         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
-                conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_session_user_mode ON chat_message (session_id, user_id, mode)
-                """)
+                if self.db_config.shard_index:
+                    # Shards number their messages in separate ranges, so ids stay unique across shards
+                    conn.execute(f"""
+                        INSERT INTO sqlite_sequence (name, seq) SELECT 'chat_message', ?
+                        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'chat_message') -- {ALLOW_FULL_SCAN}
+                    """, (self.db_config.shard_index << SHARD_ID_BITS,))
+                for statement in MESSAGE_INDEXES.values():
+                    conn.execute(statement)
+                conn.execute("DROP INDEX IF EXISTS idx_session_user_mode")
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS chat_summary(
                         ID INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,10 +103,149 @@ class MemoryManagement(BaseChatMessageHistory):
                     )
                 """)
                 conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_session_user_summary ON chat_summary (session_id, user_id)
+                    CREATE INDEX IF NOT EXISTS idx_session_user_summary_time ON chat_summary (session_id, user_id, updated_at)
                 """)
+                conn.execute("DROP INDEX IF EXISTS idx_session_user_summary")
+                self._init_session_table(conn)
+                self._init_search_index(conn)
         except sqlite3.Error as e:
             raise DatabaseConnectionError(f"Can't initialize database: {e}")
+
+    @staticmethod
+    def _init_search_index(conn):
+        """
+        chat_message_fts is an FTS5 index over chat_message (external content, so
+        the text is stored once) kept in sync by triggers, see src/llms/search.py.
+        user_id and mode are indexed to narrow a search to one user's posting lists.
+        Messages written before it existed are indexed at startup, see
+        src.llms.search.rebuild_search_index.
+        """
+        if not fts5_available():
+            return
+        exists = conn.execute("PRAGMA table_info(chat_message_fts)").fetchone()
+        if exists:
+            return
+        conn.execute("""
+            CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+                content, user_id, mode,
+                content='chat_message', content_rowid='ID', tokenize='porter unicode61'
+            )
+        """)
+        # Rank by content only, user_id and mode are filters
+        conn.execute("INSERT INTO chat_message_fts (chat_message_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0, 0.0)')")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+                INSERT INTO chat_message_fts (rowid, content, user_id, mode) VALUES (NEW.ID, NEW.content, NEW.user_id, NEW.mode);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+                INSERT INTO chat_message_fts (chat_message_fts, rowid, content, user_id, mode)
+                VALUES ('delete', OLD.ID, OLD.content, OLD.user_id, OLD.mode);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_chat_message_fts_update AFTER UPDATE OF content, user_id, mode ON chat_message BEGIN
+                INSERT INTO chat_message_fts (chat_message_fts, rowid, content, user_id, mode)
+                VALUES ('delete', OLD.ID, OLD.content, OLD.user_id, OLD.mode);
+                INSERT INTO chat_message_fts (rowid, content, user_id, mode) VALUES (NEW.ID, NEW.content, NEW.user_id, NEW.mode);
+            END
+        """)
+
+    @staticmethod
+    def _init_session_table(conn):
+        """
+        chat_session keeps one row per (user, session, mode) with a version that
+        triggers bump on every message insert, delete or rename. Versions back the
+        ETags of the API; counts and names make session listing a single index read.
+        Archived sessions (see src/llms/archive.py) keep their counts and have archived_at set.
+        chat_user counts every change of a user's chat_session rows, including
+        deleted ones, so unlike the versions it never repeats for the session list.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_session)").fetchall()}
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_session(
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                session_name TEXT,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                last_message_id INTEGER,
+                updated_at DATETIME,
+                version INTEGER NOT NULL DEFAULT 0,
+                archived_at DATETIME,
+                PRIMARY KEY (user_id, session_id, mode)
+            )
+        """)
+        if columns and "archived_at" not in columns:
+            conn.execute("ALTER TABLE chat_session ADD COLUMN archived_at DATETIME")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_session_user_updated ON chat_session (user_id, updated_at)
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_session_idle ON chat_session (archived_at, updated_at)
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_chat_message_insert AFTER INSERT ON chat_message BEGIN
+                INSERT INTO chat_session (user_id, session_id, mode, session_name, message_count, last_message_id, updated_at, version)
+                VALUES (NEW.user_id, NEW.session_id, NEW.mode, NEW.session_name, 1, NEW.ID, NEW.timestamp, 1)
+                ON CONFLICT (user_id, session_id, mode) DO UPDATE SET
+                    session_name = NEW.session_name,
+                    message_count = message_count + 1,
+                    last_message_id = MAX(COALESCE(last_message_id, 0), NEW.ID),
+                    updated_at = MAX(COALESCE(updated_at, ''), NEW.timestamp),
+                    version = version + 1;
+            END
+        """)
+        # Replaced rather than created if missing, older versions of these triggers exist
+        conn.execute("DROP TRIGGER IF EXISTS trg_chat_message_delete")
+        conn.execute("""
+            CREATE TRIGGER trg_chat_message_delete AFTER DELETE ON chat_message BEGIN
+                UPDATE chat_session SET
+                    message_count = message_count - 1,
+                    version = version + 1,
+                    -- Only the newest message moves these back, a whole session is deleted oldest first
+                    last_message_id = CASE WHEN last_message_id = OLD.ID THEN (
+                        SELECT MAX(ID) FROM chat_message
+                        WHERE user_id = OLD.user_id AND session_id = OLD.session_id AND mode = OLD.mode
+                    ) ELSE last_message_id END,
+                    updated_at = CASE WHEN updated_at <= OLD.timestamp THEN (
+                        SELECT MAX(timestamp) FROM chat_message
+                        WHERE user_id = OLD.user_id AND session_id = OLD.session_id AND mode = OLD.mode
+                    ) ELSE updated_at END
+                WHERE user_id = OLD.user_id AND session_id = OLD.session_id AND mode = OLD.mode;
+            END
+        """)
+        # An UPDATE of the session's name touches all its rows, only the first one changes the session
+        conn.execute("DROP TRIGGER IF EXISTS trg_chat_message_rename")
+        conn.execute("""
+            CREATE TRIGGER trg_chat_message_rename AFTER UPDATE OF session_name ON chat_message BEGIN
+                UPDATE chat_session SET session_name = NEW.session_name, version = version + 1
+                WHERE user_id = NEW.user_id AND session_id = NEW.session_id AND mode = NEW.mode
+                AND session_name IS NOT NEW.session_name;
+            END
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_user(
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_chat_session_{event.lower()} AFTER {event} ON chat_session BEGIN
+                    INSERT INTO chat_user (user_id, version) VALUES ({row}.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+                END
+            """)
+        if not columns:
+            # Backfill sessions written before the table existed
+            conn.execute("""
+                INSERT OR IGNORE INTO chat_session
+                (user_id, session_id, mode, session_name, message_count, last_message_id, updated_at, version)
+                SELECT user_id, session_id, mode, session_name, COUNT(*), MAX(ID), MAX(timestamp), 1
+                FROM chat_message GROUP BY user_id, session_id, mode
+            """)
         
     @retry_on_lock(max_retries=3, delay=0.1)
     def get_session_name(self, session_id, user_id, mode=None):
@@ -81,6 +268,9 @@ class MemoryManagement(BaseChatMessageHistory):
     def update_session_name(self, session_name: str):
         """Update session name for all messages in this session with specific mode"""
         try:
+            if self.writer is not None:
+                # Before the UPDATE, which then covers rows a running flush is writing
+                self.writer.rename(self.session_id, self.user_id, self.mode, session_name)
             with self.db_config.get_connection() as conn:
                 conn.execute("""
                     UPDATE chat_message SET session_name = ?
@@ -93,8 +283,8 @@ class MemoryManagement(BaseChatMessageHistory):
     def add_message(self, message: BaseMessage) -> None:
         """Add message to list"""
         try:
-            print(f"DEBUG: add_message called with class={message.__class__.__name__}, content={message.content[:50]}...", flush=True)
-            
+            logger.debug("add_message called", extra={"message_class": message.__class__.__name__})
+
             # Get or infer the role
             role = None
             
@@ -119,26 +309,19 @@ class MemoryManagement(BaseChatMessageHistory):
                     # For any other message type, infer from content or use default
                     role = 'student'  # Default fallback
             
-            # Ensure message has role attribute
-            if not hasattr(message, 'role'):
-                message.role = role
+            # Kept as a record with the resolved role, the message object itself is left alone
+            if not isinstance(message, MessageRecord):
+                message = MessageRecord.from_message(message, role)
             elif not message.role:
                 message.role = role
-            
-            print(f"DEBUG: Message role set to: {message.role}", flush=True)
-            
+
             self.message.append(message)
-            print(f"DEBUG: Message appended to list, now calling save_messages...", flush=True)
-            self.save_messages()
-            print(f"DEBUG: save_messages completed", flush=True)
-            
-        except Exception as e:
-            print(f"ERROR in add_message: {e}", flush=True)
-            print(f"Message class: {message.__class__.__name__}", flush=True)
-            print(f"Message content: {getattr(message, 'content', 'NO CONTENT')}", flush=True)
-            print(f"Message attributes: {dir(message)}", flush=True)
+            with stage(self.timer, "persist"):
+                self.save_messages()
+
+        except Exception:
             # Don't re-raise, just log the error to avoid breaking the chain
-            pass
+            logger.exception("add_message failed", extra={"message_class": message.__class__.__name__})
 
     @retry_on_lock(max_retries=3, delay=0.1)
     def clear(self):
@@ -154,42 +337,121 @@ class MemoryManagement(BaseChatMessageHistory):
 
     @retry_on_lock(max_retries=3, delay=0.1)
     def get_messages(self):
-        """Load chat history of session from database for specific mode"""
+        """Load chat history of session from database for specific mode, replacing the loaded messages"""
         if self.session_id is None or self.user_id is None:
             raise ValueError(f"Session id or user id not given: {self.user_id}")
-        
+        self.message = list(self.iter_messages())
+
+    def iter_messages(self, role: str = None, since: str = None, until: str = None,
+                      read_ahead: int = None) -> Iterator[MessageRecord]:
+        """
+        Messages of the session in time order, read read_ahead rows at a time so
+        a whole history needs constant memory. role, and timestamps since
+        (inclusive) and until (exclusive) filter in SQL. The connection stays
+        open until the iteration finishes or the generator is closed.
+        """
+        filters, params = "", [self.user_id, self.session_id, self.mode]
+        if since is not None:
+            filters += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            filters += " AND timestamp < ?"
+            params.append(until)
+        if role is not None:
+            filters += " AND role = ?"
+            params.append(role)
+        read_ahead = read_ahead or config.history_read_ahead
+        try:
+            # Streaming callers may advance the generator from different threads
+            with self.db_config.get_connection(check_same_thread=False) as conn:
+                # The time range is a range of the session's index entries, ID breaks timestamp ties
+                cursor = conn.execute(f"""
+                    SELECT role, additional_kwargs, content, ID, timestamp FROM chat_message
+                    WHERE user_id = ? AND session_id = ? AND mode = ?{filters}
+                    ORDER BY timestamp ASC, ID ASC
+                """, params)
+                while True:
+                    rows = cursor.fetchmany(read_ahead)
+                    if not rows:
+                        break
+                    # additional_kwargs stays JSON text until read, see src/llms/records.py
+                    for message_role, additional_kwargs, content, message_id, timestamp in rows:
+                        yield MessageRecord(message_role, content, additional_kwargs, message_id, timestamp)
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Error loading chat history: {e}")
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def get_message_page(self, before_id: int = None, limit: int = 50):
+        """
+        One page of the session's messages, newest first, older than the message
+        before_id. Returns (messages, has_more); each message is a dict with its id.
+        """
         try:
             with self.db_config.get_connection() as conn:
+                if before_id is None:
+                    cursor = conn.execute("""
+                        SELECT ID, role, content, additional_kwargs, timestamp FROM chat_message
+                        WHERE user_id = ? AND session_id = ? AND mode = ?
+                        ORDER BY timestamp DESC, ID DESC
+                        LIMIT ?
+                    """, (self.user_id, self.session_id, self.mode, limit + 1))
+                else:
+                    row = conn.execute("""
+                        SELECT timestamp FROM chat_message
+                        WHERE ID = ? AND user_id = ? AND session_id = ? AND mode = ?
+                    """, (before_id, self.user_id, self.session_id, self.mode)).fetchone()
+                    if row is None:
+                        raise ValueError(f"Unknown cursor: {before_id}")
+                    # Keyset on (timestamp, ID), the same order as the index range
+                    cursor = conn.execute("""
+                        SELECT ID, role, content, additional_kwargs, timestamp FROM chat_message
+                        WHERE user_id = ? AND session_id = ? AND mode = ?
+                        AND timestamp <= ? AND (timestamp < ? OR ID < ?)
+                        ORDER BY timestamp DESC, ID DESC
+                        LIMIT ?
+                    """, (self.user_id, self.session_id, self.mode, row[0], row[0], before_id, limit + 1))
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Error loading chat history page: {e}")
+
+        return [self._message_dict(*row) for row in rows[:limit]], len(rows) > limit
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def get_messages_since(self, since_id: int, limit: int = 50):
+        """
+        Messages added after the message since_id, in the order they were added. Returns
+        (messages, has_more); continue from the last id while has_more is true.
+        """
+        try:
+            with self.db_config.get_connection() as conn:
+                # Ordered by ID, ids only grow while stored timestamps may be out of order.
+                # idx_user_session_mode_id seeks past since_id and returns the rows in that order
                 cursor = conn.execute("""
-                    SELECT role, additional_kwargs, content FROM chat_message
-                    WHERE session_id = ? AND user_id = ? AND mode = ?
-                    ORDER BY timestamp ASC
-                """, (self.session_id, self.user_id, self.mode))
-
-                for role, additional_kwargs, content in cursor.fetchall():
-                    try:
-                        additional_kwargs_dict = json.loads(additional_kwargs) if additional_kwargs and additional_kwargs.strip() else {}
-
-                        message = ChatMessage(
-                            content=content,
-                            role=role,
-                            additional_kwargs=additional_kwargs_dict,
-                        )
-                        self.message.append(message)
-                    except json.JSONDecodeError as e:
-                        raise DatabaseQueryError(f"Error parsing message data: {e}")
+                    SELECT ID, role, content, additional_kwargs, timestamp FROM chat_message
+                    WHERE user_id = ? AND session_id = ? AND mode = ? AND ID > ?
+                    ORDER BY ID ASC
+                    LIMIT ?
+                """, (self.user_id, self.session_id, self.mode, since_id, limit + 1))
+                rows = cursor.fetchall()
         except sqlite3.Error as e:
-            raise DatabaseQueryError(f"Error loading chat history: {e}")
+            raise DatabaseQueryError(f"Error loading new messages: {e}")
+        return [self._message_dict(*row) for row in rows[:limit]], len(rows) > limit
+
+    @staticmethod
+    def _message_dict(message_id, role, content, additional_kwargs, timestamp):
+        return {
+            "id": message_id,
+            "role": role,
+            "content": content,
+            "additional_kwargs": decode_kwargs(additional_kwargs),
+            "timestamp": timestamp,
+        }
 
     @retry_on_lock(max_retries=3, delay=0.1)
     def save_messages(self):
         """Save chat history to storage"""
         try:
-            print(f"DEBUG: save_messages called for session_id={self.session_id}, user_id={self.user_id}, mode={self.mode}", flush=True)
-            print(f"DEBUG: Current message list length: {len(self.message)}", flush=True)
-            
             if not self.message:
-                print(f"DEBUG: No messages to save, returning", flush=True)
                 return
             
             latest_message = self.message[-1]
@@ -206,74 +468,118 @@ class MemoryManagement(BaseChatMessageHistory):
                     role = 'consultant' if self.mode == 'consultant' else 'docs_writer'
                 else:
                     role = 'student'  # Safe default
-            
-            print(f"DEBUG: Latest message role: {role}, content: {latest_message.content[:50]}...", flush=True)
-            
+
             if not role or role == 'unknown':
-                print(f"ERROR: Message missing valid role!\n  Class: {latest_message.__class__.__name__}\n  Dir: {dir(latest_message)}\n  Vars: {vars(latest_message) if hasattr(latest_message, '__dict__') else 'no __dict__'}\n  Content: {getattr(latest_message, 'content', None)}", flush=True)
                 # Don't raise error, just use a default role to prevent blocking
+                logger.warning("Message missing valid role, using 'student'",
+                               extra={"message_class": latest_message.__class__.__name__})
                 role = 'student'
-                print(f"DEBUG: Using fallback role: {role}", flush=True)
+
+            if isinstance(latest_message, MessageRecord):
+                additional_kwargs = latest_message.kwargs_json()
+            else:
+                additional_kwargs = json.dumps(getattr(latest_message, 'additional_kwargs', {}))
+            row = (self.session_id, self.user_id, self.mode, self.get_session_name(self.session_id, self.user_id, self.mode), role, additional_kwargs,
+                   latest_message.content, datetime.now().isoformat())
+            if self.writer is not None:
+                self.writer.add(row)
+                return
 
             with self.db_config.get_connection() as conn:
-                print(f"DEBUG: About to insert into database...", flush=True)
                 conn.execute("""
                     INSERT INTO chat_message 
                     (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (self.session_id, self.user_id, self.mode, self.get_session_name(self.session_id, self.user_id, self.mode), role, json.dumps(getattr(latest_message, 'additional_kwargs', {})),
-                       latest_message.content, datetime.now().isoformat()))
-                print(f"DEBUG: Message saved to database successfully", flush=True)
-                
+                """, row)
+            logger.debug("Message saved", extra={"role": role})
+
         except sqlite3.Error as e:
-            print(f"DEBUG: Database error: {e}", flush=True)
             raise DatabaseQueryError(f"Unable to store session in storage: {e}")
-        except Exception as e:
-            print(f"DEBUG: Unexpected error in save_messages: {e}", flush=True)
+        except Exception:
             # Don't raise to avoid breaking the chain
-            pass
+            logger.exception("Unexpected error in save_messages")
 
-    def get_messages_by_role(self, role: str):
-        """Get message by specific role"""
+    def get_messages_by_role(self, role: str, since: str = None, until: str = None):
+        """Stored messages of a specific role, optionally within a time range, read from the database"""
         if role is None:
             raise ValueError("Role is not specified")
-        
-        return [msg for msg in self.message if getattr(msg, 'role', msg.type) == role]
+        return list(self.iter_messages(role=role, since=since, until=until))
     
+    _WINDOW_QUERIES = {
+        order: f"""
+            SELECT role, content, additional_kwargs FROM chat_message
+            WHERE session_id = ? AND user_id = ? AND mode = ?
+            ORDER BY timestamp {order}
+            LIMIT ?
+        """
+        for order in ("ASC", "DESC")
+    }
+
     @retry_on_lock(max_retries=3, delay=0.1)
     def get_window_message(self, window: int = 10, order: Literal['ASC', 'DESC'] = 'DESC', mode:Literal['consultant', 'docs_writer'] = None):
-        """Get k messages from database and return in chat format, filtered by mode."""
+        """Get k messages from database as MessageRecords, filtered by mode."""
         if mode is None:
             mode = self.mode
+        if order not in self._WINDOW_QUERIES:
+            raise ValueError(f"order must be 'ASC' or 'DESC', got: {order}")
         try:
             with self.db_config.get_connection() as conn:
-                cursor = conn.execute(f"""
-                    SELECT role, content, additional_kwargs FROM chat_message 
-                    WHERE session_id = ? AND user_id = ? AND mode = ?
-                    ORDER BY timestamp {order}
-                    LIMIT ?
-                """, (self.session_id, self.user_id, mode, window))
+                cursor = conn.execute(self._WINDOW_QUERIES[order], (self.session_id, self.user_id, mode, window))
                 rows = cursor.fetchall()
 
-            chat = []
-            for role, content, additional_kwargs in rows:
-                try:
-                    additional_kwargs_dict = json.loads(additional_kwargs) if additional_kwargs and additional_kwargs.strip() else {}
-                    message = ChatMessage(
-                        content=content,
-                        role=role,
-                        additional_kwargs=additional_kwargs_dict,
-                    )
-                    chat.append(message)
-                except json.JSONDecodeError as e:
-                    raise DatabaseQueryError(f"Error making chat from window messages: {e}")
-            return chat
+            return [MessageRecord(role, content, additional_kwargs) for role, content, additional_kwargs in rows]
         except sqlite3.Error as e:
             raise DatabaseQueryError(f"Unable to get k window messages from storage: {e}")
 
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def list_sessions(self):
+        """List all sessions of the user with their latest session name, newest first"""
+        try:
+            with self.db_config.get_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT session_id, session_name, mode FROM chat_session
+                    WHERE user_id = ? AND message_count > 0
+                    ORDER BY updated_at DESC
+                """, (self.user_id,))
+                return [
+                    {"session_id": row[0], "session_name": row[1], "mode": row[2]} for row in cursor.fetchall()
+                ]
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to list sessions: {e}")
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def get_session_state(self):
+        """{mode: (version, message_count, updated_at)} of this session across modes"""
+        try:
+            with self.db_config.get_connection() as conn:
+                cursor = conn.execute("""
+                    SELECT mode, version, message_count, updated_at FROM chat_session
+                    WHERE user_id = ? AND session_id = ?
+                """, (self.user_id, self.session_id))
+                return {mode: (version, count, updated_at) for mode, version, count, updated_at in cursor.fetchall()}
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to get session state: {e}")
+
+    def get_last_mode(self, state: dict = None):
+        """Mode of the newest message in the session, across modes"""
+        state = state if state is not None else self.get_session_state()
+        modes = [(updated_at or "", mode) for mode, (_, count, updated_at) in state.items() if count > 0]
+        return max(modes)[1] if modes else None
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def get_sessions_version(self) -> int:
+        """Change counter of the user's sessions, it only ever grows"""
+        try:
+            with self.db_config.get_connection() as conn:
+                row = conn.execute("SELECT version FROM chat_user WHERE user_id = ?", (self.user_id,)).fetchone()
+                return row[0] if row else 0
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to get sessions version: {e}")
+
     @property
     def messages(self):
-        return self.message
+        """The loaded messages as langchain messages, read by RunnableWithMessageHistory for the prompt"""
+        return to_messages(self.message)
     
     @retry_on_lock(max_retries=3, delay=0.1)
     def _get_message_count(self):
@@ -281,21 +587,25 @@ class MemoryManagement(BaseChatMessageHistory):
         try:
             with self.db_config.get_connection() as conn:
                 cursor = conn.execute("""
-                    SELECT COUNT(*) FROM chat_message 
-                    WHERE session_id = ? AND user_id = ? AND mode = ?
-                """, (self.session_id, self.user_id, self.mode))
-                count = cursor.fetchone()[0]
-                return count
+                    SELECT message_count FROM chat_session
+                    WHERE user_id = ? AND session_id = ? AND mode = ?
+                """, (self.user_id, self.session_id, self.mode))
+                row = cursor.fetchone()
+                count = row[0] if row else 0
+            if self.writer is not None:
+                count += self.writer.pending_count(self.session_id, self.user_id, self.mode)
+            return count
         except sqlite3.Error as e:
             raise DatabaseQueryError(f"Couldn't count messages: {e}")
 
 
 class SummaryMemory(MemoryManagement):
-    def __init__(self, session_id: str = None, user_id: str = None, mode: str = "consultant", window:int = None, prompt_filepath: str = None):
-        super().__init__(session_id, user_id, mode)
+    def __init__(self, session_id: str = None, user_id: str = None, mode: str = "consultant", window:int = None, prompt_filepath: str = None,
+                 writer: GroupCommitWriter = None, batcher: SummaryBatcher = None, db_config: DatabaseConfig = None):
+        super().__init__(session_id, user_id, mode, db_config=db_config, writer=writer)
 
         if prompt_filepath is None:
-            prompt_filepath = Path(__file__).parent / "utils" / "summary_prompt.yaml"
+            prompt_filepath = SUMMARY_PROMPT_FILE
 
         self.window = window if window is not None else 10  # Default window size
         self.filepath = prompt_filepath
@@ -303,13 +613,13 @@ class SummaryMemory(MemoryManagement):
         self.summary_prompt = self._load_summary_prompt()
         self.summary_template = self._create_summary_template()
         self.summary_model = self._init_summarize_model()
+        self.batcher = batcher  # Optional cross-session micro-batch for summary calls
 
     def _load_summary_prompt(self):
         """load summary prompt"""
 
         try: 
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return load_prompt_file(str(self.filepath))
         except FileNotFoundError:
             raise ValueError(f"File not found at: {self.filepath}")  # 
         except yaml.YAMLError as e:
@@ -325,17 +635,19 @@ class SummaryMemory(MemoryManagement):
         template = ChatPromptTemplate.from_template(template_str)
         return template
 
-    from src.llms.model import ModelManagement
-
     def _init_summarize_model(self):
-        return ModelManagement()._chat_model
+        return get_model_management()._chat_model
     
     def generat_summary(self, window_messages):
         """summarize chat"""
 
         chain = self.summary_template | self.summary_model | self.parser
+        usage = usage_config(self.user_id, self.session_id, self.mode, "summary")
+        window_messages = to_messages(window_messages)
 
-        return chain.invoke({"Generate summary": window_messages}) 
+        if self.batcher is not None:
+            return self.batcher.submit(chain, {"Generate summary": window_messages}, config=usage)
+        return chain.invoke({"Generate summary": window_messages}, config=usage)
 
     def merge_summary(self, existing_summary: str, new_summary: str) -> str:
         """Merge existing summary with new summary"""
@@ -370,7 +682,8 @@ class SummaryMemory(MemoryManagement):
 
             # Create a chain for name generation
             name_chain = name_prompt_template | self.summary_model | self.parser
-            generated_name = name_chain.invoke({"message": first_message})
+            generated_name = name_chain.invoke({"message": first_message},
+                                               config=usage_config(self.user_id, self.session_id, self.mode, "title"))
             
             # Clean up the generated name
             name = generated_name.strip().replace('"', '').replace("'", "")
@@ -386,10 +699,9 @@ class SummaryMemory(MemoryManagement):
             return name if name else "New Chat"
             
         except Exception as e:
-            print(f"ERROR generating session name with model: {e}")
             # Fallback to intelligent pattern matching if model fails
             name = self._generate_simple_name(first_message)
-            print(f"Using fallback name: {name}")
+            logger.warning("Session name generation failed, using fallback name", extra={"error": str(e), "fallback": name})
             return name
     
     def _generate_simple_name(self, first_message: str) -> str:
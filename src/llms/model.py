@@ -1,8 +1,13 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+from functools import lru_cache
+
 from src.llms.utils.config import config
+from src.llms.fake_model import FakeChatModel
 from langchain_core.language_models import BaseChatModel
 
 from pydantic import PrivateAttr
+import logging
+
+logger = logging.getLogger(__name__)
 
 class ModelManagement(BaseChatModel):
     _model_name: str = PrivateAttr()
@@ -17,15 +22,26 @@ class ModelManagement(BaseChatModel):
         self._api_key = config.api_key
         self._temperature = config.temperature
         self._max_tokens = config.max_tokens
-        
-        # Debug prints
-        print(f"DEBUG: API Key loaded: {self._api_key[:10]}..." if self._api_key else "DEBUG: No API key loaded!")
-        print(f"DEBUG: Model name: {self._model_name}")
-        
+
+        if not self._api_key and config.model_provider != "fake":
+            logger.warning("No API key configured for the chat model")
+        logger.debug("Chat model created", extra={"model": self._model_name, "provider": config.model_provider})
+
         self._chat_model = self._create_chat_model()
     # ...rest of your code, use self._model_name, etc.
 
     def _create_chat_model(self):
+        if config.model_provider == "fake":
+            return FakeChatModel(
+                latency=config.fake_latency,
+                latency_distribution=config.fake_latency_distribution,
+                tokens_per_second=config.fake_tokens_per_second,
+                response_tokens=config.fake_response_tokens,
+                error_rate=config.fake_error_rate,
+                seed=config.fake_seed,
+            )
+        # The provider SDK takes a few hundred ms to import, only pay for it when the model is built
+        from langchain_google_genai import ChatGoogleGenerativeAI
         return ChatGoogleGenerativeAI(
             model=self._model_name,
             api_key=self._api_key,
@@ -52,4 +68,10 @@ class ModelManagement(BaseChatModel):
             self._chat_model._generate('test')
             return True
         except Exception as e:
-            raise ValueError("Invalid api key: ", e)
\ No newline at end of file
+            raise ValueError("Invalid api key: ", e)
+
+
+@lru_cache(maxsize=None)
+def get_model_management() -> ModelManagement:
+    """Process-wide model, its provider client is created once and shared"""
+    return ModelManagement()
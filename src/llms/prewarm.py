@@ -0,0 +1,181 @@
+"""
+Pre-warmed context of the next chat turn.
+
+Students open a session from the sidebar (its history page, or hovering
+it) seconds before they send a message. prewarm() loads what a turn needs
+before the model call in the meantime: the session's message count,
+summary, summary window and the prompt history as MessageRecords. It
+keeps them for PREWARM_TTL seconds in a per-process ContextCache, bounded
+by entries and by the message characters they hold. A history longer than
+PREWARM_SESSION_CHARS isn't kept, the turn reads it as before.
+
+ChainManagement takes the entry when the session's version in chat_session
+still matches, so any message written since, by any worker, makes it miss
+and the turn loads its context as before.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from src.llms.archive import SessionArchive
+from src.llms.memory import MemoryManagement, SummaryMemory
+from src.llms.records import MessageRecord
+from src.llms.utils.config import config
+from src.utils.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Messages in the window the summary check looks at, as in ChainManagement
+SUMMARY_WINDOW = 10
+
+ContextKey = Tuple[str, str, str]  # (user_id, session_id, mode)
+
+
+@dataclass
+class TurnContext:
+    version: int  # chat_session version the context was loaded at
+    message_count: int
+    summary: dict
+    window: List[MessageRecord]
+    history: Optional[List[MessageRecord]]  # None when the session is too long to keep
+
+    @property
+    def size(self) -> int:
+        """Message characters held, what the cache is bounded by"""
+        return sum(len(record.content) for record in self.window + (self.history or []))
+
+
+def session_state(memory: MemoryManagement) -> Tuple[int, int]:
+    """(version, message count) of the memory's session and mode in chat_session, zeros before its first message"""
+    state = memory.get_session_state().get(memory.mode)
+    return (state[0], state[1]) if state else (0, 0)
+
+
+def load_history(memory: MemoryManagement, max_chars: int) -> Optional[List[MessageRecord]]:
+    """Records of the session's history, None as soon as their content exceeds max_chars"""
+    history, chars = [], 0
+    messages = memory.iter_messages()
+    try:
+        for record in messages:
+            chars += len(record.content)
+            if chars > max_chars:
+                return None
+            history.append(record)
+    finally:
+        messages.close()
+    return history
+
+
+def load_context(memory: SummaryMemory, max_history_chars: int = None) -> TurnContext:
+    """Load the context of the next turn in the memory's session"""
+    SessionArchive(memory.db_config).rehydrate(memory.user_id, memory.session_id)
+    # Version first: a message written while loading makes the context miss, never look current
+    version, message_count = session_state(memory)
+    return TurnContext(
+        version=version,
+        message_count=message_count,
+        summary=memory._get_existing_summary(),
+        window=memory.get_window_message(window=SUMMARY_WINDOW, order="DESC", mode=memory.mode),
+        history=load_history(memory, max_history_chars if max_history_chars is not None
+                             else config.prewarm_session_chars),
+    )
+
+
+class ContextCache:
+    """
+    Turn contexts by session with a TTL, least recently stored dropped beyond
+    max_entries or max_chars of message content.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None, max_chars: int = None):
+        self.ttl = ttl if ttl is not None else config.prewarm_ttl
+        self.max_entries = max_entries or config.prewarm_max_sessions
+        self.max_chars = max_chars or config.prewarm_max_chars
+        self._entries: "OrderedDict[ContextKey, Tuple[float, TurnContext]]" = OrderedDict()
+        self._chars = 0
+        self._loading = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop(self, key: ContextKey) -> Tuple[float, Optional[TurnContext]]:
+        expires, context = self._entries.pop(key, (0, None))
+        if context is not None:
+            self._chars -= context.size
+        return expires, context
+
+    def put(self, key: ContextKey, context: TurnContext):
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, context)
+            self._chars += context.size
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                self._pop(next(iter(self._entries)))
+
+    def peek(self, key: ContextKey) -> Optional[TurnContext]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def take(self, key: ContextKey, current_version: Callable[[], int]) -> Optional[TurnContext]:
+        """
+        Remove and return the context of key if it is fresh and was loaded at
+        the session's current version, which is only looked up for an entry.
+        """
+        with self._lock:
+            expires, context = self._pop(key)
+        hit = context is not None and expires >= time.monotonic() and context.version == current_version()
+        record_cache("turn_context", hit)
+        return context if hit else None
+
+    def begin(self, key: ContextKey) -> bool:
+        """Claim loading key, False while another thread loads it"""
+        with self._lock:
+            if key in self._loading:
+                return False
+            self._loading.add(key)
+            return True
+
+    def end(self, key: ContextKey):
+        with self._lock:
+            self._loading.discard(key)
+
+
+@lru_cache(maxsize=None)
+def get_context_cache() -> ContextCache:
+    """Process-wide cache of pre-warmed turn contexts"""
+    return ContextCache()
+
+
+def prewarm(user_id: str, session_id: str, mode: str = "consultant", cache: ContextCache = None) -> bool:
+    """
+    Load the next turn's context of a session into the cache, unless it is
+    there and current or being loaded. Returns whether it was loaded. Runs
+    as a background task, so failures are logged and not raised.
+    """
+    cache = cache if cache is not None else get_context_cache()
+    if cache.ttl <= 0:
+        return False
+    key = (user_id, session_id, mode)
+    if not cache.begin(key):
+        return False
+    try:
+        cached = cache.peek(key)
+        if cached is not None and cached.version == session_state(
+                MemoryManagement(session_id=session_id, user_id=user_id, mode=mode))[0]:
+            return False
+        memory = SummaryMemory(session_id=session_id, user_id=user_id, mode=mode, window=SUMMARY_WINDOW)
+        cache.put(key, load_context(memory))
+        return True
+    except Exception:
+        logger.exception("Pre-warming session context failed", extra={"session_id": session_id, "user_id": user_id})
+        return False
+    finally:
+        cache.end(key)
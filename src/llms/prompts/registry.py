@@ -0,0 +1,17 @@
+import yaml
+from functools import lru_cache
+from pathlib import Path
+
+PROMPT_DIR = Path(__file__).parent.parent / "utils"
+SYSTEM_PROMPT_FILE = PROMPT_DIR / "system_prompt.yaml"
+SUMMARY_PROMPT_FILE = PROMPT_DIR / "summary_prompt.yaml"
+
+
+@lru_cache(maxsize=None)
+def load_prompt_file(path: str) -> dict:
+    """
+    Parsed YAML prompt file, read once per process and shared by every chain.
+    Raises FileNotFoundError or yaml.YAMLError, which aren't cached.
+    """
+    with open(path, 'r', encoding="utf-8") as f:
+        return yaml.safe_load(f)
@@ -0,0 +1,75 @@
+"""
+Compact message records for the memory layer.
+
+A MessageRecord holds a stored message as read from chat_message, with
+additional_kwargs kept as its JSON text until someone reads it. Storage and
+caches work with records, they become langchain messages only where a
+model or prompt needs them (to_message).
+"""
+import json
+from typing import Any, Dict, Optional, Union
+
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.chat import ChatMessage
+
+from src.llms.utils.db_exceptions import DatabaseQueryError
+
+
+def decode_kwargs(raw: Optional[str]) -> Dict[str, Any]:
+    """additional_kwargs from its stored JSON text, almost always '{}'"""
+    if not raw or raw == "{}" or not raw.strip():
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise DatabaseQueryError(f"Error parsing message data: {e}")
+
+
+class MessageRecord:
+    """One chat message: role, content, additional_kwargs and, when stored, its id and timestamp"""
+
+    __slots__ = ("role", "content", "_kwargs", "id", "timestamp")
+
+    def __init__(self, role: str, content: str, additional_kwargs: Union[str, dict, None] = None,
+                 id: int = None, timestamp: str = None):
+        self.role = role
+        self.content = content
+        self._kwargs = additional_kwargs  # JSON text until decoded
+        self.id = id
+        self.timestamp = timestamp
+
+    @property
+    def type(self) -> str:
+        return "chat"
+
+    @property
+    def additional_kwargs(self) -> Dict[str, Any]:
+        if not isinstance(self._kwargs, dict):
+            self._kwargs = decode_kwargs(self._kwargs)
+        return self._kwargs
+
+    def kwargs_json(self) -> str:
+        """additional_kwargs as stored, without a decode and encode round trip"""
+        if isinstance(self._kwargs, dict):
+            return json.dumps(self._kwargs)
+        return self._kwargs or "{}"
+
+    def to_message(self) -> ChatMessage:
+        return ChatMessage(role=self.role, content=self.content, additional_kwargs=self.additional_kwargs)
+
+    @classmethod
+    def from_message(cls, message: BaseMessage, role: str) -> "MessageRecord":
+        return cls(role, message.content, getattr(message, "additional_kwargs", None) or None)
+
+    def __eq__(self, other):
+        if not isinstance(other, MessageRecord):
+            return NotImplemented
+        return (self.role, self.content, self.additional_kwargs) == (other.role, other.content, other.additional_kwargs)
+
+    def __repr__(self):
+        return f"MessageRecord(role={self.role!r}, content={self.content!r})"
+
+
+def to_messages(messages) -> list:
+    """langchain messages for a model or prompt, records are converted and others pass through"""
+    return [message.to_message() if isinstance(message, MessageRecord) else message for message in messages]
@@ -0,0 +1,157 @@
+"""
+Offline resharding of the chat database.
+
+Moves every user whose shard differs between from_shards and to_shards files
+(see src/llms/utils/sharding.py) with their messages, sessions, summaries
+and archived sessions. Stop the app, reshard, then start it again with the
+new CHAT_DB_SHARDS:
+
+    python -m src.llms.reshard --from-shards 1 --to-shards 4
+
+A user is first copied to the new shard and committed there, then deleted
+from the old one, so an interrupted run loses nothing and running it again
+finishes the job. Moved messages get new ids in the range of their new
+shard, in their original order; the history endpoint answers a since_id from
+the old range with reset, so clients reload their cached history.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Tuple
+
+import orjson
+
+from src.llms.archive import SessionArchive, compress, decompress
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import DatabaseQueryError
+from src.llms.utils.db_instrumentation import ALLOW_FULL_SCAN, ALLOW_TEMP_BTREE
+from src.llms.utils.sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_COLUMNS = "session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp"
+# Sessions of the user on the old shard, chat_summary is keyed by (session_id, user_id)
+_SUMMARY_KEYS = "session_id IN (SELECT session_id FROM main.chat_session WHERE user_id = ?) AND user_id = ?"
+
+
+def plan_moves(source: DatabaseConfig, to_shards: int) -> Dict[int, List[str]]:
+    """{target shard index: users to move there} for the users of one source shard"""
+    with source.get_connection() as conn:
+        users = [row[0] for row in conn.execute(f"""
+            SELECT DISTINCT user_id FROM chat_session -- {ALLOW_FULL_SCAN}
+        """).fetchall()]
+    moves: Dict[int, List[str]] = {}
+    for user_id in users:
+        target = shard_for(user_id, to_shards)
+        if target != source.shard_index:
+            moves.setdefault(target, []).append(user_id)
+    return moves
+
+
+def _rewrite_archive(data: bytes, codec: str) -> bytes:
+    """Clear the message ids of an archived session so rehydrating numbers them on the new shard"""
+    rows = sorted(orjson.loads(decompress(data, codec)), key=lambda row: row[0])
+    return compress(orjson.dumps([[None] + row[1:] for row in rows]), codec)
+
+
+def _copy_user(conn, user_id: str) -> int:
+    """Copy a user from main to the attached target, replacing leftovers of an interrupted run"""
+    conn.execute(f"DELETE FROM target.chat_summary WHERE {_SUMMARY_KEYS}", (user_id, user_id))
+    conn.execute("DELETE FROM target.chat_message WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM target.chat_session WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM target.chat_archive WHERE user_id = ?", (user_id,))
+
+    # Inserting in id order keeps every session in order under its new ids
+    messages = conn.execute(f"""
+        INSERT INTO target.chat_message ({_MESSAGE_COLUMNS})
+        SELECT {_MESSAGE_COLUMNS} FROM main.chat_message WHERE user_id = ? ORDER BY ID -- {ALLOW_TEMP_BTREE}
+    """, (user_id,)).rowcount
+    # The triggers counted the hot messages only, take counts, archive state and names from the old shard.
+    # A higher version changes the ETags clients hold for the old ids.
+    conn.execute("""
+        INSERT INTO target.chat_session
+        (user_id, session_id, mode, session_name, message_count, updated_at, version, archived_at)
+        SELECT user_id, session_id, mode, session_name, message_count, updated_at, version + 1, archived_at
+        FROM main.chat_session WHERE user_id = ?
+        ON CONFLICT (user_id, session_id, mode) DO UPDATE SET
+            session_name = excluded.session_name, message_count = excluded.message_count,
+            updated_at = excluded.updated_at, version = excluded.version, archived_at = excluded.archived_at
+    """, (user_id,))
+    # The triggers restarted the session list counter on the target, continue past both so its ETag can't repeat
+    conn.execute("""
+        UPDATE target.chat_user SET version = version + COALESCE(
+            (SELECT version FROM main.chat_user WHERE user_id = ?), 0
+        ) WHERE user_id = ?
+    """, (user_id, user_id))
+    conn.execute(f"""
+        INSERT INTO target.chat_summary (session_id, user_id, summary, last_message_count, updated_at)
+        SELECT session_id, user_id, summary, last_message_count, updated_at FROM main.chat_summary
+        WHERE {_SUMMARY_KEYS}
+    """, (user_id, user_id))
+    archived: List[Tuple] = conn.execute("""
+        SELECT session_id, message_count, last_activity, archived_at, codec, data FROM main.chat_archive
+        WHERE user_id = ?
+    """, (user_id,)).fetchall()
+    conn.executemany("""
+        INSERT INTO target.chat_archive (user_id, session_id, message_count, last_activity, archived_at, codec, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(user_id, session_id, count, last_activity, archived_at, codec, _rewrite_archive(data, codec))
+          for session_id, count, last_activity, archived_at, codec, data in archived])
+    return messages
+
+
+def _delete_user(conn, user_id: str):
+    conn.execute(f"DELETE FROM main.chat_summary WHERE {_SUMMARY_KEYS}", (user_id, user_id))
+    conn.execute("DELETE FROM main.chat_message WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM main.chat_session WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM main.chat_archive WHERE user_id = ?", (user_id,))
+
+
+def reshard(db_path: str = None, from_shards: int = 1, to_shards: int = 1) -> dict:
+    """Move users from the from_shards layout of db_path to the to_shards one, returns what moved"""
+    sources = DatabaseConfig(db_path, shards=from_shards).shards()
+    targets = DatabaseConfig(db_path, shards=to_shards).shards()
+    for db_config in sources + targets:
+        MemoryManagement(db_config=db_config)
+        SessionArchive(db_config)
+
+    totals = {"users": 0, "messages": 0}
+    for source in sources:
+        for target_index, users in plan_moves(source, to_shards).items():
+            target = targets[target_index]
+            try:
+                with source.get_connection() as conn:
+                    conn.execute("ATTACH DATABASE ? AS target", (str(target.db_path),))
+                    for user_id in users:
+                        totals["messages"] += _copy_user(conn, user_id)
+                        conn.commit()
+                        _delete_user(conn, user_id)
+                        conn.commit()
+                        totals["users"] += 1
+                    conn.execute("DETACH DATABASE target")
+            except sqlite3.Error as e:
+                raise DatabaseQueryError(f"Unable to move users from {source.db_path} to {target.db_path}: {e}")
+            logger.info("Moved users to their new shard", extra={
+                "source": source.shard_index, "target": target_index, "users": len(users),
+            })
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move chat data to a new number of shards, with the app stopped")
+    parser.add_argument("--db", help="Database path of shard 0, CHAT_DB_PATH or chat_history.db by default")
+    parser.add_argument("--from-shards", type=int, required=True, help="CHAT_DB_SHARDS the data is laid out for")
+    parser.add_argument("--to-shards", type=int, required=True, help="CHAT_DB_SHARDS to start the app with afterwards")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    totals = reshard(args.db, args.from_shards, args.to_shards)
+    totals["seconds"] = round(time.perf_counter() - started, 1)
+    print(json.dumps(totals))
+
+
+if __name__ == "__main__":
+    main()
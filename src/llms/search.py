@@ -0,0 +1,114 @@
+import html
+import logging
+import re
+import sqlite3
+from typing import List, Tuple
+
+from src.llms.memory import MemoryManagement, fts5_available
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_utils import retry_on_lock
+from src.llms.utils.db_exceptions import DatabaseQueryError
+
+logger = logging.getLogger(__name__)
+
+# Roughly what the unicode61 tokenizer considers a token
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+# Control characters can't appear in stored text, so they are safe highlight markers before escaping
+_OPEN, _CLOSE = "\x02", "\x03"
+
+
+def _phrase(tokens: List[str]) -> str:
+    return '"' + " ".join(tokens) + '"'
+
+
+def build_match(user_id: str, query: str, mode: str = None) -> str:
+    """
+    FTS5 MATCH expression for the words of query within one user's messages.
+    The query is reduced to its words, so FTS5 syntax in user input has no
+    effect. The last word also matches as a prefix, for search as you type.
+    """
+    words = _TOKEN.findall(query)
+    if not words:
+        return ""
+    terms = [_phrase([word]) for word in words]
+    terms[-1] += "*"
+    parts = [f"user_id : {_phrase(_TOKEN.findall(user_id))}"]
+    if mode:
+        parts.append(f"mode : {_phrase(_TOKEN.findall(mode))}")
+    parts.append(f"content : ({' '.join(terms)})")
+    return " AND ".join(parts)
+
+
+def rebuild_search_index(db_config: DatabaseConfig = None) -> int:
+    """
+    Index messages written before chat_message_fts existed, on each shard
+    whose index lacks its oldest message. Reads the whole table, so it runs
+    at startup rather than in a request. Returns the shards rebuilt.
+    """
+    if not fts5_available():
+        return 0
+    rebuilt = 0
+    for shard in (db_config or DatabaseConfig()).shards():
+        MemoryManagement(db_config=shard)
+        with shard.get_connection() as conn:
+            # Both are rowid lookups, triggers index every message written after the table was created
+            behind = conn.execute("""
+                SELECT (SELECT MIN(ID) FROM chat_message) < COALESCE((SELECT MIN(id) FROM chat_message_fts_docsize), 9e18)
+            """).fetchone()[0]
+            if behind:
+                conn.execute("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('rebuild')")
+                logger.info("Rebuilt search index", extra={"db_path": str(shard.db_path)})
+                rebuilt += 1
+    return rebuilt
+
+
+def render_snippet(snippet: str) -> str:
+    """HTML-escape a snippet and turn the highlight markers into <mark> tags"""
+    return html.escape(snippet or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+class MessageSearch:
+    """Full-text search over chat messages through the chat_message_fts index"""
+
+    def __init__(self, db_config: DatabaseConfig = None):
+        self.db_config = db_config or DatabaseConfig()
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def search(self, user_id: str, query: str, mode: str = None, limit: int = 20, offset: int = 0) -> Tuple[List[dict], bool]:
+        """
+        Messages of user_id matching query, best bm25 rank first. Returns
+        (results, has_more); the next page starts at offset + limit.
+        """
+        if not _TOKEN.search(user_id):
+            return [], False
+        match = build_match(user_id, query, mode)
+        if not match:
+            return [], False
+        db_config = MemoryManagement(user_id=user_id, db_config=self.db_config).db_config  # The user's shard and its index
+        try:
+            with db_config.get_connection() as conn:
+                # user_id and mode are checked exactly as well, the phrase match above only narrows the postings
+                cursor = conn.execute(f"""
+                    SELECT m.ID, m.session_id, m.session_name, m.mode, m.role, m.timestamp,
+                           snippet(chat_message_fts, 0, '{_OPEN}', '{_CLOSE}', '…', 16), rank
+                    FROM chat_message_fts
+                    JOIN chat_message AS m ON m.ID = chat_message_fts.rowid
+                    WHERE chat_message_fts MATCH ? AND m.user_id = ? AND (? IS NULL OR m.mode = ?)
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                """, (match, user_id, mode, mode, limit + 1, offset))
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to search messages: {e}")
+
+        results = [{
+            "id": message_id,
+            "session_id": session_id,
+            "session_name": session_name,
+            "mode": message_mode,
+            "role": role,
+            "timestamp": timestamp,
+            "snippet": render_snippet(snippet),
+            "score": -rank,  # bm25 ranks lower is better, scores higher is better
+        } for message_id, session_id, session_name, message_mode, role, timestamp, snippet, rank in rows[:limit]]
+        return results, len(rows) > limit
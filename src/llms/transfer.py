@@ -0,0 +1,217 @@
+"""
+Bulk export and import of chat messages as NDJSON, one message object per line.
+
+Exports stream from a cursor in fetchmany batches and imports insert with
+executemany in large transactions, so memory stays constant whatever the size.
+Message IDs are kept, importing the same file twice leaves one copy. With
+CHAT_DB_SHARDS, exports read every shard and imports route each message to
+the shard of its user.
+
+    python -m src.llms.transfer export backup.ndjson.zst
+    python -m src.llms.transfer export user.ndjson.gz --user-id u1
+    python -m src.llms.transfer import backup.ndjson.zst --db restored.db
+"""
+import argparse
+import gzip
+import io
+import logging
+import sqlite3
+import sys
+import time
+import zlib
+from contextlib import ExitStack
+from itertools import chain, islice
+from typing import BinaryIO, Iterable, Iterator
+
+import orjson
+import zstandard
+
+from src.llms.memory import MESSAGE_INDEXES, MemoryManagement
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import DatabaseQueryError
+from src.llms.utils.db_instrumentation import ALLOW_FULL_SCAN
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "session_id", "user_id", "mode", "session_name", "role", "additional_kwargs", "content", "timestamp")
+COMPRESSIONS = ("none", "gzip", "zstd")
+_SELECT = "SELECT ID, session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp FROM chat_message"
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def export_lines(db_config: DatabaseConfig = None, user_id: str = None, session_id: str = None,
+                 batch_rows: int = None) -> Iterator[bytes]:
+    """
+    NDJSON of the messages of a session, a user or the whole database, one
+    chunk of batch_rows lines at a time. Sessions come in time order, a whole
+    database export reads the shards one after another.
+    """
+    if session_id is not None and user_id is None:
+        raise ValueError("Exporting a session requires its user_id")
+    db_config = db_config or DatabaseConfig()
+    batch_rows = batch_rows or config.transfer_batch_rows
+    if session_id is not None:
+        query, params = f"{_SELECT} WHERE user_id = ? AND session_id = ? ORDER BY mode, timestamp", (user_id, session_id)
+    elif user_id is not None:
+        query, params = f"{_SELECT} WHERE user_id = ? ORDER BY session_id, mode, timestamp", (user_id,)
+    else:
+        query, params = f"{_SELECT} ORDER BY ID -- {ALLOW_FULL_SCAN}", ()
+        return chain.from_iterable(_export(shard, query, params, batch_rows) for shard in db_config.shards())
+    return _export(db_config.for_user(user_id), query, params, batch_rows)
+
+
+def _export(db_config: DatabaseConfig, query: str, params: tuple, batch_rows: int) -> Iterator[bytes]:
+    try:
+        # Streaming responses advance this generator from different threadpool threads
+        with db_config.get_connection(check_same_thread=False) as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield b"".join(orjson.dumps(dict(zip(COLUMNS, row))) + b"\n" for row in rows)
+    except sqlite3.Error as e:
+        raise DatabaseQueryError(f"Unable to export messages: {e}")
+
+
+def compress_chunks(chunks: Iterable[bytes], compression: str = "none") -> Iterator[bytes]:
+    """Compress a stream of chunks incrementally with gzip or zstd"""
+    if compression == "none":
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+    elif compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def open_input(stream: BinaryIO) -> BinaryIO:
+    """Wrap a binary stream in a decompressor picked from its magic bytes"""
+    buffered = stream if isinstance(stream, io.BufferedReader) else io.BufferedReader(stream)
+    magic = buffered.peek(4)[:4]
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=buffered)
+    if magic == _ZSTD_MAGIC:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(buffered, read_across_frames=True))
+    return buffered
+
+
+def _rows(lines: Iterable[bytes]) -> Iterator[tuple]:
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            yield tuple(record.get(column) for column in COLUMNS)
+        except (orjson.JSONDecodeError, AttributeError) as e:
+            raise ValueError(f"Invalid NDJSON on line {number}: {e}")
+
+
+def import_lines(lines: Iterable[bytes], db_config: DatabaseConfig = None, batch_rows: int = None,
+                 offline: bool = False) -> int:
+    """
+    Insert NDJSON messages with executemany, committing every batch_rows rows.
+    With offline, for a new database or one no app is serving, secondary
+    indexes are dropped for the import and rebuilt in one pass at the end.
+    Otherwise they are kept so reads served meanwhile stay index lookups.
+    Messages whose ID already exists are skipped. Returns rows inserted.
+    """
+    indexes = MESSAGE_INDEXES if offline else {}
+    db_config = db_config or DatabaseConfig()
+    batch_rows = batch_rows or config.transfer_batch_rows
+    shards = db_config.shards()
+    for shard in shards:
+        MemoryManagement(db_config=shard)  # Create the schema on a new database
+    rows = _rows(lines)
+    inserted = 0
+    try:
+        with ExitStack() as stack:
+            conns = [stack.enter_context(shard.get_connection()) for shard in shards]
+            for conn in conns:
+                for name in indexes:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+                conn.commit()
+            try:
+                while True:
+                    batch = list(islice(rows, batch_rows))
+                    if not batch:
+                        break
+                    by_shard = {}
+                    for row in batch:
+                        by_shard.setdefault(db_config.for_user(row[2]).shard_index, []).append(row)
+                    for index, shard_rows in by_shard.items():
+                        cursor = conns[index].executemany("""
+                            INSERT OR IGNORE INTO chat_message
+                            (ID, session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, shard_rows)
+                        # rowcount leaves out ignored duplicates and chat_session rows written by triggers
+                        inserted += cursor.rowcount
+                        conns[index].commit()
+                    logger.info("Imported batch", extra={"rows": len(batch), "inserted": inserted})
+            finally:
+                for conn in conns:
+                    conn.rollback()
+                    for statement in indexes.values():
+                        conn.execute(statement)
+    except sqlite3.Error as e:
+        raise DatabaseQueryError(f"Unable to import messages: {e}")
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import chat messages as NDJSON")
+    parser.add_argument("--db", help="Database path, CHAT_DB_PATH or chat_history.db by default")
+    parser.add_argument("--batch-rows", type=int, help="Rows per fetch on export, per transaction on import")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write messages to a file, - for stdout")
+    export.add_argument("path")
+    export.add_argument("--user-id")
+    export.add_argument("--session-id", help="Requires --user-id")
+    export.add_argument("--compression", choices=COMPRESSIONS,
+                        help="Defaults to the file suffix: .gz for gzip, .zst for zstd, none otherwise")
+
+    restore = commands.add_parser("import", help="Read messages from a file, - for stdin, compression is detected")
+    restore.add_argument("path")
+    restore.add_argument("--offline", action="store_true",
+                         help="The database is new or not being served: drop secondary indexes during the import")
+    args = parser.parse_args()
+
+    db_config = DatabaseConfig(args.db)
+    started = time.perf_counter()
+    if args.command == "export":
+        compression = args.compression or (
+            "gzip" if args.path.endswith(".gz") else "zstd" if args.path.endswith(".zst") else "none"
+        )
+        chunks = compress_chunks(export_lines(db_config, args.user_id, args.session_id, args.batch_rows), compression)
+        output = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+        try:
+            written = 0
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        print(f"Exported {written} bytes in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        try:
+            inserted = import_lines(open_input(source), db_config, args.batch_rows, offline=args.offline)
+        finally:
+            source.close()
+        print(f"Imported {inserted} messages in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
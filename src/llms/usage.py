@@ -0,0 +1,242 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_utils import retry_on_lock
+from src.llms.utils.db_exceptions import DatabaseConnectionError, DatabaseQueryError
+from src.utils.metrics import MODEL_TOKENS
+
+# (user_id, session_id, mode, day, purpose)
+UsageKey = Tuple[str, str, str, str, str]
+# calls, input_tokens, output_tokens, total_tokens, model_seconds
+_FIELDS = ("calls", "input_tokens", "output_tokens", "total_tokens", "model_seconds")
+GROUP_COLUMNS = ("user_id", "session_id", "mode", "day", "purpose")
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    """
+    Aggregate model token usage in memory and upsert it into usage_daily.
+
+    Usage is summed per (user, session, mode, day, purpose) until max_keys
+    buckets are pending or max_wait seconds passed since the first one, then
+    a timer thread writes all buckets with one executemany in a single
+    transaction. Model callbacks only touch the in-memory buckets.
+
+    A flush takes the buckets and writes them without holding the bucket
+    lock, like GroupCommitWriter. A failed flush merges them back and the
+    background flush tries again max_wait seconds later.
+    """
+
+    def __init__(self, db_config: DatabaseConfig = None, max_keys: int = None, max_wait: float = None):
+        self.db_config = db_config or DatabaseConfig()
+        self.max_keys = max_keys if max_keys is not None else config.usage_flush_keys
+        self.max_wait = max_wait if max_wait is not None else config.usage_flush_interval
+        self._pending: Dict[UsageKey, List[float]] = {}
+        self._timer: threading.Timer = None
+        self._timer_due = 0.0  # time.monotonic() the timer fires at
+        self._lock = threading.Lock()  # Guards _pending and the timer
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._init_database()
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def _init_database(self):
+        """Create usage table"""
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS usage_daily(
+                        user_id TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        mode TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        purpose TEXT NOT NULL,
+                        calls INTEGER NOT NULL DEFAULT 0,
+                        input_tokens INTEGER NOT NULL DEFAULT 0,
+                        output_tokens INTEGER NOT NULL DEFAULT 0,
+                        total_tokens INTEGER NOT NULL DEFAULT 0,
+                        model_seconds REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, session_id, mode, day, purpose)
+                    )
+                """)
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_usage_day_mode ON usage_daily (day, mode)
+                """)
+        except sqlite3.Error as e:
+            raise DatabaseConnectionError(f"Can't initialize usage table: {e}")
+
+    def add(self, key: UsageKey, input_tokens: int, output_tokens: int, total_tokens: int, model_seconds: float):
+        """Add one model call to its bucket"""
+        with self._lock:
+            self._merge({key: [1, input_tokens, output_tokens, total_tokens, model_seconds]})
+            # Full buckets are flushed right away, but by the timer thread and not the caller's
+            full = len(self._pending) >= self.max_keys
+            if self._timer is None or (full and self._timer_due > time.monotonic()):
+                self._schedule(0 if full else self.max_wait)
+
+    def _merge(self, buckets: Dict[UsageKey, List[float]]):
+        """Add buckets to the pending ones, called with _lock held"""
+        for key, values in buckets.items():
+            bucket = self._pending.setdefault(key, [0, 0, 0, 0, 0.0])
+            for index, value in enumerate(values):
+                bucket[index] += value
+
+    def _schedule(self, delay: float):
+        """(Re)start the flush timer, called with _lock held"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._flush_or_retry)
+        self._timer.daemon = True
+        self._timer_due = time.monotonic() + delay
+        self._timer.start()
+
+    def _flush_or_retry(self):
+        """Flush from the timer, where nobody could handle an error"""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Usage flush failed, retrying later", extra={"retry_in": self.max_wait})
+            with self._lock:
+                if self._pending:
+                    self._schedule(self.max_wait)
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def flush(self) -> int:
+        """Upsert all pending buckets in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                writing, self._pending = self._pending, {}
+            if not writing:
+                return 0
+            rows = [key + tuple(bucket) for key, bucket in writing.items()]
+            written = False
+            try:
+                with self.db_config.get_connection() as conn:
+                    conn.executemany("""
+                        INSERT INTO usage_daily
+                        (user_id, session_id, mode, day, purpose, calls, input_tokens, output_tokens, total_tokens, model_seconds)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (user_id, session_id, mode, day, purpose) DO UPDATE SET
+                            calls = calls + excluded.calls,
+                            input_tokens = input_tokens + excluded.input_tokens,
+                            output_tokens = output_tokens + excluded.output_tokens,
+                            total_tokens = total_tokens + excluded.total_tokens,
+                            model_seconds = model_seconds + excluded.model_seconds
+                    """, rows)
+                written = True
+            except sqlite3.OperationalError:
+                raise  # Buckets go back so retry_on_lock can try again
+            except sqlite3.Error as e:
+                raise DatabaseQueryError(f"Unable to store usage: {e}")
+            finally:
+                if not written:
+                    with self._lock:
+                        # Summed with usage added meanwhile
+                        self._merge(writing)
+            return len(rows)
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def query(self, user_id: str = None, session_id: str = None, mode: str = None, since: str = None, until: str = None,
+              group_by: Sequence[str] = ("mode", "day")) -> List[dict]:
+        """Usage summed over group_by columns, with estimated cost in USD"""
+        invalid = [column for column in group_by if column not in GROUP_COLUMNS]
+        if invalid:
+            raise ValueError(f"Can't group usage by: {', '.join(invalid)}")
+        self.flush()
+
+        conditions, params = [], []
+        for column, operator, value in (("user_id", "=", user_id), ("session_id", "=", session_id),
+                                        ("mode", "=", mode), ("day", ">=", since), ("day", "<=", until)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ", ".join(group_by)
+        group = f"GROUP BY {columns} ORDER BY {columns}" if group_by else ""
+        select = f"{columns}, " if group_by else ""
+        try:
+            with self.db_config.get_connection() as conn:
+                cursor = conn.execute(f"""
+                    SELECT {select}SUM(calls), SUM(input_tokens), SUM(output_tokens), SUM(total_tokens), SUM(model_seconds)
+                    FROM usage_daily {where} {group}
+                """, params)
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to query usage: {e}")
+
+        results = []
+        for row in rows:
+            entry = dict(zip(tuple(group_by) + _FIELDS, row))
+            if not entry["calls"]:
+                continue
+            entry["avg_input_tokens"] = entry["input_tokens"] / entry["calls"]
+            entry["avg_model_seconds"] = entry["model_seconds"] / entry["calls"]
+            entry["cost_usd"] = (entry["input_tokens"] * config.input_token_price
+                                 + entry["output_tokens"] * config.output_token_price) / 1_000_000
+            results.append(entry)
+        return results
+
+
+@lru_cache(maxsize=None)
+def get_usage_recorder() -> UsageRecorder:
+    """Process-wide recorder, pending usage is flushed at exit"""
+    recorder = UsageRecorder()
+    atexit.register(recorder.flush)
+    return recorder
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Record usage_metadata of every chat model call made with this handler in its callbacks"""
+
+    def __init__(self, user_id: str, session_id: str, mode: str, purpose: str, recorder: UsageRecorder = None):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.mode = mode
+        self.purpose = purpose
+        self.recorder = recorder
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        started = self._started.pop(run_id, None)
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        input_tokens = output_tokens = total_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                total_tokens += usage.get("total_tokens", 0)
+
+        MODEL_TOKENS.labels(self.mode, self.purpose, "input").inc(input_tokens)
+        MODEL_TOKENS.labels(self.mode, self.purpose, "output").inc(output_tokens)
+        key = (self.user_id, self.session_id, self.mode, date.today().isoformat(), self.purpose)
+        (self.recorder or get_usage_recorder()).add(key, input_tokens, output_tokens, total_tokens, seconds)
+
+
+def usage_config(user_id: str, session_id: str, mode: str, purpose: str, recorder: UsageRecorder = None) -> dict:
+    """Runnable config that records model usage for this session under purpose"""
+    return {"callbacks": [UsageCallbackHandler(user_id, session_id, mode, purpose, recorder)]}
@@ -1,27 +1,76 @@
 import sqlite3
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from contextlib import contextmanager
+from typing import Callable, List, TypeVar
+
+from src.llms.utils.config import config
+from src.llms.utils.db_instrumentation import InstrumentedConnection
+from src.llms.utils.sharding import shard_for, shard_path
+
+T = TypeVar("T")
 
 class DatabaseConfig:
-    """Centralized database configuration"""
+    """
+    Centralized database configuration.
+
+    With CHAT_DB_SHARDS above 1 the chat tables are split by user_id over that many
+    files next to db_path, see src/llms/utils/sharding.py. for_user gives the
+    configuration of one user's shard, the file at db_path itself is shard 0 and
+    also holds the tables that aren't per user (usage, idempotency keys).
+    """
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, plan_check: bool = None, shards: int = None, shard_index: int = 0):
         if db_path is None:
             # Use environment variable or default to project root
             db_path = os.getenv('CHAT_DB_PATH', 'chat_history.db')
         
         self.db_path = Path(db_path)
+        self.plan_check = config.sql_plan_check if plan_check is None else plan_check
+        self.shard_count = max(1, shards or config.chat_db_shards)
+        self.shard_index = shard_index
+        self._shards: List["DatabaseConfig"] = None
         self._ensure_directory_exists()
+
+    def shards(self) -> List["DatabaseConfig"]:
+        """Configuration of every shard in order, just this one when unsharded"""
+        if self.shard_count == 1:
+            return [self]
+        if self._shards is None:
+            self._shards = [DatabaseConfig(shard_path(self.db_path, index), self.plan_check, shards=1, shard_index=index)
+                            for index in range(self.shard_count)]
+        return self._shards
+
+    def for_user(self, user_id: str) -> "DatabaseConfig":
+        """Configuration of the shard holding user_id"""
+        if self.shard_count == 1:
+            return self
+        return self.shards()[shard_for(user_id, self.shard_count)]
+
+    def fan_out(self, func: Callable[["DatabaseConfig"], T]) -> List[T]:
+        """Call func on every shard in parallel, results in shard order"""
+        shards = self.shards()
+        if len(shards) == 1:
+            return [func(shards[0])]
+        with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard") as pool:
+            return list(pool.map(func, shards))
     
     def _ensure_directory_exists(self):
         """Create directory for database if it doesn't exist"""
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
     
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(str(self.db_path), timeout=10.0)
+    def get_connection(self, check_same_thread: bool = True):
+        """
+        Context manager for database connections, statements are timed and slow ones logged.
+        Pass check_same_thread=False for a connection used by one thread at a time but not
+        always the same one, like a streaming response iterated in the threadpool.
+        """
+        conn = sqlite3.connect(str(self.db_path), timeout=10.0, factory=InstrumentedConnection,
+                               check_same_thread=check_same_thread)
+        conn.slow_query_seconds = config.slow_query_ms / 1000
+        conn.plan_check = self.plan_check
         try:
             yield conn
             conn.commit()
@@ -29,4 +78,4 @@ class DatabaseConfig:
             conn.rollback()
             raise
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
@@ -12,4 +12,8 @@ class DatabaseLockError(DatabaseError):
 
 class DatabaseQueryError(DatabaseError):
     """Error executing database query"""
-    pass
\ No newline at end of file
+    pass
+
+class QueryPlanError(DatabaseQueryError):
+    """Query plan does a full table scan or temp B-tree sort, raised when plan checks are enabled"""
+    pass
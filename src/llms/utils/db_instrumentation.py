@@ -0,0 +1,203 @@
+import logging
+import re
+import sqlite3
+import sys
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from src.llms.utils.db_exceptions import QueryPlanError
+from src.utils.metrics import DB_QUERY_ROWS, DB_QUERY_SECONDS
+
+slow_logger = logging.getLogger("src.sql.slow")
+
+# Put this marker in a statement's SQL when its temp B-tree is known to be small
+ALLOW_TEMP_BTREE = "plan-check: allow temp b-tree"
+# And this one when the statement is meant to read the whole table, like a full export
+ALLOW_FULL_SCAN = "plan-check: allow full scan"
+
+# A SCAN of a table or of a whole index, SEARCH lines are index lookups and so are FTS5 MATCH scans
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\()(?!\S+ VIRTUAL TABLE INDEX \d+:M)")
+_CHECKED = ("SELECT", "UPDATE", "DELETE")
+# Frames from these modules are skipped when looking for the calling function
+_INTERNAL = (__name__, "src.llms.utils.db_config", "src.llms.utils.db_utils", "contextlib")
+
+_plan_cache: Dict[str, List[str]] = {}
+
+
+def _compact(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") in _INTERNAL:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_qualname}"
+
+
+def plan_problems(plan: List[str], sql: str) -> List[str]:
+    """Full table scans and temp B-tree sorts in an EXPLAIN QUERY PLAN"""
+    problems = []
+    for line in plan:
+        if _FULL_SCAN.match(line) and ALLOW_FULL_SCAN not in sql:
+            problems.append(line)
+        elif "USE TEMP B-TREE" in line and ALLOW_TEMP_BTREE not in sql:
+            problems.append(line)
+    return problems
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that records duration, row count and caller of each statement.
+    A SELECT is recorded when it is exhausted, closed, replaced or garbage
+    collected, so time spent fetching rows counts as well.
+    """
+
+    _sql: Optional[str] = None
+
+    def _begin(self, sql: str):
+        self._finish()
+        connection = self.connection
+        if connection.plan_check and sql.lstrip()[:6].upper() in _CHECKED:
+            connection.check_plan(sql)
+        self._sql = sql
+        self._caller = _caller()
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        self.connection.record(sql, self._elapsed, self._rows, self._caller)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql)
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql)
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        self._rows = max(self.rowcount, 0)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        if len(rows) < (size if size is not None else self.arraysize):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - start
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Dropped with rows left, like conn.execute(...).fetchone()
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements go through InstrumentedCursor, see DatabaseConfig.get_connection"""
+
+    slow_query_seconds: float = 0.1
+    plan_check: bool = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Weak, so long-lived connections don't keep every cursor they handed out
+        self._cursors: "weakref.WeakSet[InstrumentedCursor]" = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        # Record SELECTs whose rows were never fully read
+        for cursor in list(self._cursors):
+            if isinstance(cursor, InstrumentedCursor):
+                cursor._finish()
+        self._cursors.clear()
+        super().close()
+
+    def explain(self, sql: str) -> List[str]:
+        """EXPLAIN QUERY PLAN detail lines, with NULL for every parameter"""
+        params = [None] * sql.count("?")
+        rows = sqlite3.Connection.execute(self, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row[-1] for row in rows]
+
+    def check_plan(self, sql: str):
+        plan = _plan_cache.get(sql)
+        if plan is None:
+            plan = _plan_cache[sql] = self.explain(sql)
+        problems = plan_problems(plan, sql)
+        if problems:
+            raise QueryPlanError(f"{'; '.join(problems)} in: {_compact(sql)}")
+
+    def record(self, sql: str, seconds: float, rows: int, caller: str):
+        DB_QUERY_SECONDS.labels(caller).observe(seconds)
+        DB_QUERY_ROWS.labels(caller).inc(rows)
+        if seconds < self.slow_query_seconds:
+            return
+        try:
+            plan = self.explain(sql)
+        except sqlite3.Error as e:
+            plan = [f"unavailable: {e}"]
+        slow_logger.warning("Slow query", extra={
+            "sql": _compact(sql), "duration_ms": round(seconds * 1000, 3), "rows": rows, "caller": caller, "plan": plan,
+        })
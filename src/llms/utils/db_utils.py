@@ -1,7 +1,11 @@
+import os
 import time
 import sqlite3
+import threading
 from functools import wraps
 
+from src.utils.metrics import DB_LOCK_RETRIES
+
 def retry_on_lock(max_retries=3, delay=0.1):
     """Decorator to retry database operations on lock errors"""
     def decorator(func):
@@ -12,9 +16,40 @@ def retry_on_lock(max_retries=3, delay=0.1):
                     return func(*args, **kwargs)
                 except sqlite3.OperationalError as e:
                     if "database is locked" in str(e) and attempt < max_retries - 1:
+                        DB_LOCK_RETRIES.labels(func.__qualname__).inc()
                         time.sleep(delay * (2 ** attempt))  # Exponential backoff
                         continue
                     raise
             return func(*args, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+def once_per_database(func):
+    """
+    Decorator for schema setup methods: run once per process and database file
+    (self.db_config.db_path) instead of on every instance. A file that was
+    deleted or replaced since is set up again.
+    """
+    done = set()
+    lock = threading.Lock()
+
+    def identity(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return os.path.abspath(path), stat.st_dev, stat.st_ino
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if identity(self.db_config.db_path) in done:
+            return None
+        with lock:
+            if identity(self.db_config.db_path) in done:
+                return None
+            result = func(self, *args, **kwargs)
+            key = identity(self.db_config.db_path)
+            if key is not None:
+                done.add(key)
+            return result
+    return wrapper
\ No newline at end of file
@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+from itertools import chain
+from typing import List, Tuple
+
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_utils import retry_on_lock
+from src.llms.utils.db_exceptions import DatabaseQueryError
+
+
+class GroupCommitWriter:
+    """
+    Buffer chat_message rows and insert them with one transaction per flush.
+
+    Rows use the column order of MemoryManagement.save_messages:
+    (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+
+    A flush takes the buffer and writes it without holding the buffer lock,
+    so producers keep adding rows while it runs or waits on a locked database.
+    """
+
+    def __init__(self, db_config: DatabaseConfig = None, max_rows: int = 200):
+        self.db_config = db_config or DatabaseConfig()
+        self.max_rows = max_rows
+        self._rows: List[Tuple] = []
+        self._writing: List[Tuple] = []  # Rows taken by the running flush
+        self._lock = threading.Lock()  # Guards _rows and _writing
+        self._flush_lock = threading.Lock()  # One flush at a time
+
+    def add(self, row: Tuple):
+        """Queue a row, flushing when the buffer is full"""
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self.flush()
+
+    def pending_count(self, session_id: str, user_id: str, mode: str) -> int:
+        """Number of rows of a session that are not written yet"""
+        with self._lock:
+            return sum(1 for row in chain(self._writing, self._rows) if row[:3] == (session_id, user_id, mode))
+
+    def rename(self, session_id: str, user_id: str, mode: str, session_name: str):
+        """
+        Apply a session name update to rows that are still buffered. Waits
+        for a running flush, so the rows it writes are covered by an UPDATE
+        issued after this returns.
+        """
+        with self._flush_lock, self._lock:
+            self._rows = [
+                (row[:3] + (session_name,) + row[4:]) if row[:3] == (session_id, user_id, mode) else row
+                for row in self._rows
+            ]
+
+    def discard(self, session_id: str, user_id: str, mode: str) -> int:
+        """Drop the buffered rows of a session, returns how many were dropped"""
+        with self._flush_lock, self._lock:
+            kept = [row for row in self._rows if row[:3] != (session_id, user_id, mode)]
+            dropped = len(self._rows) - len(kept)
+            self._rows = kept
+            return dropped
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def flush(self) -> int:
+        """Write all buffered rows, in a single transaction per shard"""
+        with self._flush_lock:
+            with self._lock:
+                self._writing, self._rows = self._rows, []
+            by_shard = {}
+            for row in self._writing:
+                by_shard.setdefault(self.db_config.for_user(row[1]), []).append(row)
+            written = 0
+            try:
+                for db_config, rows in list(by_shard.items()):
+                    try:
+                        with db_config.get_connection() as conn:
+                            conn.executemany("""
+                                INSERT INTO chat_message
+                                (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            """, rows)
+                    except sqlite3.OperationalError:
+                        raise  # Rows go back to the buffer so retry_on_lock can try again
+                    except sqlite3.Error as e:
+                        raise DatabaseQueryError(f"Unable to group commit messages: {e}")
+                    del by_shard[db_config]
+                    written += len(rows)
+            finally:
+                with self._lock:
+                    # Rows of shards that didn't commit go back first, a retry only writes those
+                    self._rows = [row for rows in by_shard.values() for row in rows] + self._rows
+                    self._writing = []
+            return written
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from src.llms.utils.config import config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_utils import retry_on_lock
+from src.llms.utils.db_exceptions import DatabaseConnectionError, DatabaseQueryError
+from src.utils.metrics import record_cache
+
+
+class IdempotencyKeyMismatch(Exception):
+    """Idempotency key was reused with a different request body"""
+    pass
+
+
+class IdempotencyKeyInFlight(Exception):
+    """Another worker kept running the key's request past the wait timeout"""
+    pass
+
+
+class IdempotencyStore:
+    """
+    Persist idempotency keys in SQLite so retried requests are executed once.
+
+    A key starts as 'pending' while its request runs and becomes 'done' with the
+    stored response afterwards. Pending keys carry a lease so a crashed worker
+    can't block a key forever; finished keys are replayed until their TTL ends.
+    """
+
+    def __init__(self, db_config: DatabaseConfig = None, ttl: int = None, lease: int = None, poll_interval: float = 0.25,
+                 wait_timeout: float = None):
+        self.db_config = db_config or DatabaseConfig()
+        self.ttl = ttl if ttl is not None else config.idempotency_ttl
+        self.lease = lease if lease is not None else config.idempotency_lease
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout if wait_timeout is not None else config.idempotency_wait
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._init_database()
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def _init_database(self):
+        """Create idempotency table"""
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS idempotency_key(
+                        user_id TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        response TEXT,
+                        created_at DATETIME NOT NULL,
+                        expires_at DATETIME NOT NULL,
+                        PRIMARY KEY (user_id, key)
+                    )
+                """)
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_key (expires_at)
+                """)
+        except sqlite3.Error as e:
+            raise DatabaseConnectionError(f"Can't initialize idempotency table: {e}")
+
+    @staticmethod
+    def fingerprint(payload: dict) -> str:
+        """Stable hash of the request body, used to detect key reuse"""
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def begin(self, user_id: str, key: str, fingerprint: str):
+        """
+        Claim a key. Returns ('new', None) when the caller should execute the
+        request, ('pending', None) when another worker is running it, or
+        ('done', response) when a stored response can be replayed.
+        """
+        now = datetime.now()
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("DELETE FROM idempotency_key WHERE expires_at < ?", (now.isoformat(),))
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO idempotency_key
+                    (user_id, key, fingerprint, status, created_at, expires_at)
+                    VALUES (?, ?, ?, 'pending', ?, ?)
+                """, (user_id, key, fingerprint, now.isoformat(), (now + timedelta(seconds=self.lease)).isoformat()))
+                if cursor.rowcount == 1:
+                    return "new", None
+
+                row = conn.execute("""
+                    SELECT fingerprint, status, response FROM idempotency_key
+                    WHERE user_id = ? AND key = ?
+                """, (user_id, key)).fetchone()
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to claim idempotency key: {e}")
+
+        if row is None:
+            # Released between our insert and select, let the caller try again
+            return "pending", None
+        stored_fingerprint, status, response = row
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyKeyMismatch(f"Idempotency key '{key}' was already used with a different request")
+        if status == "done":
+            return "done", json.loads(response)
+        return "pending", None
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def complete(self, user_id: str, key: str, response: dict):
+        """Store the response of a finished request for replay"""
+        expires_at = datetime.now() + timedelta(seconds=self.ttl)
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("""
+                    UPDATE idempotency_key SET status = 'done', response = ?, expires_at = ?
+                    WHERE user_id = ? AND key = ?
+                """, (json.dumps(response), expires_at.isoformat(), user_id, key))
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to store idempotent response: {e}")
+
+    @retry_on_lock(max_retries=3, delay=0.1)
+    def release(self, user_id: str, key: str):
+        """Forget a pending key after its request failed so a retry can run it"""
+        try:
+            with self.db_config.get_connection() as conn:
+                conn.execute("""
+                    DELETE FROM idempotency_key WHERE user_id = ? AND key = ? AND status = 'pending'
+                """, (user_id, key))
+        except sqlite3.Error as e:
+            raise DatabaseQueryError(f"Unable to release idempotency key: {e}")
+
+    async def run_once(self, user_id: str, key: str, fingerprint: str, func: Callable[[], Awaitable[dict]]):
+        """
+        Execute func at most once per (user_id, key).
+
+        Duplicates in this worker attach to the in-flight future, duplicates in
+        other workers poll the table until the response is stored, or its
+        lease expires and they take the key over. Polling gives up with
+        IdempotencyKeyInFlight after wait_timeout seconds.
+        Returns (response, replayed).
+        """
+        slot = (user_id, key)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            inflight = self._inflight.get(slot)
+            if inflight is not None:
+                record_cache("idempotency", hit=True)
+                return await asyncio.shield(inflight), True
+
+            # SQLite calls (and their lock retries) run off the event loop
+            status, response = await asyncio.to_thread(self.begin, user_id, key, fingerprint)
+            if status == "done":
+                record_cache("idempotency", hit=True)
+                return response, True
+            if status == "new":
+                record_cache("idempotency", hit=False)
+                break
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInFlight(f"Request with idempotency key '{key}' is still running")
+            await asyncio.sleep(self.poll_interval)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[slot] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            await asyncio.to_thread(self.release, user_id, key)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved, the original caller re-raises it
+            await asyncio.to_thread(self.release, user_id, key)
+            raise
+        else:
+            await asyncio.to_thread(self.complete, user_id, key, result)
+            future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(slot, None)
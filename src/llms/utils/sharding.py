@@ -0,0 +1,41 @@
+"""
+Consistent hashing of user ids onto SQLite shard files.
+
+Each shard owns VIRTUAL_NODES points on a 64-bit ring and a user belongs to
+the first point clockwise of the hash of its id. Going from N to N + 1
+shards moves about 1 / (N + 1) of the users, see src/llms/reshard.py.
+"""
+import bisect
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Tuple
+
+VIRTUAL_NODES = 64
+# Shard i > 0 numbers its messages from i << SHARD_ID_BITS, so message ids are unique across shards
+SHARD_ID_BITS = 40
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@lru_cache(maxsize=None)
+def _ring(shards: int) -> Tuple[List[int], List[int]]:
+    points = sorted((_hash(f"shard-{shard}-{node}"), shard) for shard in range(shards) for node in range(VIRTUAL_NODES))
+    return [point for point, _ in points], [shard for _, shard in points]
+
+
+def shard_for(user_id: str, shards: int) -> int:
+    """Index of the shard holding user_id out of shards"""
+    if shards <= 1:
+        return 0
+    points, owners = _ring(shards)
+    return owners[bisect.bisect(points, _hash(user_id)) % len(points)]
+
+
+def shard_path(db_path: Path, index: int) -> Path:
+    """Shard 0 is the database file itself, so an unsharded database is shard 0 of 1"""
+    if index == 0:
+        return db_path
+    return db_path.with_name(f"{db_path.stem}.shard{index}{db_path.suffix}")
@@ -1,27 +1,71 @@
-from dotenv import load_dotenv
-from pathlib import Path
-
-# Load .env file with absolute path
-env_path = Path(r"C:\Users\ranau\OneDrive\Desktop\genaipractice\fewshort_consultancy_cahtboat\.env")
-print(f"MAIN DEBUG: Loading .env from: {env_path}")
-print(f"MAIN DEBUG: .env exists: {env_path.exists()}")
-load_dotenv(dotenv_path=env_path)
-
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-import uvicorn
+from fastapi.responses import ORJSONResponse
+import logging
+import os
+import time
+import uuid
 
 from src.api.routes import router
+from src.api.admin import router as admin_router, is_admin
+from src.api.assets import STATIC_DIR, PrecompressedStaticFiles, prepare_static
+from src.api.compression import CompressionMiddleware
+from src.api.dependencies import get_usage_recorder, warmup
+from src.llms.maintenance import get_maintenance_scheduler
+from src.llms.utils.config import config
+from src.utils import metrics
+from src.utils.log import bind, logging_running, setup_logging, stop_logging
+from src.utils.profiling import choose_trigger, profile_trigger_var
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the UI assets and warm up before the server accepts requests, then
+    run database maintenance in the background while the app is up. On
+    shutdown, after in-flight requests finished, buffered usage is written.
+    Logging is set up here unless the entry point (src.server) already did.
+    """
+    owns_logging = not logging_running()
+    if owns_logging:
+        setup_logging()
+    if static_files is not None:
+        directory = await run_in_threadpool(prepare_static, STATIC_DIR)
+        if directory != STATIC_DIR:
+            static_files.serve_from(str(directory))
+    if config.warmup:
+        app.state.warmup = await run_in_threadpool(warmup)
+        logger.info("Warmup finished", extra={"seconds": app.state.warmup})
+    # With several workers only one of them maintains the database, see src/server.py
+    scheduler = get_maintenance_scheduler() if app.state.run_maintenance else None
+    if scheduler is not None:
+        scheduler.start()
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        if scheduler is not None:
+            scheduler.stop()
+        await run_in_threadpool(get_usage_recorder().flush)
+        if owns_logging:
+            stop_logging()
+
 # Initialize FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="Consultancy Chatbot API",
     description="Professional chatbot with consultant and documentation writer modes",
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc"
 )
+app.state.ready = False  # Set once warmup finished, cleared on shutdown
+app.state.draining = False  # Set by src.server when asked to stop, while in-flight requests finish
+app.state.run_maintenance = True
 
 # CORS middleware
 app.add_middleware(
@@ -32,20 +76,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large complete responses (history pages, session lists), streams pass through
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight API requests and their latency per route template"""
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        # Templates like /api/history/{session_id} keep label cardinality bounded
+        path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+
+@app.middleware("http")
+async def select_profiled_requests(request: Request, call_next):
+    """Profile chat turns on X-Profile from an admin, or a PROFILE_SAMPLE_RATE share of them"""
+    # Single turns only, a /api/chat/batch stream would be profiled over its whole lifetime
+    if request.url.path != "/api/chat":
+        return await call_next(request)
+    requested = request.headers.get("X-Profile") == "1" and is_admin(request.headers.get("X-Admin-Token"))
+    token = profile_trigger_var.set(choose_trigger(requested, config.profile_sample_rate))
+    try:
+        return await call_next(request)
+    finally:
+        profile_trigger_var.reset(token)
+
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    """Tag every log record of a request with its X-Request-ID, generating one if missing"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    with bind(request_id=request_id):
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Include API routes
 app.include_router(router, prefix="/api")
-
-# Mount static files (UI)
-static_dir = Path(__file__).parent.parent / "static"
-if static_dir.exists():
-    app.mount("/", StaticFiles(directory=str(static_dir), html=True), name="static")
+app.include_router(admin_router, prefix="/api/admin")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "version": "1.0.0"}
 
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    """Liveness probe, the worker's event loop answers"""
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """Readiness probe, 503 while warming up or draining so no new traffic is routed here"""
+    if app.state.draining:
+        return ORJSONResponse({"status": "draining"}, status_code=503)
+    if not app.state.ready:
+        return ORJSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready", "warmup": getattr(app.state, "warmup", None)}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    content, content_type = metrics.render_latest()
+    return Response(content=content, media_type=content_type)
+
+# Mount static files (UI), after the routes above so "/" doesn't shadow them.
+# Serves static/ as is until the lifespan built the fingerprinted copy, see src/api/assets.py
+static_files = PrecompressedStaticFiles(directory=str(STATIC_DIR), html=True) if STATIC_DIR.exists() else None
+if static_files is not None:
+    app.mount("/", static_files, name="static")
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,206 @@
+"""
+Production entry point: a pre-forking supervisor running uvicorn workers.
+
+The app is imported once in the supervisor and the workers are forked from
+it, so imports and parsed prompts are shared copy-on-write. Each worker then
+warms up its own database connections and model client in the lifespan.
+
+    python -m src.server --workers 4
+
+- Workers share one listening socket and are replaced when they exit, after
+  WORKER_MAX_REQUESTS (plus jitter) requests or a crash.
+- SIGTERM or SIGINT stops the supervisor gracefully: workers fail their
+  readiness probe, finish in-flight requests for up to SHUTDOWN_GRACE_SECONDS,
+  run the lifespan shutdown and exit. SIGHUP replaces the workers one by one.
+- Only the first worker runs the database maintenance scheduler.
+
+Without os.fork (Windows) or with one worker the app is served in-process.
+`python src/main.py` stays the development server with autoreload.
+"""
+import argparse
+import logging
+import os
+import random
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict
+
+from src.llms.utils.config import config
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting sooner than this after its start counts as a crash, respawns are delayed
+_MIN_WORKER_SECONDS = 1.0
+
+
+def _serve(app, sock: socket.socket = None, host: str = None, port: int = None, max_requests: int = 0):
+    import uvicorn
+
+    class WorkerServer(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            app.state.draining = True  # Readiness fails while in-flight requests finish
+            super().handle_exit(sig, frame)
+
+    server = WorkerServer(uvicorn.Config(
+        app, host=host or config.host, port=port or config.port, log_config=None, access_log=False,
+        limit_max_requests=max_requests or None, timeout_graceful_shutdown=config.shutdown_grace_seconds,
+    ))
+    server.run(sockets=[sock] if sock is not None else None)
+
+
+class Supervisor:
+    """Fork, watch and replace worker processes serving app on a shared socket"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, max_requests: int = 0, jitter: int = 0):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.children: Dict[int, tuple] = {}  # pid: (worker index, started)
+        self.stopping = False
+        self.reload = False
+
+    def spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (index, time.monotonic())
+            return pid
+        # Worker process, never returns into the supervisor loop
+        code = 0
+        try:
+            # uvicorn handles SIGTERM and SIGINT while serving and raises them again once it
+            # stopped, ignore them then so the worker still flushes its logs and exits cleanly
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, lambda sig, frame: None)
+            self.app.state.run_maintenance = index == 0
+            max_requests = self.max_requests + random.randint(0, self.jitter) if self.max_requests else 0
+            logger.info("Worker started", extra={"worker": index, "pid": os.getpid(), "max_requests": max_requests})
+            _serve(self.app, self.sock, max_requests=max_requests)
+        except BaseException:
+            logger.exception("Worker failed", extra={"worker": index})
+            code = 1
+        finally:
+            from src.utils import log
+            log._stop_listener()  # os._exit skips atexit, flush the log queue here
+        os._exit(code)
+
+    def _on_signal(self, sig, frame):
+        if sig == signal.SIGHUP:
+            self.reload = True
+        else:
+            self.stopping = True
+
+    def _reap(self):
+        """Collect exited workers, returns their (index, seconds alive)"""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            index, started = self.children.pop(pid, (None, None))
+            if index is None:
+                continue
+            if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+                from prometheus_client import multiprocess
+                multiprocess.mark_process_dead(pid)
+            logger.info("Worker exited", extra={"worker": index, "pid": pid,
+                                                "exit_code": os.waitstatus_to_exitcode(status)})
+            exited.append((index, time.monotonic() - started))
+        return exited
+
+    def _rolling_restart(self):
+        """Replace workers one at a time, the new one is forked before the old one drains"""
+        for pid in list(self.children):
+            if self.stopping:
+                return
+            index, _ = self.children[pid]
+            self.spawn(index)
+            os.kill(pid, signal.SIGTERM)
+
+    def run(self) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self._on_signal)
+        for index in range(self.workers):
+            self.spawn(index)
+        logger.info("Supervisor started", extra={"workers": self.workers, "pid": os.getpid()})
+
+        while not self.stopping:
+            if self.reload:
+                self.reload = False
+                self._rolling_restart()
+            for index, alive in self._reap():
+                if self.stopping:
+                    break
+                if alive < _MIN_WORKER_SECONDS:
+                    time.sleep(_MIN_WORKER_SECONDS)  # Don't fork in a tight loop when workers crash on start
+                if index not in {worker for worker, _ in self.children.values()}:
+                    self.spawn(index)
+            time.sleep(0.2)
+        return self.shutdown()
+
+    def shutdown(self) -> int:
+        """Ask workers to drain, and kill the ones still running after the grace period"""
+        logger.info("Supervisor stopping", extra={"workers": len(self.children)})
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + config.shutdown_grace_seconds + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning("Killing worker after the grace period", extra={"pid": pid})
+            os.kill(pid, signal.SIGKILL)
+        self._reap()
+        return 0
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked uvicorn workers")
+    parser.add_argument("--host", default=config.host)
+    parser.add_argument("--port", type=int, default=config.port)
+    parser.add_argument("--workers", type=int, default=config.web_workers, help="0 starts one per CPU core")
+    parser.add_argument("--max-requests", type=int, default=config.worker_max_requests,
+                        help="Replace a worker after this many requests, 0 never")
+    parser.add_argument("--max-requests-jitter", type=int, default=config.worker_max_requests_jitter)
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    from src.utils.log import setup_logging
+    setup_logging()  # Workers inherit it, see src/utils/log.py
+
+    if workers > 1 and hasattr(os, "fork") and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Must be set before prometheus_client is imported, /metrics then merges the workers
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+    from src.api.dependencies import preload
+    from src.main import app
+    preload()
+
+    if workers == 1 or not hasattr(os, "fork"):
+        _serve(app, host=args.host, port=args.port, max_requests=0)
+        return
+    sock = bind_socket(args.host, args.port)
+    raise SystemExit(Supervisor(app, sock, workers, args.max_requests, args.max_requests_jitter).run())
+
+
+if __name__ == "__main__":
+    main()
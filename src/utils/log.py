@@ -0,0 +1,201 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+# Correlation ids, propagated to worker threads by run_in_threadpool and asyncio.to_thread
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+session_id_var: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+user_id_var: contextvars.ContextVar = contextvars.ContextVar("user_id", default=None)
+
+# Attributes every LogRecord has, anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: QueueListener = None
+_setup_kwargs: dict = None  # Arguments of the last setup_logging, to restart it after a fork
+_restart_after_fork = False
+
+
+@contextmanager
+def bind(request_id: str = None, session_id: str = None, user_id: str = None):
+    """Attach correlation ids to every record logged inside the block"""
+    tokens = []
+    for var, value in ((request_id_var, request_id), (session_id_var, session_id), (user_id_var, user_id)):
+        if value is not None:
+            tokens.append((var, var.set(value)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the correlation ids onto the record while still in the calling thread"""
+
+    def filter(self, record):
+        for name, var in (("request_id", request_id_var), ("session_id", session_id_var), ("user_id", user_id_var)):
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a share of DEBUG records, a record can override it with extra={"sample_rate": ...}"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with correlation ids and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None and key != "sample_rate":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message here so args and tracebacks don't cross threads,
+        # the JSON formatting itself happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room, the listener thread keeps draining so a full queue can't block shutdown
+        self.queue.put(self._sentinel)
+
+
+def parse_levels(text: str) -> Dict[str, str]:
+    """Parse per-module levels like 'src.llms.memory=DEBUG,httpx=WARNING'"""
+    levels = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = None, module_levels: str = None, sample_rate: float = None, queue_size: int = None,
+                  stream=None):
+    """
+    Route all logging through a bounded queue to a JSON stream handler on a
+    background thread. Safe to call more than once, later calls replace the setup.
+    """
+    global _listener, _setup_kwargs
+    from src.llms.utils.config import config
+
+    _setup_kwargs = dict(level=level, module_levels=module_levels, sample_rate=sample_rate, queue_size=queue_size,
+                         stream=stream)
+
+    level = level or config.log_level
+    module_levels = module_levels if module_levels is not None else config.log_levels
+    sample_rate = sample_rate if sample_rate is not None else config.log_debug_sample_rate
+    queue_size = queue_size if queue_size is not None else config.log_queue_size
+
+    _stop_listener()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = _Listener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def logging_running() -> bool:
+    """Whether the listener of setup_logging runs in this process"""
+    return _listener is not None
+
+
+def stop_logging():
+    """Undo setup_logging: flush and stop the listener, and remove the queue handler"""
+    _stop_listener()
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(existing)
+
+
+@atexit.register
+def _stop_listener():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _before_fork():
+    # A forked child gets no listener thread, stop it so no record is half written either
+    global _restart_after_fork
+    _restart_after_fork = _listener is not None
+    _stop_listener()
+
+
+def _after_fork():
+    if _restart_after_fork:
+        setup_logging(**_setup_kwargs)
+
+
+if hasattr(os, "register_at_fork"):  # Not on Windows
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork, after_in_child=_after_fork)
@@ -0,0 +1,98 @@
+import glob
+import os
+from typing import Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Stage latencies range from sub-millisecond DB reads to long docs_writer generations
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Seconds spent in each stage of a chat turn",
+    ["stage", "mode"], buckets=_BUCKETS,
+)
+MODEL_FIRST_TOKEN_SECONDS = Histogram(
+    "chat_model_first_token_seconds", "Seconds from model call to first streamed token",
+    ["mode"], buckets=_BUCKETS,
+)
+TURN_SECONDS = Histogram(
+    "chat_turn_seconds", "Seconds for a whole chat turn",
+    ["mode"], buckets=_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Seconds to serve an API request",
+    ["method", "route", "status"], buckets=_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "API requests currently being served",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+DB_LOCK_RETRIES = Counter(
+    "db_lock_retries_total", "Database operations retried by retry_on_lock",
+    ["operation"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Seconds per SQL statement including row fetching, by calling function",
+    ["caller"], buckets=_BUCKETS,
+)
+DB_QUERY_ROWS = Counter(
+    "db_query_rows_total", "Rows returned or changed by SQL statements, by calling function",
+    ["caller"],
+)
+MAINTENANCE_SECONDS = Histogram(
+    "db_maintenance_seconds", "Seconds per database maintenance task",
+    ["task", "outcome"], buckets=_BUCKETS,
+)
+DB_FILE_BYTES = Gauge(
+    "db_file_bytes", "Size of each shard file and its WAL after the last maintenance run",
+    ["file", "shard"], multiprocess_mode="max",
+)
+DB_FREELIST_PAGES = Gauge(
+    "db_freelist_pages", "Unused pages in each shard file after the last maintenance run",
+    ["shard"], multiprocess_mode="max",
+)
+MODEL_TOKENS = Counter(
+    "model_tokens_total", "Tokens reported by the chat model, by purpose (chat, summary, title) and kind",
+    ["mode", "purpose", "kind"],
+)
+SUMMARIES_GENERATED = Counter(
+    "chat_summaries_generated_total", "Conversation summaries generated",
+    ["mode"],
+)
+
+
+def observe_turn(mode: str, total: float, stages: Dict[str, float], marks: Dict[str, float]):
+    """Record the stage timings of one finished chat turn"""
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.labels(stage, mode).observe(seconds)
+    TURN_SECONDS.labels(mode).observe(total)
+    if "model_first_token" in marks:
+        MODEL_FIRST_TOKEN_SECONDS.labels(mode).observe(marks["model_first_token"])
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def requests_in_flight() -> float:
+    """API requests being served, by every worker in multiprocess mode"""
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        return HTTP_IN_FLIGHT.collect()[0].samples[0].value
+    # Only the livesum gauge files, the files of exited workers are removed by the supervisor
+    files = glob.glob(os.path.join(directory, "gauge_livesum_*.db"))
+    return sum(sample.value for family in multiprocess.MultiProcessCollector.merge(files, accumulate=False)
+               if family.name == "http_requests_in_flight" for sample in family.samples)
+
+
+def render_latest():
+    """Metrics in Prometheus text format, merged across workers in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,126 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from src.utils.log import request_id_var
+
+logger = logging.getLogger(__name__)
+
+# Set per request by the HTTP middleware: None, "header" or "sample"
+profile_trigger_var: contextvars.ContextVar = contextvars.ContextVar("profile_trigger", default=None)
+
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+def choose_trigger(requested: bool, sample_rate: float) -> Optional[str]:
+    """Why this request should be profiled, or None"""
+    if requested:
+        return "header"
+    if sample_rate > 0 and random.random() < sample_rate:
+        return "sample"
+    return None
+
+
+class ProfileStore:
+    """cProfile dumps on disk, one .prof file plus a .json metadata file per profile"""
+
+    def __init__(self, directory: str = None, max_files: int = None):
+        from src.llms.utils.config import config
+
+        self.directory = Path(directory or config.profile_dir)
+        self.max_files = max_files if max_files is not None else config.profile_max_files
+
+    def _path(self, profile_id: str, suffix: str) -> Path:
+        if not _PROFILE_ID.match(profile_id):
+            raise ValueError(f"Invalid profile id: {profile_id}")
+        return self.directory / f"{profile_id}{suffix}"
+
+    def save(self, profiler: cProfile.Profile, metadata: dict) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{metadata.get('request_id') or 'norequest'}-{uuid.uuid4().hex[:8]}"
+        profiler.dump_stats(str(self._path(profile_id, ".prof")))
+        self._path(profile_id, ".json").write_text(json.dumps({"id": profile_id, **metadata}), encoding="utf-8")
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        """Keep only the newest max_files profiles"""
+        files = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in files[self.max_files:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+    def list(self) -> List[dict]:
+        """Metadata of stored profiles, newest first"""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, json.JSONDecodeError):
+                continue
+        return sorted(entries, key=lambda entry: entry.get("created_at", ""), reverse=True)
+
+    def path(self, profile_id: str) -> Path:
+        """Path of a stored .prof file, KeyError when it doesn't exist"""
+        path = self._path(profile_id, ".prof")
+        if not path.exists():
+            raise KeyError(profile_id)
+        return path
+
+    def render(self, profile_id: str, sort: str = "cumulative", limit: int = 50) -> str:
+        """pstats text report of a stored profile"""
+        output = io.StringIO()
+        stats = pstats.Stats(str(self.path(profile_id)), stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+@contextmanager
+def maybe_profile(store: ProfileStore = None, **metadata):
+    """
+    Profile the block with cProfile when the current request asked for it.
+    cProfile only sees the calling thread, so wrap code that runs synchronously.
+    The block runs unprofiled when another profile is already active.
+    """
+    trigger = profile_trigger_var.get()
+    if trigger is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process
+        logger.warning("Profile skipped, another profile is running", extra={"trigger": trigger})
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        metadata.update({
+            "request_id": request_id_var.get(),
+            "trigger": trigger,
+            "created_at": datetime.now().isoformat(),
+            "duration": time.perf_counter() - started,
+        })
+        try:
+            profile_id = (store or ProfileStore()).save(profiler, metadata)
+            logger.info("Profile captured", extra={"profile_id": profile_id, "trigger": trigger})
+        except OSError:
+            logger.exception("Unable to store profile")
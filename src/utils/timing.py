@@ -0,0 +1,30 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+
+class StageTimer:
+    """Accumulate wall-clock seconds per named stage of one chat turn"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}  # Point measurements inside a stage, e.g. time to first token
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def mark(self, name: str, seconds: float):
+        self.marks[name] = seconds
+
+
+def stage(timer: StageTimer, name: str):
+    """timer.stage(name), or a no-op when there is no timer"""
+    return timer.stage(name) if timer is not None else nullcontext()
@@ -1,8 +1,28 @@
-
-
 let sessionId = null;
 let userId = null;
 let chatSessions = [];
+// Keyset cursor of the oldest loaded history message, null when there is nothing older
+let historyBeforeId = null;
+let historyLoading = false;
+const HISTORY_PAGE_SIZE = 50;
+// ETag of the last session list, revalidated with If-None-Match
+let sessionsEtag = null;
+// Loaded history per user, session and mode: {etag, messages (oldest first), beforeId, latestId, messageCount}
+const historyCache = new Map();
+// Messages shown before the server has them (sent, replies, errors) per history key
+const localMessages = new Map();
+let localMessageCount = 0;
+// The welcome message, kept while the chat area is cleared
+let brandingElement = null;
+
+// Newest messages per session kept in IndexedDB across visits
+const HISTORY_CACHE_LIMIT = 1000;
+// Messages rendered beyond the visible ones, and the height assumed until one is measured
+const VIRTUAL_OVERSCAN = 10;
+const ESTIMATED_MESSAGE_HEIGHT = 80;
+// Last time a session's context was pre-warmed, asked again after PREWARM_INTERVAL ms
+const prewarmedAt = new Map();
+const PREWARM_INTERVAL = 30000;
 
 
 
@@ -12,16 +32,12 @@ let chatSessions = [];
 window.onload = async () => {
     // Always ensure userId exists and is persistent
     await initializeUserId();
-    // On first load, fetch chat list and show branding, but do NOT load any chat automatically.
-    await fetchChatSessions();
-    // Show branding message
     const chatArea = document.getElementById('chatArea');
-    const branding = document.getElementById('brandingMessage');
-    if (chatArea && branding) {
-        chatArea.innerHTML = '';
-        branding.style.display = 'flex';
-        chatArea.appendChild(branding);
-    }
+    brandingElement = document.getElementById('brandingMessage');
+    // On first load, show the cached chat list at once, then fetch and show branding,
+    // but do NOT load any chat automatically.
+    await fetchChatSessions();
+    showBranding();
     // Add event listener for mode change
     const modeSelector = document.getElementById('modeSelector');
     if (modeSelector) {
@@ -33,6 +49,20 @@ window.onload = async () => {
             }
         });
     }
+    // Render the messages scrolled into view, and load older ones near the top
+    if (chatArea) {
+        let scheduled = false;
+        chatArea.addEventListener('scroll', () => {
+            if (!scheduled) {
+                scheduled = true;
+                requestAnimationFrame(() => {
+                    scheduled = false;
+                    renderVisibleMessages();
+                });
+            }
+            if (chatArea.scrollTop < 200) loadOlderMessages();
+        });
+    }
     // Always render chat list on load
     renderChatList();
 };
@@ -50,6 +80,74 @@ async function initializeUserId() {
     }
 }
 
+// IndexedDB cache of session lists (by user) and history (by historyKey). Every
+// failure, including browsers without IndexedDB, just means no cache.
+let cacheDbPromise = null;
+
+function openCacheDb() {
+    if (!window.indexedDB) return Promise.resolve(null);
+    if (!cacheDbPromise) {
+        cacheDbPromise = new Promise(resolve => {
+            const request = indexedDB.open('consultancy-chatbot', 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore('sessions');
+                request.result.createObjectStore('history');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => resolve(null);
+            request.onblocked = () => resolve(null);
+        });
+    }
+    return cacheDbPromise;
+}
+
+async function cacheRequest(store, mode, operation) {
+    const db = await openCacheDb();
+    if (!db) return null;
+    return new Promise(resolve => {
+        try {
+            const request = operation(db.transaction(store, mode).objectStore(store));
+            request.onsuccess = () => resolve(request.result === undefined ? null : request.result);
+            request.onerror = () => {
+                console.warn('Cache request failed:', request.error);
+                resolve(null);
+            };
+        } catch (e) {
+            console.warn('Cache unavailable:', e);
+            resolve(null);
+        }
+    });
+}
+
+function cacheGet(store, key) {
+    return cacheRequest(store, 'readonly', objectStore => objectStore.get(key));
+}
+
+function cachePut(store, key, value) {
+    return cacheRequest(store, 'readwrite', objectStore => objectStore.put(value, key));
+}
+
+function cacheDelete(store, key) {
+    return cacheRequest(store, 'readwrite', objectStore => objectStore.delete(key));
+}
+
+// Store the newest HISTORY_CACHE_LIMIT messages of a history entry, without rendered HTML
+function saveHistoryEntry(key, entry) {
+    let messages = entry.messages;
+    let beforeId = entry.beforeId;
+    if (messages.length > HISTORY_CACHE_LIMIT) {
+        messages = messages.slice(-HISTORY_CACHE_LIMIT);
+        beforeId = messages[0].id;
+    }
+    cachePut('history', key, {
+        etag: entry.etag,
+        latestId: entry.latestId,
+        beforeId: beforeId,
+        messageCount: entry.messageCount,
+        messages: messages.map(msg => ({ id: msg.id, role: msg.role, content: msg.content })),
+    });
+}
+
 
 
 
@@ -78,25 +176,10 @@ async function createAndStoreNewSession(switchToNew = true) {
                 name: "New Chat"
             });
 
-            // // Clear chat area and show branding message
-            // const chatArea = document.getElementById('chatArea');
-            // if (chatArea) chatArea.innerHTML = '';
-            // const branding = document.getElementById('brandingMessage');
-            // if (branding) {
-            //     branding.style.display = 'flex';
-            //     chatArea.appendChild(branding);
-            // }
-
             // Render immediately so user sees the new chat
             renderChatList();
             // Show branding until user sends a message
-            const chatArea = document.getElementById('chatArea');
-            if (chatArea) chatArea.innerHTML = '';
-            const branding = document.getElementById('brandingMessage');
-            if (branding) {
-                branding.style.display = 'flex';
-                chatArea.appendChild(branding);
-            }
+            showBranding();
         }
         // Don't fetch all sessions here - just show the immediate update
     } catch (error) {
@@ -112,13 +195,28 @@ async function newSession() {
     // Do not load history until user sends a message
 }
 
-// Fetch chat sessions from backend and render chat list
+// Fetch chat sessions from backend and render chat list. On the first call the
+// list cached by an earlier visit is shown while it is revalidated.
 async function fetchChatSessions() {
     if (!userId) return;
     try {
+        if (sessionsEtag === null) {
+            const cached = await cacheGet('sessions', userId);
+            if (cached && sessionsEtag === null) {
+                chatSessions = cached.sessions;
+                sessionsEtag = cached.etag;
+                renderChatList();
+            }
+        }
         console.log('Fetching sessions for userId:', userId);
-        const response = await fetch(`/api/sessions?user_id=${userId}`);
+        const headers = sessionsEtag ? { 'If-None-Match': sessionsEtag } : {};
+        const response = await fetch(`/api/sessions?user_id=${userId}`, { headers });
+        if (response.status === 304) {
+            renderChatList();
+            return;
+        }
         if (!response.ok) throw new Error('Failed to fetch chat sessions');
+        sessionsEtag = response.headers.get('ETag');
         const data = await response.json();
         console.log('Fetched sessions:', data);
         chatSessions = (data.sessions || []).map(s => ({
@@ -126,10 +224,11 @@ async function fetchChatSessions() {
             name: s.session_name
         }));
         console.log('Processed sessions:', chatSessions);
+        cachePut('sessions', userId, { etag: sessionsEtag, sessions: chatSessions });
         renderChatList();
     } catch (e) {
         console.error('Error fetching chat sessions:', e);
-        // Still render chat list (empty)
+        // Still render chat list (cached or empty)
         renderChatList();
     }
 }
@@ -145,10 +244,24 @@ function renderChatList() {
         const displayName = chat.name || `Chat ${idx + 1}`;
         chatBtn.textContent = displayName + (chat.sessionId === sessionId ? ' (active)' : '');
         chatBtn.onclick = () => switchToChat(idx);
+        chatBtn.onmouseenter = () => prewarmSession(chat.sessionId);
+        chatBtn.onfocus = () => prewarmSession(chat.sessionId);
         chatListDiv.appendChild(chatBtn);
     });
 }
 
+// Ask the server to load a session's next turn context before it is opened, best effort
+function prewarmSession(targetSessionId) {
+    if (!userId || !targetSessionId || targetSessionId === sessionId) return;
+    const now = Date.now();
+    if (now - (prewarmedAt.get(targetSessionId) || 0) < PREWARM_INTERVAL) return;
+    prewarmedAt.set(targetSessionId, now);
+    const mode = document.getElementById('modeSelector').value;
+    fetch(`/api/session/${targetSessionId}/prewarm?user_id=${userId}&mode=${mode}`, {
+        method: 'POST',
+        keepalive: true
+    }).catch(() => {});
+}
 
 // Switch to a selected chat session
 
@@ -159,14 +272,8 @@ function switchToChat(idx) {
     localStorage.setItem('sessionId', sessionId);
     // userId does not change
 
-    // Clear chat area and show branding message until history loads
-    const chatArea = document.getElementById('chatArea');
-    if (chatArea) chatArea.innerHTML = '';
-    const branding = document.getElementById('brandingMessage');
-    if (branding) {
-        branding.style.display = 'flex';
-        chatArea.appendChild(branding);
-    }
+    // Show branding message until history loads, cached history replaces it right away
+    showBranding();
 
     renderChatList();
     // Only load chat history when user clicks a chat
@@ -175,13 +282,221 @@ function switchToChat(idx) {
 
 // No longer needed: session names are fetched with fetchChatSessions
 
-// Load chat history for the current session
+function historyUrl(mode, beforeId, sinceId = null) {
+    let url = `/api/session/${sessionId}/history?user_id=${userId}&mode=${mode}&limit=${HISTORY_PAGE_SIZE}`;
+    if (beforeId !== null) url += `&before_id=${beforeId}`;
+    if (sinceId !== null) url += `&since_id=${sinceId}`;
+    return url;
+}
+
+function historyKey(mode) {
+    return `${userId}:${sessionId}:${mode}`;
+}
+
+function currentHistoryKey() {
+    return historyKey(document.getElementById('modeSelector').value);
+}
+
+// Virtualized message list: only the messages around the viewport are in the
+// DOM, the padding of the list stands in for the others so the scrollbar and
+// scroll position behave as if all of them were rendered.
+const messageList = {
+    element: null,
+    messages: [],  // Oldest first, server messages followed by local ones
+    heights: new Map(),  // Measured height per message key
+    start: 0,
+    end: 0,
+};
+
+function messageKey(msg) {
+    return msg.id !== undefined && msg.id !== null ? `m${msg.id}` : msg.localKey;
+}
+
+function messageHeight(msg) {
+    return messageList.heights.get(messageKey(msg)) || ESTIMATED_MESSAGE_HEIGHT;
+}
+
+// Show the welcome message instead of any messages
+function showBranding() {
+    const chatArea = document.getElementById('chatArea');
+    if (!chatArea) return;
+    chatArea.innerHTML = '';
+    messageList.element = null;
+    messageList.messages = [];
+    if (brandingElement) {
+        brandingElement.style.display = 'flex';
+        chatArea.appendChild(brandingElement);
+    }
+}
+
+// Replace the shown messages and scroll to the newest
+function setMessages(messages) {
+    const chatArea = document.getElementById('chatArea');
+    if (!messageList.element) {
+        chatArea.innerHTML = '';
+        messageList.element = document.createElement('div');
+        messageList.element.className = 'message-list';
+        chatArea.appendChild(messageList.element);
+        if (brandingElement) brandingElement.style.display = 'none';
+    }
+    messageList.messages = messages;
+    renderVisibleMessages(true);
+    chatArea.scrollTop = chatArea.scrollHeight;
+    // Heights measured in the first pass move the bottom, settle on it once more
+    renderVisibleMessages(true);
+    chatArea.scrollTop = chatArea.scrollHeight;
+}
+
+// Render the messages in and near the viewport, then measure them
+function renderVisibleMessages(force = false) {
+    const list = messageList.element;
+    if (!list) return;
+    const chatArea = document.getElementById('chatArea');
+    const messages = messageList.messages;
+    const viewTop = chatArea.scrollTop;
+    const viewBottom = viewTop + chatArea.clientHeight;
+
+    let offset = 0;
+    let start = 0;
+    while (start < messages.length && offset + messageHeight(messages[start]) < viewTop) {
+        offset += messageHeight(messages[start]);
+        start++;
+    }
+    let end = start;
+    while (end < messages.length && offset < viewBottom) {
+        offset += messageHeight(messages[end]);
+        end++;
+    }
+    start = Math.max(0, start - VIRTUAL_OVERSCAN);
+    end = Math.min(messages.length, end + VIRTUAL_OVERSCAN);
+    if (!force && start === messageList.start && end === messageList.end) return;
+    messageList.start = start;
+    messageList.end = end;
+
+    const fragment = document.createDocumentFragment();
+    const rendered = messages.slice(start, end);
+    rendered.forEach(msg => fragment.appendChild(createListElement(msg)));
+    list.replaceChildren(fragment);
+    rendered.forEach((msg, i) => {
+        const element = list.children[i];
+        const margin = parseFloat(getComputedStyle(element).marginBottom) || 0;
+        messageList.heights.set(messageKey(msg), element.getBoundingClientRect().height + margin);
+    });
+    let before = 0;
+    for (let i = 0; i < start; i++) before += messageHeight(messages[i]);
+    let after = 0;
+    for (let i = end; i < messages.length; i++) after += messageHeight(messages[i]);
+    list.style.paddingTop = `${before}px`;
+    list.style.paddingBottom = `${after}px`;
+}
+
+// Element of a list message, the markdown of a message is rendered once
+function createListElement(msg) {
+    const sender = msg.role === 'ai' ? 'bot' : 'user';
+    if (msg.html === undefined) msg.html = renderContent(msg.content, sender);
+    const element = document.createElement('div');
+    element.className = `message ${sender}`;
+    if (msg.pending) element.classList.add('pending');
+    if (msg.failed) element.classList.add('failed');
+    if (msg.fresh) {
+        element.classList.add('fresh');
+        msg.fresh = false;  // Animate only when it first appears
+    }
+    element.innerHTML = `<div class="message-content">${msg.html}</div>`;
+    if (msg.failed && msg.role === 'human') {
+        // Kept until the user retries or dismisses it, deltas from the server don't replace it
+        const actions = document.createElement('div');
+        actions.className = 'message-actions';
+        actions.innerHTML = '<button type="button">Retry</button><button type="button">Dismiss</button>';
+        const [retry, dismiss] = actions.children;
+        retry.onclick = () => retryMessage(msg);
+        dismiss.onclick = () => removeLocalMessage(msg);
+        element.appendChild(actions);
+    }
+    return element;
+}
+
+// Render server messages (oldest first) and local ones, or the branding message when there are none
+function renderHistory(messages, key = currentHistoryKey()) {
+    const all = messages.concat(localMessages.get(key) || []);
+    if (all.length > 0) {
+        setMessages(all);
+    } else {
+        showBranding();
+    }
+}
+
+// Show a message the server doesn't have yet at the end of the current chat
+function addLocalMessage(key, msg) {
+    msg.localKey = `l${++localMessageCount}`;
+    msg.historyKey = key;
+    msg.fresh = true;
+    if (!localMessages.has(key)) localMessages.set(key, []);
+    localMessages.get(key).push(msg);
+    if (key !== currentHistoryKey()) return msg;
+    if (messageList.element) {
+        const chatArea = document.getElementById('chatArea');
+        messageList.messages.push(msg);
+        renderVisibleMessages(true);
+        chatArea.scrollTop = chatArea.scrollHeight;
+    } else {
+        const cached = historyCache.get(key);
+        renderHistory(cached ? cached.messages : [], key);
+    }
+    return msg;
+}
+
+// Drop a failed message and the error reply shown for it
+function removeLocalMessage(msg) {
+    const key = msg.historyKey;
+    const local = localMessages.get(key);
+    if (!local) return;
+    localMessages.set(key, local.filter(other => other !== msg && other !== msg.errorReply));
+    if (key !== currentHistoryKey()) return;
+    const cached = historyCache.get(key);
+    renderHistory(cached ? cached.messages : [], key);
+}
+
+// Send a failed message again, as a new turn
+function retryMessage(msg) {
+    if (msg.historyKey !== currentHistoryKey()) return;
+    removeLocalMessage(msg);
+    document.getElementById('messageInput').value = msg.content;
+    sendMessage();
+}
+
+// Re-render a local message after its state changed
+function updateLocalMessage(msg) {
+    msg.html = undefined;
+    if (messageList.messages.includes(msg)) renderVisibleMessages(true);
+}
+
+// Load chat history for the current session. Cached history (from memory or
+// IndexedDB) is shown at once and then revalidated, so only messages added
+// since are downloaded.
 async function loadChatHistory() {
     if (!sessionId || !userId) return;
     try {
         const modeSelector = document.getElementById('modeSelector');
         let mode = modeSelector.value;
-        const response = await fetch(`/api/session/${sessionId}/history?user_id=${userId}&mode=${mode}`);
+        const key = historyKey(mode);
+        let cached = historyCache.get(key);
+        if (!cached) {
+            cached = await cacheGet('history', key);
+            if (cached) historyCache.set(key, cached);
+        }
+        if (key !== currentHistoryKey()) return;  // Switched chats meanwhile
+        const delta = cached && cached.latestId !== null;
+        if (cached) {
+            renderHistory(cached.messages, key);
+            historyBeforeId = cached.beforeId;
+        } else {
+            historyBeforeId = null;
+        }
+
+        const headers = cached && cached.etag ? { 'If-None-Match': cached.etag } : {};
+        const response = await fetch(historyUrl(mode, null, delta ? cached.latestId : null), { headers });
+        if (response.status === 304) return;
         if (!response.ok) throw new Error('Failed to load chat history');
         const data = await response.json();
 
@@ -193,58 +508,110 @@ async function loadChatHistory() {
             return;
         }
 
-        const chatArea = document.getElementById('chatArea');
-        // Only clear chat area if there are messages
-        if (data.messages && data.messages.length > 0) {
-            chatArea.innerHTML = '';
-            data.messages.forEach(msg => {
-                addMessage(msg.content, msg.role === 'ai' ? 'bot' : 'user');
-            });
-            // Hide branding if any chat
-            const branding = document.getElementById('brandingMessage');
-            if (branding) branding.style.display = 'none';
+        // The ETag covers every mode and the name, so a change elsewhere comes back as no new
+        // messages with the count unchanged. A count that doesn't add up means messages of this
+        // mode were deleted; entries cached before counts were kept skip that check
+        const countKnown = delta && typeof cached.messageCount === 'number';
+        const stale = delta && (data.has_more || data.reset
+            || (countKnown && data.message_count !== cached.messageCount + data.messages.length));
+        if (stale) {
+            // Start over from the newest page
+            historyCache.delete(key);
+            await cacheDelete('history', key);
+            await loadChatHistory();
+            return;
+        }
+
+        const entry = delta ? cached : { messages: [], beforeId: null };
+        if (delta) {
+            // Deltas come oldest first
+            entry.messages.push(...data.messages);
         } else {
-            // Show branding if no chat
-            const branding = document.getElementById('brandingMessage');
-            if (branding) {
-                branding.style.display = 'flex';
-                chatArea.appendChild(branding);
-            }
+            // Pages come newest first
+            entry.messages = data.messages.slice().reverse();
+            entry.beforeId = data.has_more ? data.next_before_id : null;
+        }
+        entry.etag = response.headers.get('ETag');
+        entry.latestId = data.latest_id;
+        entry.messageCount = data.message_count;
+        historyCache.set(key, entry);
+        saveHistoryEntry(key, entry);
+        // The server has the messages shown optimistically now, except a turn still in
+        // flight and failed ones with their error replies, shown until retried or dismissed
+        if (data.messages.length > 0 && localMessages.has(key)) {
+            localMessages.set(key, localMessages.get(key).filter(msg => msg.pending || msg.failed));
         }
+        if (key !== currentHistoryKey()) return;
+        historyBeforeId = entry.beforeId;
+        if (!delta || data.messages.length > 0) renderHistory(entry.messages, key);
     } catch (e) {
         console.error('Error loading chat history:', e);
     }
 }
 
+// Prepend the next older page, keeping the visible messages in place
+async function loadOlderMessages() {
+    if (historyBeforeId === null || historyLoading || !sessionId || !messageList.element) return;
+    historyLoading = true;
+    const requestedKey = currentHistoryKey();
+    try {
+        const mode = document.getElementById('modeSelector').value;
+        const response = await fetch(historyUrl(mode, historyBeforeId));
+        if (!response.ok) throw new Error('Failed to load older messages');
+        const data = await response.json();
+        if (requestedKey !== currentHistoryKey()) return;  // Switched chats meanwhile
+
+        const older = data.messages.slice().reverse();
+        const chatArea = document.getElementById('chatArea');
+        const list = messageList.element;
+        messageList.messages.unshift(...older);
+        // Grow the space above first so the scroll position can move down by what was added,
+        // unmeasured messages count with the estimate until they are rendered
+        const added = older.reduce((height, msg) => height + messageHeight(msg), 0);
+        list.style.paddingTop = `${(parseFloat(list.style.paddingTop) || 0) + added}px`;
+        chatArea.scrollTop += added;
+        renderVisibleMessages(true);
+        historyBeforeId = data.has_more ? data.next_before_id : null;
+        const cached = historyCache.get(requestedKey);
+        if (cached) {
+            cached.messages.unshift(...older);
+            cached.beforeId = historyBeforeId;
+            saveHistoryEntry(requestedKey, cached);
+        }
+    } catch (e) {
+        console.error('Error loading older messages:', e);
+    } finally {
+        historyLoading = false;
+    }
+}
+
 async function sendMessage() {
     const input = document.getElementById('messageInput');
     const message = input.value.trim();
-    
+
     if (!message) return;
-    
-    // Hide branding message on first user message (always)
-    setTimeout(() => {
-        const branding = document.getElementById('brandingMessage');
-        if (branding) branding.style.display = 'none';
-    }, 10);
-    
-    // Add user message to chat
-    addMessage(message, 'user');
+
+    // Show the message right away, marked pending until the server answers
+    const key = currentHistoryKey();
+    const sent = addLocalMessage(key, { role: 'human', content: message, pending: true });
     input.value = '';
-    
+
     // Show typing indicator
     showTypingIndicator();
-    
+
     // Disable send button
     const sendButton = document.getElementById('sendButton');
     sendButton.disabled = true;
-    
+
     try {
         const mode = document.getElementById('modeSelector').value;
-        const response = await fetch('/api/chat', {
+        // Same key on every retry so the server runs this turn only once
+        const idempotencyKey = newIdempotencyKey();
+        const response = await fetchWithRetry('/api/chat', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Idempotency-Key': idempotencyKey,
             },
             body: JSON.stringify({
                 message: message,
@@ -270,30 +637,59 @@ async function sendMessage() {
         if (!sessionId) {
             sessionId = data.session_id;
             userId = data.user_id;
-            // Removed buggy line: document.getElementById('sessionId').textContent = sessionId.substring(0, 8) + '...';
         }
         // Remove typing indicator and add bot response
         hideTypingIndicator();
-        addMessage(data.response, 'bot');
-        // Refresh chat list in case session name was updated (for first messages)
+        sent.pending = false;
+        updateLocalMessage(sent);
+        addLocalMessage(key, { role: 'ai', content: data.response });
+        // Swap the local messages for the stored ones in the background, and refresh
+        // the chat list in case the session name was updated (for first messages)
+        if (key === currentHistoryKey()) loadChatHistory();
         await fetchChatSessions();
     } catch (error) {
         console.error('Error sending message:', error);
         hideTypingIndicator();
-        addMessage('Sorry, there was an error processing your request. Please try again.\nDetails: ' + error, 'bot');
+        sent.pending = false;
+        sent.failed = true;
+        updateLocalMessage(sent);
+        sent.errorReply = addLocalMessage(key, {
+            role: 'ai',
+            content: 'Sorry, there was an error processing your request. Please try again.\nDetails: ' + error,
+            failed: true,
+        });
     } finally {
         sendButton.disabled = false;
         input.focus();
     }
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return 'key-' + Math.random().toString(36).substring(2, 15) + '-' + Date.now();
+}
+
+// Retry on network failures only; the Idempotency-Key makes this safe for POSTs
+async function fetchWithRetry(url, options, retries = 2) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await fetch(url, options);
+        } catch (error) {
+            if (attempt >= retries) throw error;
+            console.warn('Request failed, retrying:', error);
+            await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+        }
+    }
+}
+
 function addMessage(content, sender) {
-    const chatArea = document.getElementById('chatArea');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${sender}`;
-    
-    // Parse markdown for bot messages, escape HTML for user messages
-    let processedContent;
+    addLocalMessage(currentHistoryKey(), { role: sender === 'bot' ? 'ai' : 'human', content: content });
+}
+
+// Parse markdown for bot messages, escape HTML for user messages
+function renderContent(content, sender) {
     if (sender === 'bot') {
         // Configure marked for safe rendering
         marked.setOptions({
@@ -303,16 +699,9 @@ function addMessage(content, sender) {
             smartLists: true,
             smartypants: true
         });
-        processedContent = marked.parse(content);
-    } else {
-        processedContent = escapeHtml(content);
+        return marked.parse(content);
     }
-    
-    messageDiv.innerHTML = `
-        <div class="message-content">${processedContent}</div>
-    `;
-    chatArea.appendChild(messageDiv);
-    chatArea.scrollTop = chatArea.scrollHeight;
+    return escapeHtml(content);
 }
 
 function showTypingIndicator() {
@@ -344,20 +733,32 @@ async function clearHistory() {
         alert('No active session');
         return;
     }
-    
+
     if (!confirm('Are you sure you want to clear chat history?')) {
         return;
     }
-    
+
     try {
         const response = await fetch(`/api/session/${sessionId}/clear?user_id=${userId}`, {
             method: 'DELETE'
         });
-        
+
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        
+        const prefix = `${userId}:${sessionId}:`;
+        for (const key of historyCache.keys()) {
+            if (key.startsWith(prefix)) historyCache.delete(key);
+        }
+        for (const key of localMessages.keys()) {
+            if (key.startsWith(prefix)) localMessages.delete(key);
+        }
+        const modeSelector = document.getElementById('modeSelector');
+        for (const option of modeSelector.options) {
+            cacheDelete('history', prefix + option.value);
+        }
+
+        showBranding();
         const chatArea = document.getElementById('chatArea');
         chatArea.innerHTML = `
             <div class="message bot">
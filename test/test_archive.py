@@ -0,0 +1,122 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.archive import SessionArchive
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+class TestSessionArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "archive.db")
+        self.db_config = DatabaseConfig(self.db_path, plan_check=True)
+        MemoryManagement(db_config=self.db_config)
+        rows = [("old", "u1", "consultant", "human", f"old {i}", days_ago(90 - i)) for i in range(4)]
+        rows += [("old", "u1", "docs_writer", "ai", "old doc " * 50, days_ago(80))]
+        rows += [("mixed", "u1", "consultant", "human", "old mode", days_ago(90)),
+                 ("mixed", "u1", "docs_writer", "human", "active mode", days_ago(1))]
+        with self.db_config.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def hot_rows(self, session_id):
+        with self.db_config.get_connection() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM chat_message WHERE user_id = 'u1' AND session_id = ?
+            """, (session_id,)).fetchone()[0]
+
+    def test_archive_and_rehydrate(self):
+        for codec in ("zstd", "zlib"):
+            with self.subTest(codec=codec):
+                archive = SessionArchive(self.db_config, codec=codec)
+                memory = MemoryManagement("old", "u1", db_config=self.db_config)
+                state = memory.get_session_state()
+                self.assertEqual(archive.archive_idle(idle_days=30), 1)
+                self.assertEqual(archive.archive_idle(idle_days=30), 0)
+                self.assertEqual(self.hot_rows("old"), 0)
+                self.assertEqual(self.hot_rows("mixed"), 2)
+                # Still listed with its counts
+                self.assertEqual(memory._get_message_count(), 4)
+                self.assertEqual(len(memory.list_sessions()), 4)
+                self.assertEqual({mode: value[1:] for mode, value in memory.get_session_state().items()},
+                                 {mode: value[1:] for mode, value in state.items()})
+
+                self.assertTrue(archive.rehydrate("u1", "old"))
+                self.assertFalse(archive.rehydrate("u1", "old"))
+                self.assertEqual(self.hot_rows("old"), 5)
+                restored = memory.get_session_state()
+                self.assertEqual({mode: value[1:] for mode, value in restored.items()},
+                                 {mode: value[1:] for mode, value in state.items()})
+
+    def test_message_written_while_archiving_is_kept(self):
+        archive = SessionArchive(self.db_config)
+        started, release = threading.Event(), threading.Event()
+        original = archive._archive
+
+        def slow_archive(*args):
+            started.set()
+            release.wait(5)
+            original(*args)
+
+        def write():
+            with self.db_config.get_connection() as conn:
+                conn.execute("""
+                    INSERT INTO chat_message (session_id, user_id, mode, role, content) VALUES ('old', 'u1', 'consultant', 'human', 'new')
+                """)
+
+        with patch.object(archive, "_archive", side_effect=slow_archive):
+            archiving = threading.Thread(target=archive.archive_idle, kwargs={"idle_days": 30})
+            archiving.start()
+            self.assertTrue(started.wait(5))
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.2)  # The insert waits for the archive's write transaction
+            release.set()
+            archiving.join()
+            writer.join()
+
+        self.assertTrue(archive.rehydrate("u1", "old"))
+        self.assertEqual(self.hot_rows("old"), 6)
+        self.assertEqual(MemoryManagement("old", "u1", db_config=self.db_config)._get_message_count(), 5)
+
+    def test_history_rehydrates(self):
+        SessionArchive(self.db_config).archive_idle(idle_days=30)
+        client = TestClient(app)
+        with patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path}):
+            data = client.get("/api/session/old/history", params={"user_id": "u1", "mode": "consultant"}).json()
+        self.assertEqual([m["content"] for m in data["messages"]], ["old 3", "old 2", "old 1", "old 0"])
+        self.assertEqual(data["last_mode"], "docs_writer")
+
+    def test_retention_deletes_archived_sessions_in_batches(self):
+        archive = SessionArchive(self.db_config)
+        self.assertEqual(archive.run(idle_days=30, retention_days=0), {"archived": 1, "deleted": 0})
+        self.assertEqual(archive.purge(retention_days=85), 0)
+        self.assertEqual(archive.run(idle_days=30, retention_days=60), {"archived": 0, "deleted": 1})
+        memory = MemoryManagement("old", "u1", db_config=self.db_config)
+        self.assertEqual(memory.get_session_state(), {})
+        self.assertFalse(archive.rehydrate("u1", "old"))
+
+
+if __name__ == '__main__':
+    unittest.main()
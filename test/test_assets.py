@@ -0,0 +1,118 @@
+import gzip
+import os
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src import main
+from src.api import assets
+from src.api.assets import IMMUTABLE, STATIC_DIR, PrecompressedStaticFiles, build_assets
+from src.main import app
+
+
+class TestBuildAssets(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.target = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fingerprints_and_rewrites(self):
+        manifest = build_assets(STATIC_DIR, self.target)
+        self.assertRegex(manifest["/js/app.js"], r"^/js/app\.[0-9a-f]{12}\.js$")
+        index = (self.target / "index.html").read_text(encoding="utf-8")
+        for original, fingerprinted in manifest.items():
+            self.assertNotIn(f'"{original}"', index)
+            self.assertIn(f'"{fingerprinted}"', index)
+            data = (self.target / fingerprinted.lstrip("/")).read_bytes()
+            self.assertEqual(data, (STATIC_DIR / original.lstrip("/")).read_bytes())
+            self.assertEqual(gzip.decompress((self.target / (fingerprinted.lstrip("/") + ".gz")).read_bytes()), data)
+        # External scripts stay as they are
+        self.assertIn("https://cdn.jsdelivr.net/npm/marked/marked.min.js", index)
+
+    def test_rebuild_drops_stale_assets(self):
+        source = self.target / "source"
+        (source / "js").mkdir(parents=True)
+        (source / "index.html").write_text('<script src="js/app.js"></script>')
+        (source / "js" / "app.js").write_text("console.log(1);" * 100)
+        first = build_assets(source, self.target / "build")["/js/app.js"]
+        (source / "js" / "app.js").write_text("console.log(2);" * 100)
+        second = build_assets(source, self.target / "build")["/js/app.js"]
+
+        self.assertNotEqual(first, second)
+        self.assertIn(second, (self.target / "build" / "index.html").read_text())
+        remaining = sorted(path.name for path in (self.target / "build" / "js").iterdir())
+        self.assertEqual(remaining, [second.rsplit("/", 1)[1], second.rsplit("/", 1)[1] + ".gz"])
+
+
+class TestPrecompressedStaticFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(main.static_files.serve_from, str(STATIC_DIR))
+        for patcher in (patch.object(assets.config, "static_build_dir", self.tmpdir.name),
+                        patch.object(main.config, "warmup", False),
+                        patch("src.main.get_maintenance_scheduler", lambda: None),
+                        patch.dict(os.environ, {"CHAT_DB_PATH": os.path.join(self.tmpdir.name, "chat.db")})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_source_served_until_built(self):
+        self.assertEqual(main.static_files.directory, str(STATIC_DIR))
+        self.assertEqual(TestClient(app).get("/js/app.js").content, (STATIC_DIR / "js" / "app.js").read_bytes())
+
+    def test_app_serves_cacheable_assets(self):
+        with TestClient(app) as client:
+            self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, "index.html")))
+            self.serve_cacheable_assets(client)
+
+    def serve_cacheable_assets(self, client):
+        page = client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page.headers["Cache-Control"], "no-cache")
+        self.assertEqual(page.headers["Content-Encoding"], "gzip")
+        script = re.search(r'src="(/js/app\.[0-9a-f]{12}\.js)"', page.text).group(1)
+
+        compressed = client.get(script, headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(compressed.headers["Cache-Control"], IMMUTABLE)
+        self.assertEqual(compressed.headers["Vary"], "Accept-Encoding")
+        self.assertTrue(compressed.headers["Content-Type"].startswith("text/javascript"))
+        plain = client.get(script, headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.content, compressed.content)
+        self.assertEqual(plain.content, (STATIC_DIR / "js" / "app.js").read_bytes())
+
+        # Each variant revalidates against its own ETag
+        revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": page.headers["ETag"]})
+        self.assertEqual(revalidated.status_code, 304)
+        other = client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": page.headers["ETag"]})
+        self.assertEqual(other.status_code, 200)
+
+    def test_brotli_variant_preferred(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (Path(tmpdir) / "app.0123456789ab.js").write_text("plain")
+            (Path(tmpdir) / "app.0123456789ab.js.gz").write_bytes(gzip.compress(b"plain"))
+            (Path(tmpdir) / "app.0123456789ab.js.br").write_bytes(b"brotli bytes")
+            static = FastAPI()
+            static.mount("/", PrecompressedStaticFiles(directory=tmpdir), name="static")
+            response = TestClient(static).get("/app.0123456789ab.js", headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(response.headers["Content-Length"], str(len(b"brotli bytes")))
+
+    def test_build_disabled(self):
+        with patch.object(assets.config, "static_build", False):
+            self.assertEqual(assets.prepare_static(STATIC_DIR), STATIC_DIR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.runnables import RunnableLambda
+from src.llms.batching import SummaryBatcher
+from src.llms.chains.batch import BatchChatRunner
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import DatabaseQueryError
+from src.llms.utils.group_commit import GroupCommitWriter
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "test.db"))
+        MemoryManagement(db_config=self.db_config)  # creates tables
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _row(self, content, session_id="s1"):
+        return (session_id, "u1", "consultant", "New Chat", "human", "{}", content, datetime.now().isoformat())
+
+    def test_rows_are_buffered_until_flush(self):
+        writer = GroupCommitWriter(db_config=self.db_config, max_rows=10)
+        memory = MemoryManagement("s1", "u1", db_config=self.db_config, writer=writer)
+        writer.add(self._row("a"))
+        writer.add(self._row("b"))
+        writer.add(self._row("c", session_id="s2"))
+        self.assertEqual(writer.pending_count("s1", "u1", "consultant"), 2)
+        self.assertEqual(memory._get_message_count(), 2)
+
+        writer.rename("s1", "u1", "consultant", "Renamed")
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer.pending_count("s1", "u1", "consultant"), 0)
+        self.assertEqual(memory._get_message_count(), 2)
+        self.assertEqual(memory.get_session_name("s1", "u1"), "Renamed")
+
+    def test_failed_flush_keeps_rows(self):
+        writer = GroupCommitWriter(db_config=self.db_config, max_rows=10)
+        writer.add(self._row("a"))
+        writer.add(self._row(None))  # content is NOT NULL
+        with self.assertRaises(DatabaseQueryError):
+            writer.flush()
+        self.assertEqual(writer.pending_count("s1", "u1", "consultant"), 2)
+        self.assertEqual(writer.discard("s1", "u1", "consultant"), 2)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_full_buffer_flushes(self):
+        writer = GroupCommitWriter(db_config=self.db_config, max_rows=2)
+        writer.add(self._row("a"))
+        writer.add(self._row("b"))
+        self.assertEqual(writer.pending_count("s1", "u1", "consultant"), 0)
+
+
+class TestSummaryBatcher(unittest.TestCase):
+    def test_concurrent_calls_share_a_batch(self):
+        batch_sizes = []
+
+        class Recorder(RunnableLambda):
+            def batch(self, inputs, config=None, **kwargs):
+                batch_sizes.append(len(inputs))
+                return super().batch(inputs, config=config, **kwargs)
+
+        chain = Recorder(lambda x: f"summary of {x}")
+        batcher = SummaryBatcher(max_batch_size=4, max_wait=1.0)
+        results = {}
+
+        def call(i):
+            results[i] = batcher.submit(chain, i)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(batch_sizes, [4])
+        self.assertEqual(results, {i: f"summary of {i}" for i in range(4)})
+
+
+class TestBatchChatRunner(unittest.TestCase):
+    def test_sessions_keep_order_and_all_items_finish(self):
+        calls = []
+
+        class FakeChain:
+            def __init__(self, session_id, message=None, **kwargs):
+                self.session_id = session_id
+
+            async def ainvoke(self, message):
+                calls.append((self.session_id, message))
+                await asyncio.sleep(0.01)
+                if message == "boom":
+                    raise RuntimeError("model failed")
+                return f"reply to {message}"
+
+        items = [
+            {"message": "s1-first", "session_id": "s1", "user_id": "u1", "mode": "consultant"},
+            {"message": "s2-first", "session_id": "s2", "user_id": "u1", "mode": "consultant"},
+            {"message": "s1-second", "session_id": "s1", "user_id": "u1", "mode": "consultant"},
+            {"message": "boom", "session_id": "s3", "user_id": "u1", "mode": "consultant"},
+        ]
+        runner = BatchChatRunner(model=MagicMock(), max_concurrency=1, writer=MagicMock(pending_count=lambda *a: 0))
+
+        async def collect():
+            return [result async for result in runner.run(items)]
+
+        with patch('src.llms.chains.batch.ChainManagement', FakeChain):
+            results = dict(asyncio.run(collect()))
+
+        self.assertEqual(results[0], "reply to s1-first")
+        self.assertEqual(results[2], "reply to s1-second")
+        self.assertIsInstance(results[3], RuntimeError)
+        s1_calls = [message for session_id, message in calls if session_id == "s1"]
+        self.assertEqual(s1_calls, ["s1-first", "s1-second"])
+        runner.writer.flush.assert_called()
+
+    def test_unsaved_turn_is_reported(self):
+        class WritingChain:
+            def __init__(self, session_id, user_id, mode, writer, **kwargs):
+                self.row = (session_id, user_id, mode, "New Chat", "human", "{}", None, datetime.now().isoformat())
+                self.writer = writer
+
+            async def ainvoke(self, message):
+                self.writer.add(self.row)  # Fails to commit, content is NOT NULL
+                return f"reply to {message}"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_config = DatabaseConfig(os.path.join(tmpdir, "test.db"))
+            MemoryManagement(db_config=db_config)
+            writer = GroupCommitWriter(db_config=db_config)
+            runner = BatchChatRunner(model=MagicMock(), writer=writer)
+            items = [{"message": "hi", "session_id": "s1", "user_id": "u1", "mode": "consultant"}]
+
+            async def collect():
+                return [result async for result in runner.run(items)]
+
+            with patch('src.llms.chains.batch.ChainManagement', WritingChain), self.assertLogs("src.llms.chains.batch"):
+                results = dict(asyncio.run(collect()))
+            self.assertIsInstance(results[0], DatabaseQueryError)
+            self.assertEqual(writer.pending_count("s1", "u1", "consultant"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
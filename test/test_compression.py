@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from src.api import compression
+from src.api.compression import CompressionMiddleware, choose_encoding
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestChooseEncoding(unittest.TestCase):
+    def test_prefers_brotli_when_available(self):
+        with patch.object(compression, "brotli", object()):
+            self.assertEqual(choose_encoding("gzip, deflate, br"), "br")
+            self.assertEqual(choose_encoding("br;q=0, gzip"), "gzip")
+        with patch.object(compression, "brotli", None):
+            self.assertEqual(choose_encoding("gzip, br"), "gzip")
+        self.assertIsNone(choose_encoding("identity"))
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.app = FastAPI()
+        self.app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+        @self.app.get("/text")
+        async def text(size: int):
+            return PlainTextResponse("x" * size)
+
+        @self.app.get("/stream")
+        async def stream():
+            return StreamingResponse((b"y" * 200 for _ in range(3)), media_type="text/plain")
+
+        self.client = TestClient(self.app)
+
+    def test_threshold(self):
+        large = self.client.get("/text", params={"size": 500}, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(large.headers["Content-Encoding"], "gzip")
+        self.assertEqual(large.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(large.text, "x" * 500)
+        small = self.client.get("/text", params={"size": 50}, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", small.headers)
+
+    def test_streams_pass_through(self):
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.text, "y" * 600)
+
+
+class TestHistoryPayload(unittest.TestCase):
+    def test_large_history_is_compressed_and_typed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "history.db")
+            MemoryManagement(db_config=DatabaseConfig(db_path))
+            with DatabaseConfig(db_path).get_connection() as conn:
+                conn.executemany("""
+                    INSERT INTO chat_message (session_id, user_id, mode, role, content, additional_kwargs, timestamp)
+                    VALUES ('s1', 'u1', 'consultant', 'ai', ?, '{"model": "fake"}', ?)
+                """, [(f"answer {i} " * 20, f"2025-01-01T10:{i // 60:02d}:{i % 60:02d}") for i in range(100)])
+
+            client = TestClient(app)
+            params = {"user_id": "u1", "mode": "consultant", "limit": 100}
+            with patch.dict(os.environ, {"CHAT_DB_PATH": db_path}):
+                plain = client.get("/api/session/s1/history", params=params, headers={"Accept-Encoding": "identity"})
+                compressed = client.get("/api/session/s1/history", params=params, headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertLess(int(compressed.headers["Content-Length"]), len(plain.content) / 5)
+        self.assertEqual(compressed.json(), plain.json())
+        message = plain.json()["messages"][0]
+        self.assertEqual(set(message), {"id", "role", "content", "additional_kwargs", "timestamp"})
+        self.assertEqual(message["additional_kwargs"], {"model": "fake"})
+        self.assertIn("ETag", compressed.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
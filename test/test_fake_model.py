@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+from src.llms.fake_model import FakeChatModel, FakeModelError
+from src.bench.stats import percentile, summarize
+
+
+class TestFakeChatModel(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeChatModel(latency=0, tokens_per_second=0, response_tokens=12, seed=7)
+
+    def test_same_prompt_same_response(self):
+        first = self.model.invoke([HumanMessage(content="Which countries fit me?")])
+        second = self.model.invoke([HumanMessage(content="Which countries fit me?")])
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(first.content.split()), 12)
+        self.assertEqual(first.usage_metadata["output_tokens"], 12)
+
+    def test_stream_matches_invoke(self):
+        messages = [HumanMessage(content="Help me write an SOP")]
+        chunks = [chunk for chunk in self.model.stream(messages) if chunk.content]
+        self.assertEqual(len(chunks), 12)
+        self.assertEqual("".join(chunk.content for chunk in chunks), self.model.invoke(messages).content)
+
+    def test_error_rate(self):
+        model = FakeChatModel(latency=0, tokens_per_second=0, error_rate=1.0)
+        with self.assertRaises(FakeModelError):
+            model.invoke("hello")
+
+    def test_failures_per_call(self):
+        def outcomes(seed):
+            model = FakeChatModel(latency=0, tokens_per_second=0, error_rate=0.5, seed=seed)
+            results = []
+            for _ in range(40):
+                try:
+                    model.invoke("same prompt")
+                    results.append(True)
+                except FakeModelError:
+                    results.append(False)
+            return results
+
+        results = outcomes(3)
+        self.assertIn(True, results)
+        self.assertIn(False, results)  # Retries of one prompt can fail and succeed
+        self.assertEqual(results, outcomes(3))
+
+    def test_latency_distributions(self):
+        for distribution in ("fixed", "uniform", "lognormal"):
+            model = FakeChatModel(latency=0.2, latency_distribution=distribution)
+            delay = model._first_token_delay(model._rng([HumanMessage(content="hi")]))
+            self.assertGreater(delay, 0)
+
+
+class TestStats(unittest.TestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertAlmostEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 99), 99.01)
+        self.assertEqual(summarize([])["count"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
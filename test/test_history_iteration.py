@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from itertools import islice
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+
+
+class TestHistoryIteration(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "chat.db"), plan_check=True)
+        self.memory = MemoryManagement("s1", "u1", db_config=self.db_config)
+        with self.db_config.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, session_name, role, additional_kwargs, content, timestamp)
+                VALUES ('s1', 'u1', 'consultant', 'New Chat', ?, '{}', ?, ?)
+            """, [("human" if i % 2 == 0 else "ai", f"m{i}", f"2025-01-{i // 24 + 1:02d}T{i % 24:02d}:00:00")
+                  for i in range(2000)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_repeated_loads_replace_history(self):
+        self.memory.get_messages()
+        self.memory.get_messages()
+        self.assertEqual(len(self.memory.message), 2000)
+        self.assertEqual(self.memory.message[-1].content, "m1999")
+
+    def test_filters_in_sql(self):
+        ai = self.memory.get_messages_by_role("ai", since="2025-01-02T00:00:00", until="2025-01-03T00:00:00")
+        self.assertEqual([message.content for message in ai], [f"m{i}" for i in range(25, 48, 2)])
+        self.assertTrue(all(message.id is not None for message in ai))
+        self.assertEqual(self.memory.get_messages_by_role("system"), [])
+
+    def test_lazy_bounded_iteration(self):
+        first = list(islice(self.memory.iter_messages(read_ahead=10), 3))
+        self.assertEqual([message.content for message in first], ["m0", "m1", "m2"])
+
+        # Counting the whole history holds one read-ahead batch, not the history
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in self.memory.iter_messages(read_ahead=50))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(count, 2000)
+        tracemalloc.start()
+        try:
+            self.memory.get_messages()
+            materialized = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak * 5, materialized)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestHistoryPagination(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "history.db")
+        MemoryManagement(db_config=DatabaseConfig(self.db_path))
+        # Equal timestamps in pairs so the ID tie-breaker is exercised
+        rows = [("s1", "u1", "docs_writer", "human" if i % 2 == 0 else "ai", f"m{i}", f"2025-01-01T10:00:{i // 2:02d}")
+                for i in range(7)]
+        rows.append(("s1", "u1", "consultant", "human", "other mode", "2025-01-01T11:00:00"))
+        with DatabaseConfig(self.db_path).get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_pages_walk_backwards_without_gaps(self):
+        memory = MemoryManagement("s1", "u1", mode="docs_writer", db_config=DatabaseConfig(self.db_path))
+        contents, before_id, pages = [], None, 0
+        while True:
+            page, has_more = memory.get_message_page(before_id=before_id, limit=3)
+            contents.extend(message["content"] for message in page)
+            pages += 1
+            if not has_more:
+                break
+            before_id = page[-1]["id"]
+        self.assertEqual(contents, [f"m{i}" for i in range(6, -1, -1)])
+        self.assertEqual(pages, 3)
+        with self.assertRaises(ValueError):
+            memory.get_message_page(before_id=10_000)
+
+    def test_history_endpoint(self):
+        client = TestClient(app)
+        with patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path}):
+            first = client.get("/api/session/s1/history",
+                               params={"user_id": "u1", "mode": "docs_writer", "limit": 4}).json()
+            self.assertEqual([m["content"] for m in first["messages"]], ["m6", "m5", "m4", "m3"])
+            self.assertTrue(first["has_more"])
+            self.assertEqual(first["last_mode"], "consultant")
+
+            second = client.get("/api/session/s1/history", params={
+                "user_id": "u1", "mode": "docs_writer", "limit": 4, "before_id": first["next_before_id"]}).json()
+            self.assertEqual([m["content"] for m in second["messages"]], ["m2", "m1", "m0"])
+            self.assertFalse(second["has_more"])
+            self.assertIsNone(second["next_before_id"])
+
+            bad = client.get("/api/session/s1/history", params={"user_id": "u1", "before_id": 10_000})
+            self.assertEqual(bad.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
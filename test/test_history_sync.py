@@ -0,0 +1,106 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.sharding import SHARD_ID_BITS
+from src.main import app
+
+
+class TestHistorySync(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "sync.db")
+        MemoryManagement(db_config=DatabaseConfig(self.db_path))
+        self.insert([("s1", "u1", "consultant", "human", f"m{i}", f"2025-01-01T10:00:{i:02d}") for i in range(3)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def insert(self, rows):
+        with DatabaseConfig(self.db_path).get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def test_session_table_follows_messages(self):
+        memory = MemoryManagement("s1", "u1", mode="consultant", db_config=DatabaseConfig(self.db_path))
+        self.assertEqual(memory.get_session_state(), {"consultant": (3, 3, "2025-01-01T10:00:02")})
+        self.insert([("s1", "u1", "docs_writer", "human", "later", "2025-01-01T11:00:00")])
+        self.assertEqual(memory.get_last_mode(), "docs_writer")
+        self.assertEqual(memory.get_sessions_version(), 4)
+
+        memory.update_session_name("Renamed")
+        self.assertEqual(memory.get_session_state()["consultant"][0], 4)  # One bump for three rows
+        with DatabaseConfig(self.db_path).get_connection() as conn:
+            conn.execute("DELETE FROM chat_message WHERE content = 'm2'")
+        self.assertEqual(memory.get_session_state()["consultant"], (5, 2, "2025-01-01T10:00:01"))
+
+        memory.clear()
+        self.assertEqual(memory._get_message_count(), 0)
+        self.assertEqual([s["mode"] for s in memory.list_sessions()], ["docs_writer"])
+
+        # Counts and versions go back when sessions are deleted, the change counter doesn't
+        before = memory.get_sessions_version()
+        with DatabaseConfig(self.db_path).get_connection() as conn:
+            conn.execute("DELETE FROM chat_session WHERE user_id = 'u1'")
+        self.insert([("s2", "u1", "consultant", "human", "again", "2025-01-02T10:00:00")])
+        self.assertGreater(memory.get_sessions_version(), before + 1)
+
+    def test_schema_set_up_once(self):
+        with patch.object(DatabaseConfig, "get_connection", side_effect=AssertionError("connected")):
+            MemoryManagement("s1", "u1", db_config=DatabaseConfig(self.db_path))
+
+    def test_since_id_follows_ids(self):
+        memory = MemoryManagement("s1", "u1", db_config=DatabaseConfig(self.db_path))
+        first_id = memory.get_messages_since(0)[0][0]["id"]
+        self.insert([("s1", "u1", "consultant", "ai", "late clock", "2025-01-01T09:00:00")])
+        messages, _ = memory.get_messages_since(first_id)
+        self.assertEqual([m["content"] for m in messages], ["m1", "m2", "late clock"])
+
+    def test_etags_and_since_id(self):
+        client = TestClient(app)
+        params = {"user_id": "u1", "mode": "consultant"}
+        with patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path}):
+            sessions = client.get("/api/sessions", params={"user_id": "u1"})
+            first = client.get("/api/session/s1/history", params=params)
+            self.assertEqual(first.headers["Cache-Control"], "private, no-cache")
+            latest_id = first.json()["latest_id"]
+
+            unchanged = client.get("/api/session/s1/history", params=params,
+                                   headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual(unchanged.status_code, 304)
+            self.assertEqual(unchanged.headers["ETag"], first.headers["ETag"])
+            self.assertEqual(client.get("/api/sessions", params={"user_id": "u1"},
+                                        headers={"If-None-Match": sessions.headers["ETag"]}).status_code, 304)
+
+            self.insert([("s1", "u1", "consultant", "ai", "new", "2025-01-01T10:00:10")])
+            delta = client.get("/api/session/s1/history", params={**params, "since_id": latest_id},
+                               headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual(delta.status_code, 200)
+            self.assertNotEqual(delta.headers["ETag"], first.headers["ETag"])
+            self.assertEqual([m["content"] for m in delta.json()["messages"]], ["new"])
+            self.assertEqual(delta.json()["latest_id"], delta.json()["messages"][-1]["id"])
+            self.assertEqual((first.json()["message_count"], delta.json()["message_count"]), (3, 4))
+            self.assertEqual(client.get("/api/sessions", params={"user_id": "u1"},
+                                        headers={"If-None-Match": sessions.headers["ETag"]}).status_code, 200)
+
+            # An id from the range of another shard was issued before a reshard moved the user
+            moved = client.get("/api/session/s1/history", params={**params, "since_id": 2 << SHARD_ID_BITS})
+            self.assertEqual((moved.json()["messages"], moved.json()["reset"]), ([], True))
+            self.assertFalse(delta.json()["reset"])
+
+            both = client.get("/api/session/s1/history", params={**params, "since_id": 1, "before_id": 3})
+            self.assertEqual(both.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
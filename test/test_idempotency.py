@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.idempotency import IdempotencyStore, IdempotencyKeyInFlight, IdempotencyKeyMismatch
+from src.main import app
+
+
+class TestIdempotencyStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "test.db"))
+        self.store = IdempotencyStore(db_config=self.db_config, ttl=60, lease=60, poll_interval=0.01)
+        self.fingerprint = self.store.fingerprint({"message": "hello", "mode": "consultant"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_begin_then_replay(self):
+        self.assertEqual(self.store.begin("user", "key-1", self.fingerprint), ("new", None))
+        self.assertEqual(self.store.begin("user", "key-1", self.fingerprint), ("pending", None))
+        self.store.complete("user", "key-1", {"response": "hi"})
+        self.assertEqual(self.store.begin("user", "key-1", self.fingerprint), ("done", {"response": "hi"}))
+
+    def test_keys_are_scoped_per_user(self):
+        self.store.begin("user-a", "key-1", self.fingerprint)
+        self.assertEqual(self.store.begin("user-b", "key-1", self.fingerprint), ("new", None))
+
+    def test_mismatched_body_is_rejected(self):
+        self.store.begin("user", "key-1", self.fingerprint)
+        other = self.store.fingerprint({"message": "bye", "mode": "consultant"})
+        with self.assertRaises(IdempotencyKeyMismatch):
+            self.store.begin("user", "key-1", other)
+
+    def test_expired_lease_can_be_taken_over(self):
+        store = IdempotencyStore(db_config=self.db_config, ttl=60, lease=-1)
+        store.begin("user", "key-1", self.fingerprint)
+        self.assertEqual(store.begin("user", "key-1", self.fingerprint), ("new", None))
+
+    def test_run_once_executes_duplicates_once(self):
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"response": "hi"}
+
+        async def scenario():
+            return await asyncio.gather(*[
+                self.store.run_once("user", "key-1", self.fingerprint, handler) for _ in range(3)
+            ])
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r[0] for r in results], [{"response": "hi"}] * 3)
+        self.assertEqual(sorted(r[1] for r in results), [False, True, True])
+
+    def test_waiting_for_other_worker_times_out(self):
+        async def handler():
+            return {"response": "hi"}
+
+        # Claimed by a worker that never finishes
+        self.store.begin("user", "key-1", self.fingerprint)
+        store = IdempotencyStore(db_config=self.db_config, ttl=60, lease=60, poll_interval=0.01, wait_timeout=0.05)
+        with self.assertRaises(IdempotencyKeyInFlight):
+            asyncio.run(store.run_once("user", "key-1", self.fingerprint, handler))
+
+    def test_failed_run_releases_key(self):
+        async def failing():
+            raise RuntimeError("model down")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.store.run_once("user", "key-1", self.fingerprint, failing))
+        self.assertEqual(self.store.begin("user", "key-1", self.fingerprint), ("new", None))
+
+    def test_keyed_request_needs_user(self):
+        response = TestClient(app).post("/api/chat", json={"message": "hello"}, headers={"Idempotency-Key": "key-1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("user_id", response.json()["detail"])
+
+
+if __name__ == '__main__':
+    unittest.main()
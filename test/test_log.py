@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+import os
+import sys
+import unittest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import log
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = log.setup_logging(level="INFO", module_levels="test.verbose=DEBUG", sample_rate=0.0,
+                                         queue_size=100, stream=self.stream)
+
+    def tearDown(self):
+        log._stop_listener()
+        logging.getLogger().removeHandler(self.handler)
+
+    def _records(self):
+        log._stop_listener()  # Drains the queue
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_records_carry_correlation_ids(self):
+        with log.bind(request_id="req-1", session_id="s1"):
+            logging.getLogger("test.plain").info("turn %s done", 3, extra={"mode": "consultant"})
+        logging.getLogger("test.plain").debug("below the root level")
+        records = self._records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["message"], "turn 3 done")
+        self.assertEqual(records[0]["request_id"], "req-1")
+        self.assertEqual(records[0]["session_id"], "s1")
+        self.assertEqual(records[0]["mode"], "consultant")
+        self.assertNotIn("user_id", records[0])
+
+    def test_debug_sampling_and_module_levels(self):
+        verbose = logging.getLogger("test.verbose")
+        verbose.debug("sampled away")
+        verbose.debug("always kept", extra={"sample_rate": 1.0})
+        self.assertEqual([r["message"] for r in self._records()], ["always kept"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        log._stop_listener()
+        self.handler.queue.maxsize = 1
+        logging.getLogger("test.plain").warning("one")
+        logging.getLogger("test.plain").warning("two")
+        self.assertEqual(self.handler.dropped, 1)
+        self.handler.queue.get_nowait()
+
+
+if __name__ == '__main__':
+    unittest.main()
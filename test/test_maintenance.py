@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.maintenance import DatabaseMaintenance, MaintenanceScheduler, get_maintenance_scheduler, parse_hours
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestDatabaseMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "maintenance.db"))
+        MemoryManagement(db_config=self.db_config)
+        with self.db_config.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content) VALUES (?, 'u1', 'consultant', 'ai', ?)
+            """, [(f"s{i % 20}", "x" * 2000) for i in range(2000)])
+        with self.db_config.get_connection() as conn:
+            conn.execute("DELETE FROM chat_message WHERE user_id = 'u1'")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_run_frees_pages_and_reports(self):
+        # An open connection keeps the WAL file around, the last one to close removes it
+        with self.db_config.get_connection() as conn:
+            conn.execute("INSERT INTO chat_message (session_id, user_id, role, content) VALUES ('s', 'u2', 'ai', 'x')")
+            conn.commit()
+            report = DatabaseMaintenance(self.db_config, task_seconds=5, wal_truncate_mb=0).run()
+        self.assertEqual(report["before"]["journal_mode"], "wal")
+        self.assertEqual(report["before"]["auto_vacuum"], "incremental")
+        self.assertGreater(report["before"]["freelist_pages"], 0)
+        self.assertEqual(report["after"]["freelist_pages"], 0)
+        self.assertEqual({task["outcome"] for task in report["tasks"].values()}, {"ok"})
+        self.assertEqual(report["tasks"]["checkpoint"]["mode"], "TRUNCATE")
+        self.assertEqual(report["after"]["wal_bytes"], 0)
+        self.assertLess(report["after"]["file_bytes"], report["before"]["file_bytes"])
+
+    def test_tasks_are_time_boxed(self):
+        report = DatabaseMaintenance(self.db_config, task_seconds=0).run(["incremental_vacuum"])
+        self.assertEqual(report["tasks"]["incremental_vacuum"]["outcome"], "timeout")
+        self.assertGreater(report["after"]["freelist_pages"], 0)
+
+
+class TestMaintenanceScheduler(unittest.TestCase):
+    def test_parse_hours(self):
+        self.assertIsNone(parse_hours(""))
+        self.assertEqual(parse_hours("1-3,23"), {1, 2, 3, 23})
+        self.assertEqual(parse_hours("22-1"), {22, 23, 0, 1})
+
+    def test_runs_only_when_quiet(self):
+        in_flight = [5]
+        scheduler = MaintenanceScheduler(maintenance=object(), interval=0, hours="2-4", max_in_flight=1,
+                                         in_flight=lambda: in_flight[0])
+        self.assertFalse(scheduler.is_quiet(datetime(2025, 1, 1, 3)))
+        in_flight[0] = 0
+        self.assertTrue(scheduler.is_quiet(datetime(2025, 1, 1, 3)))
+        self.assertFalse(scheduler.is_quiet(datetime(2025, 1, 1, 12)))
+
+    def test_admin_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_config = DatabaseConfig(os.path.join(tmpdir, "admin.db"))
+            MemoryManagement(db_config=db_config)
+            scheduler = MaintenanceScheduler(DatabaseMaintenance(db_config), interval=0)
+            client = TestClient(app)
+            app.dependency_overrides[get_maintenance_scheduler] = lambda: scheduler
+            with patch("src.api.admin.config.admin_token", "secret"):
+                try:
+                    runs = client.post("/api/admin/maintenance/run", headers={"X-Admin-Token": "secret"}).json()
+                    run = runs["reports"][0]
+                    reports = client.get("/api/admin/maintenance", headers={"X-Admin-Token": "secret"}).json()
+                finally:
+                    app.dependency_overrides.clear()
+        self.assertIn("freelist_pages", run["after"])
+        self.assertFalse(reports["running"])
+        self.assertEqual(reports["reports"][0]["started_at"], run["started_at"])
+
+
+if __name__ == '__main__':
+    unittest.main()
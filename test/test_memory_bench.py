@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bench.memory_bench import bench_database, compare, generate_database, parse_size
+
+
+class TestMemoryBench(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size("10k"), 10_000)
+        self.assertEqual(parse_size("1.5m"), 1_500_000)
+        self.assertEqual(parse_size("2500"), 2500)
+
+    def test_generate_and_bench_small_database(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = generate_database(Path(tmpdir) / "bench.db", 500, messages_per_user=50)
+            conn = sqlite3.connect(str(path))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM chat_message").fetchone()[0], 500)
+            conn.close()
+
+            results = bench_database(path, samples=2, repeat=1, seed=0)
+            self.assertIn("get_window_message", results)
+            self.assertEqual(results["_get_message_count"]["warm"]["count"], 2)
+            self.assertTrue(any("chat_session" in plan for plan in results["list_sessions"]["plans"]))
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"1000": {"get_messages": {"cold": {"p50": 0.001}, "warm": {"p50": 0.001}}}}}
+        report = {"results": {"1000": {"get_messages": {"cold": {"p50": 0.001}, "warm": {"p50": 0.002}}}}}
+        self.assertEqual(len(compare(report, baseline, threshold=0.25)), 1)
+        self.assertEqual(compare(report, baseline, threshold=0.25, min_delta=0.01), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from src.llms.chains.chain import ChainManagement
+from src.main import app
+from src.utils import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_observe_turn_records_stages(self):
+        before = REGISTRY.get_sample_value("chat_stage_seconds_count", {"stage": "model", "mode": "consultant"}) or 0
+        metrics.observe_turn("consultant", 0.5, {"context": 0.1, "model": 0.3}, {"model_first_token": 0.05})
+        after = REGISTRY.get_sample_value("chat_stage_seconds_count", {"stage": "model", "mode": "consultant"})
+        self.assertEqual(after, before + 1)
+        self.assertIsNotNone(REGISTRY.get_sample_value("chat_model_first_token_seconds_count", {"mode": "consultant"}))
+
+    def test_empty_model_stream(self):
+        model = MagicMock()
+        model._chat_model.stream.return_value = iter([])
+        chain = ChainManagement(mode="consultant", session_id="s1", user_id="u1", model=model)
+        self.assertEqual(chain._call_model("prompt").content, "")
+        self.assertIn("model", chain.timer.stages)
+
+    def test_metrics_endpoint_labels_route_template(self):
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.dict(os.environ, {"CHAT_DB_PATH": os.path.join(tmpdir, "chat.db")}):
+            client.get("/api/session/some-session/history?user_id=u1")
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('route="/api/session/{session_id}/history"', response.text)
+        self.assertNotIn("some-session", response.text)
+        self.assertEqual(client.get("/health").status_code, 200)
+
+    def test_in_flight_counts_every_worker(self):
+        # Stand-ins for workers serving a request each, their values stay in the multiprocess directory
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tmpdir)
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", "from src.utils import metrics; metrics.HTTP_IN_FLIGHT.inc()"],
+                               cwd=ROOT, env=env, check=True, timeout=60)
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": tmpdir}):
+                self.assertEqual(metrics.requests_in_flight(), 2)
+        self.assertEqual(metrics.requests_in_flight(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
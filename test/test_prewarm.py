@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.chat import ChatMessage
+from src.llms.memory import MemoryManagement, SummaryMemory
+from src.llms.prewarm import ContextCache, TurnContext, get_context_cache, load_context, prewarm, session_state
+from src.llms.records import MessageRecord
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestContextCache(unittest.TestCase):
+    def context(self, version):
+        return TurnContext(version=version, message_count=0, summary={}, window=[], history=[])
+
+    def test_version_ttl_and_eviction(self):
+        cache = ContextCache(ttl=60, max_entries=2)
+        cache.put(("u", "a", "consultant"), self.context(1))
+        self.assertIsNone(cache.take(("u", "a", "consultant"), lambda: 2))  # Written since
+        self.assertIsNone(cache.take(("u", "a", "consultant"), lambda: 1))  # Taken entries are gone
+
+        for session in "abc":
+            cache.put(("u", session, "consultant"), self.context(1))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.peek(("u", "a", "consultant")))
+        self.assertIsNotNone(cache.take(("u", "c", "consultant"), lambda: 1))
+
+        # Bounded by the message characters held as well
+        sized = ContextCache(ttl=60, max_chars=10)
+        sized.put(("u", "a", "consultant"), TurnContext(1, 1, {}, [], [MessageRecord("human", "x" * 6)]))
+        sized.put(("u", "b", "consultant"), TurnContext(1, 1, {}, [], [MessageRecord("human", "y" * 6)]))
+        self.assertIsNone(sized.peek(("u", "a", "consultant")))
+        self.assertIsNotNone(sized.peek(("u", "b", "consultant")))
+
+        expired = ContextCache(ttl=0.01)
+        expired.put(("u", "a", "consultant"), self.context(1))
+        time.sleep(0.02)
+        self.assertIsNone(expired.take(("u", "a", "consultant"), lambda: 1))
+
+
+class TestPrewarm(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "chat.db")
+        self.env = patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path})
+        self.env.start()
+        self.memory = MemoryManagement("s1", "u1", db_config=DatabaseConfig(self.db_path))
+        self.memory.add_message(HumanMessage(content="question"))
+        self.memory.add_message(ChatMessage(role="consultant", content="answer"))
+        self.cache = ContextCache(ttl=60)
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def test_prewarmed_context(self):
+        key = ("u1", "s1", "consultant")
+        self.assertTrue(prewarm("u1", "s1", cache=self.cache))
+        self.assertFalse(prewarm("u1", "s1", cache=self.cache))  # Still current
+        context = self.cache.take(key, lambda: session_state(self.memory)[0])
+        self.assertEqual(context.message_count, 2)
+        self.assertEqual([message.content for message in context.history], ["question", "answer"])
+        self.assertEqual([message.content for message in context.window], ["answer", "question"])
+
+        self.assertTrue(prewarm("u1", "s1", cache=self.cache))
+        self.memory.add_message(HumanMessage(content="another"))
+        self.assertIsNone(self.cache.take(key, lambda: session_state(self.memory)[0]))
+
+    def test_long_history_not_kept(self):
+        memory = SummaryMemory("s1", "u1", db_config=DatabaseConfig(self.db_path))
+        context = load_context(memory, max_history_chars=10)
+        self.assertIsNone(context.history)
+        self.assertEqual((context.message_count, len(context.window)), (2, 2))
+        self.assertIsInstance(load_context(memory).history[0], MessageRecord)
+
+    def test_opening_session_prewarms(self):
+        cache = get_context_cache()
+        client = TestClient(app)
+        with patch.object(cache, "put", wraps=cache.put) as put:
+            response = client.get("/api/session/s1/history", params={"user_id": "u1"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(put.call_count, 1)
+            etag = response.headers["ETag"]
+            self.assertEqual(client.get("/api/session/s1/history", params={"user_id": "u1"},
+                                        headers={"If-None-Match": etag}).status_code, 304)
+            response = client.post("/api/session/s1/prewarm", params={"user_id": "u1"})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(put.call_count, 1)  # Both found the context current
+        context = cache.take(("u1", "s1", "consultant"), lambda: session_state(self.memory)[0])
+        self.assertEqual(context.message_count, 2)
+
+    def test_polls_do_not_prewarm(self):
+        client = TestClient(app)
+        with patch("src.api.routes.prewarm") as prewarm_task:
+            first = client.get("/api/session/s1/history", params={"user_id": "u1"})
+            client.get("/api/session/s1/history", params={"user_id": "u1", "since_id": first.json()["latest_id"]})
+            client.get("/api/session/s1/history", params={"user_id": "u1"},
+                       headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(prewarm_task.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
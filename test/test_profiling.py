@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.api.admin import get_profile_store
+from src.main import app
+from src.utils.log import bind
+from src.utils.profiling import ProfileStore, maybe_profile, profile_trigger_var
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.tmpdir.name, max_files=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _capture(self, trigger="header"):
+        token = profile_trigger_var.set(trigger)
+        try:
+            with bind(request_id="req-1"), maybe_profile(self.store, session_id="s1"):
+                busy()
+        finally:
+            profile_trigger_var.reset(token)
+
+    def test_profile_only_when_triggered(self):
+        with maybe_profile(self.store):
+            busy()
+        self.assertEqual(self.store.list(), [])
+
+        self._capture()
+        profiles = self.store.list()
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0]["id"].startswith("req-1-"))
+        self.assertEqual(profiles[0]["session_id"], "s1")
+        self.assertIn("busy", self.store.render(profiles[0]["id"]))
+
+    def test_concurrent_profile_skipped(self):
+        class ActiveProfile:
+            def enable(self):
+                raise ValueError("Another profiling tool is already active")
+
+        with patch("src.utils.profiling.cProfile.Profile", ActiveProfile), \
+                self.assertLogs("src.utils.profiling", level="WARNING"):
+            self._capture()
+        self.assertEqual(self.store.list(), [])
+
+    def test_old_profiles_pruned_and_ids_validated(self):
+        for _ in range(3):
+            self._capture(trigger="sample")
+        self.assertEqual(len(self.store.list()), 2)
+        with self.assertRaises(ValueError):
+            self.store.path("../chat_history")
+
+    def test_admin_endpoints(self):
+        self._capture()
+        profile_id = self.store.list()[0]["id"]
+        app.dependency_overrides[get_profile_store] = lambda: self.store
+        client = TestClient(app)
+        try:
+            with patch("src.api.admin.config.admin_token", "secret"):
+                self.assertEqual(client.get("/api/admin/profiles").status_code, 403)
+                headers = {"X-Admin-Token": "secret"}
+                listed = client.get("/api/admin/profiles", headers=headers).json()["profiles"]
+                self.assertEqual([p["id"] for p in listed], [profile_id])
+                download = client.get(f"/api/admin/profiles/{profile_id}", headers=headers)
+                self.assertEqual(download.status_code, 200)
+                self.assertGreater(len(download.content), 0)
+                self.assertEqual(client.get("/api/admin/profiles/missing", headers=headers).status_code, 404)
+            self.assertEqual(client.get("/api/admin/profiles").status_code, 404)
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_only_single_turns_sampled(self):
+        client = TestClient(app)
+        with patch("src.main.choose_trigger", return_value=None) as choose:
+            self.assertEqual(client.post("/api/chat/batch", json={}).status_code, 422)
+            self.assertEqual(choose.call_count, 0)
+            self.assertEqual(client.post("/api/chat", json={}).status_code, 422)
+            self.assertEqual(choose.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
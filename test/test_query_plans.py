@@ -0,0 +1,109 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages.chat import ChatMessage
+from src.llms.memory import MemoryManagement, SummaryMemory
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import QueryPlanError
+from src.llms.utils.db_instrumentation import plan_problems
+from src.llms.utils.group_commit import GroupCommitWriter
+from src.llms.utils.idempotency import IdempotencyStore
+
+
+class TestHotQueryPlans(unittest.TestCase):
+    """Every query on the chat path must use an index, without temp B-tree sorts"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "plans.db"), plan_check=True)
+        self.memory = MemoryManagement("s1", "u1", db_config=self.db_config)
+        for index in range(4):
+            self.memory.message.append(ChatMessage(role="human" if index % 2 == 0 else "ai", content=f"m{index}"))
+            self.memory.save_messages()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_memory_queries_use_indexes(self):
+        memory = MemoryManagement("s1", "u1", db_config=self.db_config)
+        memory.get_messages()
+        self.assertEqual(len(memory.message), 4)
+        self.assertEqual(len(memory.get_messages_by_role("ai", since="2000-01-01", until="9999-12-31")), 2)
+        self.assertEqual(len(memory.get_window_message(window=2, order="DESC")), 2)
+        self.assertEqual(len(memory.get_window_message(window=2, order="ASC")), 2)
+        self.assertEqual(memory._get_message_count(), 4)
+        self.assertEqual(memory.get_session_name("s1", "u1"), "New Chat")
+        self.assertEqual(memory.get_last_mode(), "consultant")
+        self.assertEqual(len(memory.list_sessions()), 1)
+        page, has_more = memory.get_message_page(limit=2)
+        self.assertTrue(has_more)
+        memory.get_message_page(before_id=page[-1]["id"], limit=2)
+        self.assertEqual(len(memory.get_messages_since(page[-1]["id"], limit=2)[0]), 1)
+        memory.update_session_name("Renamed")
+        memory.clear()
+
+    def test_summary_writer_and_idempotency_queries_use_indexes(self):
+        with patch.object(SummaryMemory, "_init_summarize_model"):
+            summary = SummaryMemory("s1", "u1", db_config=self.db_config)
+        summary._save_summary_to_storage("summary", 4)
+        self.assertEqual(summary._get_existing_summary()["summary"], "summary")
+
+        writer = GroupCommitWriter(db_config=self.db_config)
+        writer.add(("s1", "u1", "consultant", "New Chat", "human", "{}", "x", "2025-01-01T00:00:00"))
+        self.assertEqual(writer.flush(), 1)
+
+        store = IdempotencyStore(db_config=self.db_config)
+        self.assertEqual(store.begin("u1", "key", "fp")[0], "new")
+        store.complete("u1", "key", {"ok": True})
+        store.release("u1", "key")
+
+    def test_full_scan_is_rejected(self):
+        with self.assertRaises(QueryPlanError):
+            with self.db_config.get_connection() as conn:
+                conn.execute("SELECT COUNT(*) FROM chat_message WHERE content = ?", ("m1",)).fetchone()
+
+    def test_plan_problems(self):
+        self.assertEqual(plan_problems(["SEARCH chat_message USING INDEX idx (session_id=?)"], ""), [])
+        self.assertEqual(len(plan_problems(["SCAN chat_message USING COVERING INDEX idx"], "")), 1)
+        sql = "SELECT 1 ORDER BY 1 -- plan-check: allow temp b-tree"
+        self.assertEqual(plan_problems(["USE TEMP B-TREE FOR ORDER BY"], sql), [])
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def test_slow_statements_logged_with_plan(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_config = DatabaseConfig(os.path.join(tmpdir, "slow.db"))
+            MemoryManagement("s1", "u1", db_config=db_config)
+            with db_config.get_connection() as conn:
+                conn.execute("""
+                    INSERT INTO chat_message (session_id, user_id, mode, role, content) VALUES ('s1', 'u1', 'consultant', 'human', 'hi')
+                """)
+            with patch("src.llms.utils.db_config.config.slow_query_ms", 0), \
+                    self.assertLogs("src.sql.slow", level=logging.WARNING) as logs:
+                MemoryManagement("s1", "u1", db_config=db_config)._get_message_count()
+        record = [r for r in logs.records if "SELECT message_count" in r.sql][0]
+        self.assertEqual(record.caller, "src.llms.memory.MemoryManagement._get_message_count")
+        self.assertEqual(record.rows, 1)
+        self.assertTrue(any("sqlite_autoindex_chat_session_1" in line for line in record.plan))
+
+    def test_dropped_cursors_recorded_and_released(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_config = DatabaseConfig(os.path.join(tmpdir, "cursors.db"))
+            with patch("src.llms.utils.db_config.config.slow_query_ms", 0), \
+                    self.assertLogs("src.sql.slow", level=logging.WARNING) as logs:
+                with db_config.get_connection() as conn:
+                    for _ in range(20):
+                        conn.execute("SELECT 1 UNION ALL SELECT 2").fetchone()
+                    self.assertEqual(len(conn._cursors), 0)
+        self.assertEqual(len(logs.records), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.chat import ChatMessage
+from src.llms.memory import MemoryManagement
+from src.llms.records import MessageRecord, to_messages
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import DatabaseQueryError
+
+
+class TestMessageRecord(unittest.TestCase):
+    def test_kwargs_decoded_lazily(self):
+        record = MessageRecord("ai", "hi", '{"source": "faq"}')
+        self.assertEqual(record.kwargs_json(), '{"source": "faq"}')  # Stored text is passed through
+        self.assertEqual(record.additional_kwargs, {"source": "faq"})
+        self.assertEqual(MessageRecord("ai", "hi", "{}").additional_kwargs, {})
+        with self.assertRaises(DatabaseQueryError):
+            MessageRecord("ai", "hi", "{broken").additional_kwargs
+
+    def test_model_boundary(self):
+        human = HumanMessage(content="question")
+        messages = to_messages([MessageRecord("ai", "answer", '{"a": 1}'), human])
+        self.assertEqual(messages[0], ChatMessage(role="ai", content="answer", additional_kwargs={"a": 1}))
+        self.assertIs(messages[1], human)
+        self.assertFalse(hasattr(MessageRecord("ai", "x"), "__dict__"))
+
+
+class TestMemoryRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_config = DatabaseConfig(os.path.join(self.tmpdir.name, "chat.db"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        memory = MemoryManagement("s1", "u1", db_config=self.db_config)
+        memory.add_message(HumanMessage(content="question"))
+        memory.add_message(ChatMessage(role="consultant", content="answer", additional_kwargs={"lang": "en"}))
+
+        loaded = MemoryManagement("s1", "u1", db_config=self.db_config)
+        loaded.get_messages()
+        self.assertTrue(all(isinstance(message, MessageRecord) for message in loaded.message))
+        self.assertEqual([(message.role, message.content) for message in loaded.message],
+                         [("human", "question"), ("consultant", "answer")])
+        self.assertEqual(loaded.messages[1].additional_kwargs, {"lang": "en"})
+        self.assertIsInstance(loaded.messages[0], ChatMessage)
+
+        window = loaded.get_window_message(window=1, order="DESC")
+        self.assertEqual(window, [MessageRecord("consultant", "answer", {"lang": "en"})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.bench.replay import ReplayRunner, load_conversations
+from src.llms.memory import MemoryManagement
+from src.llms.utils.db_config import DatabaseConfig
+from src.utils.timing import StageTimer
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "source.db")
+        MemoryManagement(db_config=DatabaseConfig(self.path))
+        rows = [
+            ("s1", "u1", "consultant", "human", "hello", "2025-01-01T10:00:00"),
+            ("s1", "u1", "consultant", "ai", "hi", "2025-01-01T10:00:05"),
+            ("s1", "u1", "consultant", "human", "which country?", "2025-01-01T10:01:00"),
+            ("s2", "u2", "docs_writer", "human", "write my sop", "2025-01-01T10:00:30"),
+        ]
+        with DatabaseConfig(self.path).get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_conversations_keeps_user_turns(self):
+        conversations = load_conversations(self.path)
+        self.assertEqual(len(conversations), 2)
+        self.assertEqual([turn["content"] for turn in conversations[0]["turns"]], ["hello", "which country?"])
+        self.assertEqual(len(load_conversations(self.path, mode="docs_writer")), 1)
+
+    def test_schedule_scales_and_caps_gaps(self):
+        conversations = load_conversations(self.path)
+        schedule = ReplayRunner(conversations, model=None, speedup=10)._schedule()
+        self.assertEqual(schedule[0], [0.0, 6.0])
+        self.assertEqual(schedule[1], [3.0])
+
+        capped = ReplayRunner(conversations, model=None, speedup=1, max_gap=5)._schedule()
+        self.assertEqual(capped[0], [0.0, 10.0])
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_stages_accumulate(self):
+        timer = StageTimer()
+        with timer.stage("db"):
+            pass
+        timer.add("db", 1.0)
+        self.assertGreaterEqual(timer.stages["db"], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.memory import MemoryManagement
+from src.llms.search import MessageSearch, build_match, rebuild_search_index
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestMessageSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "search.db")
+        self.db_config = DatabaseConfig(self.db_path, plan_check=True)
+        MemoryManagement(db_config=self.db_config)
+        rows = [
+            ("s1", "u1", "consultant", "human", "How do we price a cloud migration?"),
+            ("s1", "u1", "consultant", "ai", "Migration pricing depends on the migration scope and migration timeline."),
+            ("s2", "u1", "docs_writer", "ai", "Draft a migration runbook <for> the team"),
+            ("s2", "u1", "docs_writer", "human", "Unrelated note about invoices"),
+            ("s3", "u2", "consultant", "human", "Secret migration plans of another user"),
+        ]
+        rows += [("s4", "u1", "consultant", "ai", f"Pagination migration {i}") for i in range(5)]
+        with self.db_config.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, content) VALUES (?, ?, ?, ?, ?)
+            """, rows)
+        self.search = MessageSearch(self.db_config)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_ranked_and_isolated_by_user(self):
+        results, has_more = self.search.search("u1", "migration", limit=50)
+        self.assertFalse(has_more)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results[0]["snippet"].count("<mark>"), 3)
+        self.assertEqual(results, sorted(results, key=lambda r: -r["score"]))
+        self.assertNotIn("s3", {r["session_id"] for r in results})
+
+    def test_snippets_are_escaped(self):
+        results, _ = self.search.search("u1", "runbook")
+        self.assertEqual(len(results), 1)
+        self.assertIn("<mark>runbook</mark> &lt;for&gt;", results[0]["snippet"])
+
+    def test_mode_filter_and_prefix(self):
+        results, _ = self.search.search("u1", "migr", mode="docs_writer")
+        self.assertEqual([r["session_id"] for r in results], ["s2"])
+
+    def test_pagination(self):
+        first, has_more = self.search.search("u1", "pagination", limit=3)
+        second, more_after = self.search.search("u1", "pagination", limit=3, offset=3)
+        self.assertTrue(has_more)
+        self.assertFalse(more_after)
+        self.assertEqual(len({r["id"] for r in first + second}), 5)
+
+    def test_query_syntax_is_harmless(self):
+        # Operators become plain quoted words
+        self.assertEqual(build_match("u1", '"*) OR NOT ('), 'user_id : "u1" AND content : ("OR" "NOT"*)')
+        results, _ = self.search.search("u1", 'user_id : u2 OR migration"')
+        self.assertNotIn("s3", {r["session_id"] for r in results})
+        self.assertEqual(self.search.search("u1", "***"), ([], False))
+
+    def test_index_follows_updates_and_deletes(self):
+        runbook = self.search.search("u1", "runbook")[0][0]["id"]
+        with self.db_config.get_connection() as conn:
+            conn.execute("UPDATE chat_message SET content = 'invoice totals' WHERE ID = ?", (runbook,))
+            conn.execute("DELETE FROM chat_message WHERE user_id = 'u1' AND session_id = 's1'")
+        self.assertEqual(self.search.search("u1", "runbook"), ([], False))
+        # Porter stemming matches "invoices" in the untouched message too
+        self.assertEqual(len(self.search.search("u1", "invoice")[0]), 2)
+        self.assertEqual({r["session_id"] for r in self.search.search("u1", "migration")[0]}, {"s4"})
+
+    def test_rebuild_indexes_older_messages(self):
+        self.assertEqual(rebuild_search_index(self.db_config), 0)  # Triggers indexed every row
+        with self.db_config.get_connection() as conn:
+            conn.execute("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search.search("u1", "runbook")[0], [])
+        self.assertEqual(rebuild_search_index(self.db_config), 1)
+        self.assertEqual(len(self.search.search("u1", "runbook")[0]), 1)
+        self.assertEqual(rebuild_search_index(self.db_config), 0)
+
+    def test_endpoint(self):
+        client = TestClient(app)
+        with patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path}):
+            first = client.get("/api/search", params={"user_id": "u1", "q": "pagination", "limit": 2}).json()
+            last = client.get("/api/search", params={"user_id": "u1", "q": "pagination", "limit": 2,
+                                                     "offset": 4}).json()
+            invalid = client.get("/api/search", params={"user_id": "u1", "q": "x", "mode": "other"})
+        self.assertEqual(len(first["results"]), 2)
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["next_offset"], 2)
+        self.assertEqual(len(last["results"]), 1)
+        self.assertIsNone(last["next_offset"])
+        self.assertEqual(invalid.status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
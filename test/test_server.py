@@ -0,0 +1,86 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.maintenance import MaintenanceScheduler
+from src.main import app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestProbes(unittest.TestCase):
+    def test_readiness_follows_lifespan(self):
+        self.assertEqual(TestClient(app).get("/health/ready").json(), {"status": "starting"})
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.dict(os.environ, {"CHAT_DB_PATH": os.path.join(tmpdir, "probe.db")}), \
+                patch("src.main.config.warmup", False), \
+                patch("src.main.get_maintenance_scheduler", lambda: MaintenanceScheduler(object(), interval=0)):
+            with TestClient(app) as client:
+                self.assertEqual(client.get("/health/live").json()["pid"], os.getpid())
+                self.assertEqual(client.get("/health/ready").status_code, 200)
+                app.state.draining = True
+                try:
+                    self.assertEqual(client.get("/health/ready").json(), {"status": "draining"})
+                finally:
+                    app.state.draining = False
+        self.assertFalse(app.state.ready)
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "pre-forking needs os.fork")
+class TestSupervisor(unittest.TestCase):
+    def get(self, port, path):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=10) as response:
+            return json.loads(response.read())
+
+    def test_workers_recycle_and_drain(self):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = dict(os.environ, CHAT_DB_PATH=os.path.join(tmpdir, "server.db"), WARMUP="false",
+                       MAINTENANCE_INTERVAL="0", MODEL_PROVIDER="fake", ENV_FILE=os.path.join(tmpdir, ".env"),
+                       PROMETHEUS_MULTIPROC_DIR=tmpdir)
+            server = subprocess.Popen(
+                [sys.executable, "-m", "src.server", "--host", "127.0.0.1", "--port", str(port), "--workers", "2",
+                 "--max-requests", "3", "--max-requests-jitter", "0"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = time.monotonic() + 30
+                while True:
+                    try:
+                        self.assertEqual(self.get(port, "/health/ready")["status"], "ready")
+                        break
+                    except OSError:
+                        if time.monotonic() > deadline:
+                            raise
+                        time.sleep(0.1)
+                pids = set()
+                for _ in range(12):
+                    pids.add(self.get(port, "/health/live")["pid"])
+                    time.sleep(0.15)  # Workers notice their request limit on the next server tick
+                # Two workers answering three requests each before being replaced
+                self.assertGreater(len(pids), 2)
+                self.assertNotIn(server.pid, pids)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                self.assertEqual(server.wait(timeout=30), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
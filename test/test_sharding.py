@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from collections import Counter
+from datetime import date
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.llms.archive import SessionArchive
+from src.llms.memory import MemoryManagement, SummaryMemory
+from src.llms.reshard import reshard
+from src.llms.search import MessageSearch
+from src.llms.transfer import export_lines
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.group_commit import GroupCommitWriter
+from src.llms.utils.sharding import SHARD_ID_BITS, shard_for
+from src.main import app
+
+USERS = [f"user-{i}" for i in range(12)]
+
+
+class TestShardRing(unittest.TestCase):
+    def test_balanced_and_stable(self):
+        users = [f"user-{i}" for i in range(4000)]
+        counts = Counter(shard_for(user, 4) for user in users)
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        self.assertGreater(min(counts.values()), 600)
+        # Adding a shard only moves users onto the new one
+        moved = [user for user in users if shard_for(user, 4) != shard_for(user, 5)]
+        self.assertEqual({shard_for(user, 5) for user in moved}, {4})
+        self.assertLess(len(moved), len(users) * 0.3)
+
+
+class TestShardedStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "chat.db")
+        self.db_config = DatabaseConfig(self.db_path, plan_check=True, shards=3)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, db_config, users=USERS):
+        writer = GroupCommitWriter(db_config)
+        for user in users:
+            MemoryManagement(user_id=user, db_config=db_config)  # Schema of the user's shard
+            for i in range(3):
+                writer.add(("s1", user, "consultant", "New Chat", "human", "{}", f"{user} message {i}",
+                            f"{date.today().isoformat()}T10:00:0{i}"))
+        return writer.flush()
+
+    def history(self, db_config, user):
+        messages, _ = MemoryManagement("s1", user, db_config=db_config).get_message_page(limit=10)
+        return [message["content"] for message in messages]
+
+    def test_users_live_on_their_shard(self):
+        self.assertEqual(self.write(self.db_config), 36)
+        for user in USERS:
+            shard = self.db_config.for_user(user)
+            self.assertEqual(shard.shard_index, shard_for(user, 3))
+            with sqlite3.connect(shard.db_path) as conn:
+                rows = conn.execute("SELECT ID, user_id FROM chat_message WHERE user_id = ?", (user,)).fetchall()
+            self.assertEqual(len(rows), 3)
+            # Ids are numbered in the shard's own range
+            self.assertTrue(all(row[0] >> SHARD_ID_BITS == shard.shard_index for row in rows))
+            self.assertEqual(self.history(self.db_config, user)[0], f"{user} message 2")
+
+    def test_shards_write_independently(self):
+        locked = self.db_config.for_user(USERS[0])
+        other = [user for user in USERS if self.db_config.for_user(user) is not locked]
+        MemoryManagement(user_id=USERS[0], db_config=self.db_config)
+        holder = sqlite3.connect(locked.db_path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.perf_counter()
+            self.assertEqual(self.write(self.db_config, other), len(other) * 3)
+            self.assertLess(time.perf_counter() - started, 5)
+        finally:
+            holder.execute("ROLLBACK")
+            holder.close()
+
+    def test_fan_out(self):
+        self.write(self.db_config)
+        exported = b"".join(export_lines(self.db_config))
+        self.assertEqual(exported.count(b"\n"), 36)
+        self.assertEqual(len(self.db_config.fan_out(lambda shard: shard.shard_index)), 3)
+        client = TestClient(app)
+        with patch.dict(os.environ, {"CHAT_DB_PATH": self.db_path}), \
+                patch("src.llms.utils.db_config.config.chat_db_shards", 3), \
+                patch("src.api.admin.config.admin_token", "secret"):
+            shards = client.get("/api/admin/shards", headers={"X-Admin-Token": "secret"}).json()["shards"]
+            results = client.get("/api/search", params={"user_id": USERS[5], "q": "message"}).json()["results"]
+        self.assertEqual([shard["shard"] for shard in shards], [0, 1, 2])
+        self.assertEqual(sum(shard["users"] for shard in shards), len(USERS))
+        self.assertEqual(sum(shard["messages"] for shard in shards), 36)
+        self.assertEqual(len(results), 3)
+
+    def assert_intact(self, db_config, archived=()):
+        for user in USERS:
+            memory = MemoryManagement("s1", user, db_config=db_config)
+            self.assertEqual(len(memory.list_sessions()), 1)
+            if user not in archived:
+                self.assertEqual(self.history(db_config, user), [f"{user} message {i}" for i in (2, 1, 0)])
+        memory = SummaryMemory("s1", USERS[1], db_config=db_config)
+        self.assertEqual(memory._get_existing_summary()["summary"], "summary of s1")
+        self.assertEqual(len(MessageSearch(db_config).search(USERS[3], "message")[0]), 3)
+
+    def test_reshard(self):
+        unsharded = DatabaseConfig(self.db_path, plan_check=True, shards=1)
+        self.write(unsharded)
+        SummaryMemory("s1", USERS[1], db_config=unsharded)._save_summary_to_storage("summary of s1", 3)
+        # An archived session moves as its blob
+        with unsharded.get_connection() as conn:
+            conn.execute("UPDATE chat_session SET updated_at = '2024-01-01' WHERE user_id = ?", (USERS[2],))
+        self.assertEqual(SessionArchive(unsharded).archive_idle(idle_days=30), 1)
+
+        moved = next(user for user in USERS if shard_for(user, 3) != 0)
+        sessions_version = MemoryManagement("s1", moved, db_config=unsharded).get_sessions_version()
+        totals = reshard(self.db_path, 1, 3)
+        three_shards = DatabaseConfig(self.db_path, plan_check=True, shards=3)
+        self.assertGreater(MemoryManagement("s1", moved, db_config=three_shards).get_sessions_version(),
+                           sessions_version)
+        self.assertEqual(totals["users"], sum(1 for user in USERS if shard_for(user, 3) != 0))
+        self.assertEqual(reshard(self.db_path, 1, 3), {"users": 0, "messages": 0})
+        self.assert_intact(three_shards, archived=[USERS[2]])
+
+        reshard(self.db_path, 3, 2)
+        two_shards = DatabaseConfig(self.db_path, plan_check=True, shards=2)
+        self.assertTrue(SessionArchive(two_shards).rehydrate(USERS[2], "s1"))
+        self.assert_intact(two_shards)
+        with sqlite3.connect(os.path.join(self.tmpdir.name, "chat.shard2.db")) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM chat_message").fetchone()[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from src.api.dependencies import warmup
+from src.llms.maintenance import MaintenanceScheduler
+from src.llms.model import get_model_management
+from src.main import app
+from src.utils.log import logging_running
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Provider SDKs, the full langchain package and the server, each loaded on first use only
+HEAVY_MODULES = ("langchain_google_genai", "google.generativeai", "google.ai.generativelanguage", "grpc",
+                 "langchain", "langchain_community", "uvicorn")
+
+_IMPORT_SCRIPT = f"""
+import logging, sys
+import src.main
+from src.utils.log import logging_running
+print(logging_running(), len(logging.getLogger().handlers))
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_is_lazy(self):
+        # A fresh interpreter, the test process has imported everything already
+        env = dict(os.environ, ENV_FILE=os.path.join(ROOT, "missing.env"))
+        result = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT], cwd=ROOT, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.splitlines()[-1:], [""])
+        # Logging is set up by the lifespan or src.server, not by importing the app
+        self.assertEqual(result.stdout.splitlines()[-2], "False 0")
+
+    def test_lifespan_warms_up(self):
+        self.addCleanup(get_model_management.cache_clear)
+        get_model_management.cache_clear()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "warm.db")
+            with patch.dict(os.environ, {"CHAT_DB_PATH": db_path}), \
+                    patch("src.llms.model.config.model_provider", "fake"), \
+                    patch("src.main.get_maintenance_scheduler", lambda: MaintenanceScheduler(object(), interval=0)):
+                with TestClient(app) as client:
+                    self.assertEqual(client.get("/health").status_code, 200)
+                    self.assertTrue(logging_running())
+                self.assertFalse(logging_running())
+            self.assertEqual(set(app.state.warmup), {"databases", "prompts", "model"})
+            self.assertTrue(os.path.exists(db_path))
+            self.assertEqual(get_model_management.cache_info().currsize, 1)
+
+    def test_failing_step_does_not_stop_warmup(self):
+        with patch("src.api.dependencies._warm_databases", side_effect=RuntimeError("disk")), \
+                patch("src.api.dependencies.get_model_management"):
+            with self.assertLogs("src.api.dependencies", "ERROR"):
+                seconds = warmup()
+        self.assertEqual(set(seconds), {"databases", "prompts", "model"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import gzip
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+import zstandard
+from fastapi.testclient import TestClient
+from src.llms.memory import MemoryManagement
+from src.llms.transfer import compress_chunks, export_lines, import_lines, open_input
+from src.llms.utils.db_config import DatabaseConfig
+from src.main import app
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = DatabaseConfig(os.path.join(self.tmpdir.name, "source.db"), plan_check=True)
+        MemoryManagement(db_config=self.source)
+        rows = [(f"s{i % 3}", f"u{i % 2}", "consultant", "human" if i % 2 else "ai", '{"k": 1}', f"message {i}",
+                 f"2025-01-01T10:00:{i:02d}") for i in range(25)]
+        with self.source.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO chat_message (session_id, user_id, mode, role, additional_kwargs, content, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def roundtrip(self, compression):
+        data = b"".join(compress_chunks(export_lines(self.source, batch_rows=4), compression))
+        target = DatabaseConfig(os.path.join(self.tmpdir.name, f"{compression}.db"))
+        inserted = import_lines(open_input(io.BytesIO(data)), target, batch_rows=10, offline=True)
+        return data, target, inserted
+
+    def test_roundtrip_keeps_ids_and_indexes(self):
+        for compression in ("none", "gzip", "zstd"):
+            with self.subTest(compression=compression):
+                data, target, inserted = self.roundtrip(compression)
+                self.assertEqual(inserted, 25)
+                conn, source = sqlite3.connect(str(target.db_path)), sqlite3.connect(str(self.source.db_path))
+                query = "SELECT * FROM chat_message ORDER BY ID"
+                self.assertEqual(conn.execute(query).fetchall(), source.execute(query).fetchall())
+                index = conn.execute("PRAGMA index_list(chat_message)").fetchall()
+                self.assertIn("idx_user_session_mode_time", [row[1] for row in index])
+                conn.close()
+                source.close()
+
+                # Importing again skips existing IDs, chat_session counts stay right.
+                # Online imports keep the indexes while they run
+                def lines():
+                    for line in open_input(io.BytesIO(data)):
+                        with target.get_connection() as check:
+                            indexes = [row[1] for row in check.execute("PRAGMA index_list(chat_message)")]
+                        self.assertIn("idx_user_session_mode_time", indexes)
+                        yield line
+
+                self.assertEqual(import_lines(lines(), target, batch_rows=10), 0)
+                memory = MemoryManagement("s0", "u0", db_config=target)
+                self.assertEqual(memory._get_message_count(), 5)
+
+        self.assertEqual(gzip.decompress(b"".join(compress_chunks([b"x\n"], "gzip"))), b"x\n")
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(
+            b"".join(compress_chunks([b"x\n"], "zstd"))), b"x\n")
+
+    def test_scoped_exports_use_indexes(self):
+        user = [orjson.loads(line) for line in b"".join(export_lines(self.source, user_id="u1")).splitlines()]
+        self.assertEqual(len(user), 12)
+        self.assertEqual({record["user_id"] for record in user}, {"u1"})
+        session = b"".join(export_lines(self.source, user_id="u1", session_id="s1")).splitlines()
+        self.assertEqual(len(session), 4)
+        with self.assertRaises(ValueError):
+            export_lines(self.source, session_id="s1")
+
+    def test_invalid_line(self):
+        target = DatabaseConfig(os.path.join(self.tmpdir.name, "invalid.db"))
+        with self.assertRaises(ValueError):
+            import_lines([b"{\"id\": 1}\n", b"not json\n"], target)
+
+    def test_admin_export(self):
+        client = TestClient(app)
+        with patch.dict(os.environ, {"CHAT_DB_PATH": str(self.source.db_path)}), \
+                patch("src.api.admin.config.admin_token", "secret"):
+            response = client.get("/api/admin/export", params={"user_id": "u0", "compression": "zstd"},
+                                  headers={"X-Admin-Token": "secret"})
+            bad = client.get("/api/admin/export", params={"session_id": "s1"}, headers={"X-Admin-Token": "secret"})
+            forbidden = client.get("/api/admin/export", headers={"X-Admin-Token": "wrong"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "application/zstd")
+        lines = open_input(io.BytesIO(response.content)).read().splitlines()
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(forbidden.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
+from src.api.dependencies import get_usage_recorder
+from src.llms.batching import SummaryBatcher
+from src.llms.fake_model import FakeChatModel
+from src.llms.usage import UsageRecorder, usage_config
+from src.llms.utils.db_config import DatabaseConfig
+from src.llms.utils.db_exceptions import DatabaseQueryError
+from src.main import app
+
+
+class TestUsageAccounting(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.recorder = UsageRecorder(DatabaseConfig(os.path.join(self.tmpdir.name, "usage.db")), max_keys=10, max_wait=60)
+        self.model = FakeChatModel(latency=0, tokens_per_second=0, response_tokens=5)
+
+    def tearDown(self):
+        self.recorder.flush()
+        self.tmpdir.cleanup()
+
+    def test_invoke_and_stream_usage_aggregated_per_day(self):
+        messages = [HumanMessage(content="one two three")]
+        self.model.invoke(messages, config=usage_config("u1", "s1", "consultant", "chat", self.recorder))
+        list(self.model.stream(messages, config=usage_config("u1", "s1", "consultant", "chat", self.recorder)))
+        self.model.invoke(messages, config=usage_config("u1", "s1", "consultant", "title", self.recorder))
+
+        rows = self.recorder.query(user_id="u1", group_by=["mode", "day", "purpose"])
+        chat = [row for row in rows if row["purpose"] == "chat"][0]
+        self.assertEqual(chat["day"], date.today().isoformat())
+        self.assertEqual(chat["calls"], 2)
+        self.assertEqual(chat["input_tokens"], 6)
+        self.assertEqual(chat["output_tokens"], 10)
+        self.assertGreater(chat["cost_usd"], 0)
+        self.assertEqual(self.recorder.query(user_id="u1", group_by=[])[0]["calls"], 3)
+
+    def test_buckets_are_batched_and_upserted(self):
+        key = ("u1", "s1", "docs_writer", "2025-01-01", "chat")
+        self.recorder.add(key, 10, 2, 12, 0.5)
+        self.recorder.add(key, 10, 2, 12, 0.5)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.recorder.add(key, 10, 2, 12, 0.5)
+        rows = self.recorder.query(mode="docs_writer", since="2025-01-01", until="2025-01-01")
+        self.assertEqual(rows[0]["calls"], 3)
+        self.assertEqual(rows[0]["input_tokens"], 30)
+        with self.assertRaises(ValueError):
+            self.recorder.query(group_by=["content"])
+
+    def test_batched_summaries_attributed_per_session(self):
+        batcher = SummaryBatcher(max_batch_size=2, max_wait=5)
+        configs = [usage_config(user, "s", "consultant", "summary", self.recorder) for user in ("u1", "u2")]
+        threads = [threading.Thread(target=batcher.submit, args=(self.model, "hello", config)) for config in configs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        users = {row["user_id"]: row["calls"] for row in self.recorder.query(group_by=["user_id"])}
+        self.assertEqual(users, {"u1": 1, "u2": 1})
+
+    def test_usage_endpoint(self):
+        self.recorder.add(("u1", "s1", "consultant", "2025-01-01", "chat"), 1, 1, 2, 0.1)
+        app.dependency_overrides[get_usage_recorder] = lambda: self.recorder
+        try:
+            client = TestClient(app)
+            with patch("src.api.admin.config.admin_token", "secret"):
+                self.assertEqual(client.get("/api/usage", params={"user_id": "u1"}).status_code, 403)
+                client.headers["X-Admin-Token"] = "secret"
+                response = client.get("/api/usage", params={"user_id": "u1", "group_by": "session_id"})
+                self.assertEqual(response.json()["usage"][0]["session_id"], "s1")
+                self.assertEqual(client.get("/api/usage", params={"user_id": "u1", "group_by": "x"}).status_code, 422)
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_failed_background_flush_is_retried(self):
+        recorder = UsageRecorder(self.recorder.db_config, max_keys=10, max_wait=0.05)
+        with patch.object(recorder, "flush", side_effect=[DatabaseQueryError("locked"), 1]) as flush, \
+                self.assertLogs("src.llms.usage"):
+            recorder.add(("u1", "s1", "consultant", "2025-01-01", "chat"), 1, 1, 2, 0.1)
+            deadline = time.monotonic() + 5
+            while flush.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(flush.call_count, 2)
+
+    def test_full_buckets_flush_off_the_caller(self):
+        recorder = UsageRecorder(self.recorder.db_config, max_keys=2, max_wait=60)
+        threads = []
+        with patch.object(recorder, "flush", side_effect=lambda: threads.append(threading.get_ident())):
+            recorder.add(("u1", "s1", "consultant", "2025-01-01", "chat"), 1, 1, 2, 0.1)
+            recorder.add(("u1", "s2", "consultant", "2025-01-01", "chat"), 1, 1, 2, 0.1)
+            deadline = time.monotonic() + 5
+            while not threads and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_failed_flush_keeps_buckets(self):
+        key = ("u1", "s1", "consultant", "2025-01-01", "chat")
+        self.recorder.add(key, 1, 1, 2, 0.1)
+        with patch.object(self.recorder.db_config, "get_connection", side_effect=sqlite3.DatabaseError("corrupt")):
+            with self.assertRaises(DatabaseQueryError):
+                self.recorder.flush()
+        self.recorder.add(key, 1, 1, 2, 0.1)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.recorder.query(user_id="u1", group_by=[])[0]["calls"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()